@@ -1,29 +1,52 @@
+import argparse
 import json
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
-import requests
+from PIL import Image, ImageDraw, ImageFilter
 from io import BytesIO
 import math
+import os
+import sys
+
+# Shared render helpers live alongside the Skia generator.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "skia_poster_generator"))
+from compositing import apply_opacity, paste_layer
+from culling import cull_with_fetched_covers, log_cull_report
+from display_list import CompiledTemplate, compile_template, node_image_urls
+from fitted_images import FittedImage, fitted_boxes_cached, fitted_image
+from geometry import resolve_render_scale, scaled_size
+from image_encoding import DEFAULT_QUALITY, OUTPUT_FORMATS, encode_pil_image, format_from_path, write_encoded
+from image_fetch import fetch_digests
+from layers import language_output_path, parse_languages, split_static_prefix
+from output_cache import get_output_cache
+from prefetch import prefetch_images, resolve_image
+from reduced_decode import REDUCING_GAP, image_decode_hints, reduction_factor
+from static_layers import DEFAULT_STATIC_SPLIT, DYNAMIC_TAGS, STATIC_LAYERS, STATIC_SPLITS, assets_complete, split_static_layers, static_layer_key
+from text_fit import TEXT_MEASURER
+from tracing import ELEMENT, add_trace_arguments, configure_tracing_from_args, element_span, span, trace_event
 
 # --- Helper Functions ---
 
-def hex_to_rgba(hex_color, opacity=1.0):
-    """Converts hex color to RGBA tuple."""
-    hex_color = hex_color.lstrip('#')
-    if len(hex_color) == 3: # Expand shorthand hex (e.g., #03F to #0033FF)
-        hex_color = "".join([c*2 for c in hex_color])
-    
-    if len(hex_color) == 6: # RGB
-        r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-        return (r, g, b, int(opacity * 255))
-    elif len(hex_color) == 8: # RGBA
-        r, g, b, a_hex = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4, 6))
-        # Modulate the hex alpha with the style's opacity
-        return (r, g, b, int((a_hex / 255.0) * opacity * 255))
-    raise ValueError(f"Invalid hex color: {hex_color}")
+PIL_RESAMPLE = 'lanczos' # apply_box_fit's filter, part of the fitted image cache key
+
+def decode_pil_image(data, hint=None):
+    """Decodes encoded image bytes into an RGBA Pillow image.
+
+    With a reduced_decode.DecodeHint, images much larger than they are drawn
+    are decoded at reduced size (JPEG draft mode, then an integer reduce()).
+    """
+    img = Image.open(BytesIO(data))
+    decode_size = hint.decode_size(*img.size) if hint is not None else None
+    if decode_size is not None:
+        img.draft(None, decode_size) # DCT scaling; a no-op for formats other than JPEG
+    img = img.convert("RGBA")
+    factor = reduction_factor(*img.size, decode_size)
+    return img.reduce(factor) if factor > 1 else img
 
 
 def apply_box_fit(img, target_width, target_height, box_fit_str):
-    """Applies BoxFit logic to an image. Ensures target dimensions are positive."""
+    """Applies BoxFit logic to an image. Ensures target dimensions are positive.
+
+    Large reductions shrink by an integer factor first (reducing_gap) and only run LANCZOS on the remainder.
+    """
     target_width = max(1, int(target_width))
     target_height = max(1, int(target_height))
     
@@ -35,7 +58,7 @@ def apply_box_fit(img, target_width, target_height, box_fit_str):
     img_aspect = img_width / img_height
 
     if box_fit_str == "BoxFit.fill":
-        return img.resize((target_width, target_height), Image.Resampling.LANCZOS)
+        return img.resize((target_width, target_height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
     elif box_fit_str == "BoxFit.contain":
         if img_aspect > target_aspect: # Image is wider than target
             new_width = target_width
@@ -46,7 +69,7 @@ def apply_box_fit(img, target_width, target_height, box_fit_str):
         
         new_width = max(1, new_width)
         new_height = max(1, new_height)
-        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
         
         new_img = Image.new("RGBA", (target_width, target_height), (0,0,0,0))
         paste_x = (target_width - new_width) // 2
@@ -57,24 +80,24 @@ def apply_box_fit(img, target_width, target_height, box_fit_str):
         if img_aspect > target_aspect: # Image is wider, scale by height and crop width
             new_height = target_height
             new_width = int(new_height * img_aspect)
-            img = img.resize((max(1,new_width), max(1,new_height)), Image.Resampling.LANCZOS)
+            img = img.resize((max(1,new_width), max(1,new_height)), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
             crop_x = (new_width - target_width) // 2
             img = img.crop((crop_x, 0, crop_x + target_width, new_height))
         else: # Image is taller or same aspect, scale by width and crop height
             new_width = target_width
             new_height = int(new_width / img_aspect)
-            img = img.resize((max(1,new_width), max(1,new_height)), Image.Resampling.LANCZOS)
+            img = img.resize((max(1,new_width), max(1,new_height)), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
             crop_y = (new_height - target_height) // 2
             img = img.crop((0, crop_y, new_width, crop_y + target_height))
-        return img.resize((target_width, target_height), Image.Resampling.LANCZOS) # Ensure final size
+        return img.resize((target_width, target_height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP) # Ensure final size
     elif box_fit_str == "BoxFit.fitWidth":
         new_width = target_width
         new_height = int(new_width / img_aspect) if img_aspect > 0 else 0
-        return img.resize((max(1,new_width), max(1,new_height)), Image.Resampling.LANCZOS)
+        return img.resize((max(1,new_width), max(1,new_height)), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
     elif box_fit_str == "BoxFit.fitHeight":
         new_height = target_height
         new_width = int(new_height * img_aspect) if target_height > 0 else 0
-        return img.resize((max(1,new_width), max(1,new_height)), Image.Resampling.LANCZOS)
+        return img.resize((max(1,new_width), max(1,new_height)), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
     elif box_fit_str == "BoxFit.scaleDown":
         if img_width > target_width or img_height > target_height:
             return apply_box_fit(img, target_width, target_height, "BoxFit.contain")
@@ -92,116 +115,115 @@ def apply_box_fit(img, target_width, target_height, box_fit_str):
         return new_img
 
 
-def render_template_element(image_canvas, element_data, canvas_width, canvas_height, current_language, default_language_code, font_asset_path):
-    """Renders a single TemplateElement onto the image_canvas."""
-    box = element_data['box']
-    style = element_data['style']
-    content = element_data['content']
-    el_type = element_data['type']
+def fitted_pil_image(assets, url, box_width, box_height, fit):
+    """apply_box_fit of the image at url into the (unrounded) output-pixel box, cached in fitted_images by content and box."""
+    def fit_image():
+        image = resolve_image(assets, url, decode_pil_image)
+        fitted = apply_box_fit(image, box_width, box_height, fit)
+        return FittedImage(fitted, fitted.width * fitted.height * len(fitted.getbands()))
+    return fitted_image('pil', url, box_width, box_height, fit, PIL_RESAMPLE, fit_image).image
+
+
+def render_template_element(image_canvas, node, canvas_width, canvas_height, current_language, default_language_code, assets=None, scale=1.0):
+    """Renders a single display-list node onto image_canvas. Images are read from the prefetched assets map when given.
+
+    canvas_width/canvas_height are output pixels; scale maps template pixels (node geometry, strokes) to output pixels.
+    Traced as a 'raster' span.
+    """
+    with element_span('raster', node):
+        draw_template_element(image_canvas, node, canvas_width, canvas_height, current_language, default_language_code, assets, scale)
+
 
-    el_x = box.get('x_px', (box.get('x_percent', 0) / 100.0) * canvas_width)
-    el_y = box.get('y_px', (box.get('y_percent', 0) / 100.0) * canvas_height)
-    el_width = box.get('width_px', (box.get('width_percent', 100) / 100.0) * canvas_width)
-    el_height = box.get('height_px', (box.get('height_percent', 100) / 100.0) * canvas_height)
-    rotation_angle = -box.get('rotation', 0) # Pillow rotates counter-clockwise
+def draw_template_element(image_canvas, node, canvas_width, canvas_height, current_language, default_language_code, assets=None, scale=1.0):
+    el_type = node.kind
+
+    el_x, el_y, el_width, el_height = node.x * scale, node.y * scale, node.width * scale, node.height * scale
+    rotation_angle = -node.rotation # Pillow rotates counter-clockwise
 
     el_x, el_y, el_width, el_height = int(el_x), int(el_y), int(el_width), int(el_height)
 
     el_layer_width = max(1, el_width)
     el_layer_height = max(1, el_height)
+
     element_layer = Image.new('RGBA', (el_layer_width, el_layer_height), (0, 0, 0, 0))
     element_draw = ImageDraw.Draw(element_layer)
 
-    opacity = style.get('opacity', 1.0)
+    opacity = node.opacity
 
     if el_type == 'image':
-        img_url = content.get('url')
+        img_url = node.url
         if img_url:
             try:
-                response = requests.get(img_url, timeout=10)
-                response.raise_for_status()
-                img_data = BytesIO(response.content)
-                el_image = Image.open(img_data).convert("RGBA")
-                box_fit = style.get('imageFit', 'BoxFit.contain')
-                el_image = apply_box_fit(el_image, el_layer_width, el_layer_height, box_fit)
+                el_image = fitted_pil_image(assets, img_url, node.width * scale, node.height * scale, node.fit)
                 element_layer.paste(el_image, (0,0), el_image)
             except Exception as e:
                 print(f"Error processing image {img_url}: {e}")
 
     elif el_type == 'text':
-        text_to_render = ""
-        if isinstance(content, dict):
-            lang_content = content.get(current_language) or content.get(default_language_code) or content.get('fallback')
-            if isinstance(lang_content, dict):
-                text_to_render = lang_content.get('text', "")
-            elif isinstance(lang_content, str):
-                 text_to_render = lang_content
-            if not text_to_render and 'text' in content :
-                text_to_render = content['text']
+        text_to_render = node.text_for(current_language, default_language_code)
         
         if text_to_render:
-            font_color_hex = style.get('color', '#000000')
-            font_color_rgba = hex_to_rgba(font_color_hex, 1.0)
-            font_size_vw = style.get('font_size', 4.0)
+            font_color_rgba = node.color
+            font_size_vw = node.font_size_vw
             initial_font_size_px = max(1, int((font_size_vw / 100.0) * canvas_width))
-            font_family = style.get('font_family', 'English')
-            # NOTE: Font weight (e.g., style.get('font_weight')) is not directly applied here
+            # NOTE: Font weight (node.font_weight) is not directly applied here
             # as Pillow relies on the font file itself (e.g., "English-Bold.ttf") to contain
             # different weights. If the specified .ttf file is a single-weight font,
             # variations like 'FontWeight.w900' won't be rendered differently.
-            actual_font_path = f"{font_asset_path}/{font_family}.ttf"
+            actual_font_path = node.font_path
 
-            lines = text_to_render.splitlines()
+            with element_span('layout', node):
+                lines = text_to_render.splitlines()
             
-            final_font_size_px = initial_font_size_px
-            if lines and el_layer_width > 0:
+                final_font_size_px = initial_font_size_px
+                if lines and el_layer_width > 0:
+                    try:
+                        final_font_size_px = TEXT_MEASURER.fit_font_size(lines, actual_font_path, initial_font_size_px, el_layer_width)
+                    except IOError:
+                        pass 
+
+                # measure_font_path keys the memoized measurements; None means Pillow's default font
+                measure_font_path = actual_font_path
                 try:
-                    test_font = ImageFont.truetype(actual_font_path, final_font_size_px)
-                    for line_to_test in lines:
-                        while element_draw.textlength(line_to_test, font=test_font) > el_layer_width and final_font_size_px > 1:
-                            final_font_size_px -= 1
-                            test_font = ImageFont.truetype(actual_font_path, final_font_size_px)
+                    font = TEXT_MEASURER.font(measure_font_path, final_font_size_px)
                 except IOError:
-                    pass 
-
-            try:
-                font = ImageFont.truetype(actual_font_path, final_font_size_px)
-            except IOError:
-                print(f"Warning: Font '{actual_font_path}' at size {final_font_size_px} not found. Using Arial.")
-                try: 
-                    font = ImageFont.truetype("arial.ttf", final_font_size_px)
-                except IOError: 
-                    font = ImageFont.load_default()
-
-            text_align = style.get('text_align', 'left')
+                    print(f"Warning: Font '{actual_font_path}' at size {final_font_size_px} not found. Using Arial.")
+                    measure_font_path = "arial.ttf"
+                    try: 
+                        font = TEXT_MEASURER.font(measure_font_path, final_font_size_px)
+                    except IOError: 
+                        measure_font_path = None
+                        font = TEXT_MEASURER.font(measure_font_path, final_font_size_px)
+
+                text_align = node.text_align
             
-            # Calculate total text block height for vertical centering
-            total_text_block_height = 0
-            line_heights_and_ascents = [] # Store (height, ascent_offset)
-            if lines:
-                for line_to_measure in lines:
-                    current_line_height = 0
-                    ascent_offset = 0 # Distance from top of line_to_measure to its baseline
-                    if not line_to_measure.strip() and len(lines) > 1:
-                        try:
-                            # Use metrics of a placeholder character for empty line height
-                            _x1, y1_placeholder, _x2, y2_placeholder = font.getbbox("Ay") 
-                            current_line_height = y2_placeholder - y1_placeholder
-                            ascent_offset = -y1_placeholder # y1 is typically negative
-                        except AttributeError:
-                            current_line_height = final_font_size_px 
-                            ascent_offset = final_font_size_px * 0.8 # Approximate ascent
-                    else:
-                        try:
-                            _x1, y1, _x2, y2 = font.getbbox(line_to_measure)
-                            current_line_height = y2 - y1
-                            ascent_offset = -y1 # y1 is distance from baseline to top, usually negative
-                        except AttributeError: 
-                            _w_fallback, h_fallback = font.getsize(line_to_measure) if hasattr(font, 'getsize') else (0, final_font_size_px)
-                            current_line_height = h_fallback
-                            ascent_offset = h_fallback * 0.8 # Approximate ascent
-                    line_heights_and_ascents.append((current_line_height, ascent_offset))
-                    total_text_block_height += current_line_height
+                # Calculate total text block height for vertical centering
+                total_text_block_height = 0
+                line_heights_and_ascents = [] # Store (height, ascent_offset)
+                if lines:
+                    for line_to_measure in lines:
+                        current_line_height = 0
+                        ascent_offset = 0 # Distance from top of line_to_measure to its baseline
+                        if not line_to_measure.strip() and len(lines) > 1:
+                            try:
+                                # Use metrics of a placeholder character for empty line height
+                                _x1, y1_placeholder, _x2, y2_placeholder = TEXT_MEASURER.bbox("Ay", measure_font_path, final_font_size_px)
+                                current_line_height = y2_placeholder - y1_placeholder
+                                ascent_offset = -y1_placeholder # y1 is typically negative
+                            except AttributeError:
+                                current_line_height = final_font_size_px 
+                                ascent_offset = final_font_size_px * 0.8 # Approximate ascent
+                        else:
+                            try:
+                                _x1, y1, _x2, y2 = TEXT_MEASURER.bbox(line_to_measure, measure_font_path, final_font_size_px)
+                                current_line_height = y2 - y1
+                                ascent_offset = -y1 # y1 is distance from baseline to top, usually negative
+                            except AttributeError: 
+                                _w_fallback, h_fallback = font.getsize(line_to_measure) if hasattr(font, 'getsize') else (0, final_font_size_px)
+                                current_line_height = h_fallback
+                                ascent_offset = h_fallback * 0.8 # Approximate ascent
+                        line_heights_and_ascents.append((current_line_height, ascent_offset))
+                        total_text_block_height += current_line_height
             
             # Determine starting Y position for the top of the text block
             y_cursor_top = 0
@@ -209,7 +231,7 @@ def render_template_element(image_canvas, element_data, canvas_width, canvas_hei
                 y_cursor_top = (el_layer_height - total_text_block_height) / 2
             
             for idx, line in enumerate(lines):
-                line_width = element_draw.textlength(line, font=font)
+                line_width = TEXT_MEASURER.width(line, measure_font_path, final_font_size_px)
                 x_text_offset = 0
                 if text_align == 'center':
                     x_text_offset = (el_layer_width - line_width) / 2
@@ -224,33 +246,30 @@ def render_template_element(image_canvas, element_data, canvas_width, canvas_hei
                 y_cursor_top += _line_h # Move to the top of the next line
 
     elif el_type == 'shape':
-        shape_type = content.get('shapeType')
-        fill_color_hex = content.get('fillColor', '#00000000')
-        stroke_color_hex = content.get('strokeColor', '#00000000')
-        stroke_width = int(content.get('strokeWidth', 0))
+        raw_stroke_width = node.stroke_width
+        stroke_width = int(raw_stroke_width * scale)
+        if raw_stroke_width >= 1:
+            stroke_width = max(1, stroke_width) # Keep thin strokes visible at thumbnail scale
 
-        fill_color_rgba = hex_to_rgba(fill_color_hex, 1.0) # Opacity is applied to the whole layer later
-        outline_color_rgba = hex_to_rgba(stroke_color_hex, 1.0) if stroke_width > 0 else None
+        fill_color_rgba = node.fill # Opacity is applied to the whole layer later
+        outline_color_rgba = node.stroke if stroke_width > 0 else None
         
         bounds = [(0,0), (el_layer_width-1, el_layer_height-1)]
 
-        nested_content_data = element_data.get('nested_content')
-        if nested_content_data and nested_content_data.get('content'):
-            nested_el_data = nested_content_data['content']
+        if node.nested:
             nested_canvas = Image.new('RGBA', (el_layer_width, el_layer_height), (0,0,0,0))
             # Render nested content into its own canvas, using parent's dimensions as the viewport for the nested element
-            render_template_element(nested_canvas, nested_el_data, el_layer_width, el_layer_height, current_language, default_language_code, font_asset_path)
+            render_template_element(nested_canvas, node.nested, el_layer_width, el_layer_height, current_language, default_language_code, assets, scale)
             
-            fit_mode = nested_content_data.get('contentFit', 'BoxFit.contain')
-            fitted_nested_canvas = apply_box_fit(nested_canvas, el_layer_width, el_layer_height, fit_mode)
+            fitted_nested_canvas = apply_box_fit(nested_canvas, el_layer_width, el_layer_height, node.nested_fit)
 
             # Create a mask from the parent shape
             mask_layer = Image.new('L', (el_layer_width, el_layer_height), 0) # Grayscale for mask
             mask_draw = ImageDraw.Draw(mask_layer)
 
-            if shape_type == "ShapeType.rectangle" or shape_type is None:
+            if node.is_rectangle:
                 mask_draw.rectangle(bounds, fill=255) # Opaque white for mask area
-            elif shape_type == "ShapeType.circle" or shape_type == "ShapeType.oval":
+            elif node.is_oval:
                 mask_draw.ellipse(bounds, fill=255) # Opaque white for mask area
             
             # If the parent shape itself had a fill color, draw it first (respecting its opacity)
@@ -258,9 +277,9 @@ def render_template_element(image_canvas, element_data, canvas_width, canvas_hei
             # or doesn't fully cover the mask.
             if fill_color_rgba[3] > 0: # If parent shape fill is not fully transparent
                  # Corrected to draw the actual shape type (e.g., ellipse for circle)
-                 if shape_type == "ShapeType.rectangle" or shape_type is None:
+                 if node.is_rectangle:
                     element_draw.rectangle(bounds, fill=fill_color_rgba)
-                 elif shape_type == "ShapeType.circle" or shape_type == "ShapeType.oval":
+                 elif node.is_oval:
                     element_draw.ellipse(bounds, fill=fill_color_rgba)
 
             # Paste the fitted nested image onto the element_layer using the shape mask
@@ -268,19 +287,18 @@ def render_template_element(image_canvas, element_data, canvas_width, canvas_hei
 
             # If there's an outline for the parent shape, draw it on top
             if outline_color_rgba and stroke_width > 0:
-                if shape_type == "ShapeType.rectangle" or shape_type is None:
+                if node.is_rectangle:
                     element_draw.rectangle(bounds, fill=None, outline=outline_color_rgba, width=stroke_width)
-                elif shape_type == "ShapeType.circle" or shape_type == "ShapeType.oval":
+                elif node.is_oval:
                     element_draw.ellipse(bounds, fill=None, outline=outline_color_rgba, width=stroke_width)
         else:
             # No nested content, just draw the shape as before
-            if shape_type == "ShapeType.rectangle" or shape_type is None:
+            if node.is_rectangle:
                 element_draw.rectangle(bounds, fill=fill_color_rgba, outline=outline_color_rgba, width=stroke_width)
-            elif shape_type == "ShapeType.circle" or shape_type == "ShapeType.oval":
+            elif node.is_oval:
                 element_draw.ellipse(bounds, fill=fill_color_rgba, outline=outline_color_rgba, width=stroke_width)
 
-    if opacity < 1.0:
-        element_layer.putalpha(element_layer.split()[-1].point(lambda p: p * opacity))
+    apply_opacity(element_layer, opacity)
 
     if rotation_angle != 0:
         rotated_layer = element_layer.rotate(rotation_angle, expand=True, resample=Image.Resampling.BICUBIC)
@@ -288,49 +306,182 @@ def render_template_element(image_canvas, element_data, canvas_width, canvas_hei
         orig_center_y = el_y + el_height / 2
         new_paste_x = int(orig_center_x - rotated_layer.width / 2)
         new_paste_y = int(orig_center_y - rotated_layer.height / 2)
-        image_canvas.paste(rotated_layer, (new_paste_x, new_paste_y), rotated_layer)
+        with element_span('composite', node):
+            paste_layer(image_canvas, rotated_layer, new_paste_x, new_paste_y)
     else:
-        image_canvas.paste(element_layer, (el_x, el_y), element_layer)
+        with element_span('composite', node):
+            paste_layer(image_canvas, element_layer, el_x, el_y)
+
+
+def compile_pil_template(json_data, font_asset_path="assets/fonts"):
+    """Compiles a template for the Pillow renderer (elements in z order); reusable across renders."""
+    return compile_template(json_data, font_asset_path, sort_by_z=True)
+
 
+def pil_image_urls(nodes, base_image_url=None):
+    """Image URLs this renderer draws; leader strips are not drawn by the Pillow renderer, so their photos are not fetched."""
+    return node_image_urls([node for node in nodes if node.kind != 'leader_strip'], base_image_url)
 
-def create_image_from_json(json_data, output_path="output_image.png", font_asset_path="assets/fonts"):
-    canvas_width = json_data['original_width']
-    canvas_height = json_data['original_height']
-    # Initialize with a transparent background, as the base_image_url will form the actual base
-    final_image = Image.new('RGBA', (canvas_width, canvas_height), (0, 0, 0, 0)) 
 
-    # 1. Render the base_image_url as the first layer
-    base_image_url = json_data.get('base_image_url')
+def draw_static_layers(image_canvas, template, static_nodes, base_image_url, current_language, default_lang_code, assets, render_scale):
+    """Composites the base image and the static elements onto image_canvas."""
+    canvas_width, canvas_height = image_canvas.size
     if base_image_url:
         try:
-            print(f"Fetching base_image_url: {base_image_url}")
-            response = requests.get(base_image_url, timeout=10)
-            response.raise_for_status()
-            img_data = BytesIO(response.content)
-            base_img = Image.open(img_data).convert("RGBA")
             # Resize base image to cover the canvas
-            base_img = apply_box_fit(base_img, canvas_width, canvas_height, "BoxFit.cover")
-            final_image.paste(base_img, (0,0), base_img) # Paste onto the main canvas
-            print("Base image rendered.")
+            base_img = fitted_pil_image(assets, base_image_url, canvas_width, canvas_height, "BoxFit.cover")
+            paste_layer(image_canvas, base_img, 0, 0) # Opaque base images are copied without a mask
         except Exception as e:
             print(f"Error processing base_image_url {base_image_url}: {e}")
             # Optionally, fill with a default color if base image fails
             # base_draw = ImageDraw.Draw(final_image)
             # base_draw.rectangle([(0,0), (canvas_width, canvas_height)], fill=(255,255,255,255)) # White background
 
-    # 2. Sort and render elements from content_json on top
-    content_json = sorted(json_data['content_json'], key=lambda el: el.get('z_index', 0))
-    
-    lang_settings = json_data.get('language_settings', {})
-    current_language = lang_settings.get('current_language', 'en')
+    for node in static_nodes:
+        render_template_element(image_canvas, node, canvas_width, canvas_height, current_language, default_lang_code, assets, render_scale)
+
+
+def render_languages(json_data, languages, font_asset_path="assets/fonts", max_prefetch_workers=8, scale=None, target_width=None, static_split=DEFAULT_STATIC_SPLIT, assets=None):
+    """Yields (language, RGBA image) per language.
+
+    json_data is a template dict or a CompiledTemplate from compile_pil_template
+    (which already fixes the font directory).
+    The base image and the static (non-personalized) elements below the first
+    dynamic one are composited once and cached across renders, see
+    static_layers. Images are fetched/decoded once, and the language-independent
+    layers below the first text element are composited once and copied for each
+    language.
+    scale/target_width render directly at a reduced (or enlarged) output size.
+    assets holds already decoded images (url -> PIL Image) that are not fetched again.
+    """
+    template = json_data if isinstance(json_data, CompiledTemplate) else compile_pil_template(json_data, font_asset_path)
+    render_scale = resolve_render_scale(template.width, scale, target_width)
+    canvas_width, canvas_height = scaled_size(template.width, template.height, render_scale)
+    # 0. Drop nodes that cannot show (the images covering them are fetched first, as the cull relies on them)
+    assets = dict(assets or {})
+    skip_decode = lambda url, hint: fitted_boxes_cached('pil', PIL_RESAMPLE, url, hint)
+    cover_hints = image_decode_hints(template.nodes, None, canvas_width, canvas_height, render_scale)
+    with span('cull', backend='pil'):
+        nodes, cull_report = cull_with_fetched_covers(template, render_scale, assets, lambda urls: prefetch_images(urls, decode_pil_image, max_prefetch_workers, cover_hints, skip_decode))
+    log_cull_report(cull_report)
+    base_image_url = None if cull_report['base_image_occluded'] else template.base_image_url
+    lang_settings = template.language_settings
     default_lang_code = lang_settings.get('default_language', {}).get('code', 'en')
 
-    for element in content_json:
-        print(f"Rendering element type: {element['type']}, tag: {element.get('tag')}, z: {element.get('z_index')}")
-        render_template_element(final_image, element, canvas_width, canvas_height, current_language, default_lang_code, font_asset_path)
+    # 1. The base image and static elements come from the cached background when possible
+    static_nodes, dynamic_nodes = split_static_layers(nodes, static_split, DYNAMIC_TAGS | template.bound_tags)
+    static_urls = pil_image_urls(static_nodes, base_image_url)
+    # Backgrounds are keyed by the content of their images; without it (a fetch failed) they are drawn and not cached
+    static_digests = fetch_digests(static_urls) if static_split != 'none' else None
+    cache_background = static_digests is not None
+    background_keys = {lang: static_layer_key('pil', template, static_nodes, base_image_url, render_scale, lang, default_lang_code, static_digests) for lang in languages}
+    backgrounds = {key: STATIC_LAYERS.lookup(key) if cache_background else None for key in set(background_keys.values())}
+    needs_static_assets = any(background is None for background in backgrounds.values())
+
+    # Download and decode the images still to be drawn and not passed in concurrently before drawing
+    urls = (static_urls if needs_static_assets else []) + pil_image_urls(dynamic_nodes)
+    # Images are decoded no larger than drawing them needs (see reduced_decode)
+    hints = image_decode_hints(nodes, base_image_url, canvas_width, canvas_height, render_scale)
+    assets.update(prefetch_images([url for url in urls if url not in assets], decode_pil_image, max_prefetch_workers, hints, skip_decode))
+
+    def background_canvas(current_language):
+        key = background_keys[current_language]
+        background = backgrounds[key]
+        if background is None:
+            # Initialize with a transparent background, as the base_image_url will form the actual base
+            background = Image.new('RGBA', (canvas_width, canvas_height), (0, 0, 0, 0))
+            with span('static_background', elements=len(static_nodes), lang=current_language):
+                draw_static_layers(background, template, static_nodes, base_image_url, current_language, default_lang_code, assets, render_scale)
+            backgrounds[key] = background
+            if cache_background and assets_complete(assets, static_urls):
+                STATIC_LAYERS.put(key, background)
+        else:
+            trace_event('static_background', cached=True, elements=len(static_nodes), lang=current_language)
+        with span('composite', ELEMENT, layer='static_background'):
+            return background.copy()
+
+    # 2. Render the (z-sorted) dynamic nodes on top
+    # With one background for every language, everything below the first text element is shared too
+    shared_background = len(backgrounds) == 1
+    if shared_background:
+        shared_nodes, per_language_nodes = split_static_prefix(dynamic_nodes, lambda node: node.language_dependent)
+        shared_image = background_canvas(languages[0])
+        with span('draw', layer='shared', elements=len(shared_nodes)):
+            for node in shared_nodes:
+                render_template_element(shared_image, node, canvas_width, canvas_height, languages[0], default_lang_code, assets, render_scale)
+    else:
+        per_language_nodes = dynamic_nodes
 
-    final_image.save(output_path)
+    for idx, current_language in enumerate(languages):
+        if not shared_background:
+            final_image = background_canvas(current_language)
+        else:
+            # The last language can draw straight onto the shared layers
+            if idx == len(languages) - 1:
+                final_image = shared_image
+            else:
+                with span('composite', ELEMENT, layer='shared'):
+                    final_image = shared_image.copy()
+        with span('draw', lang=current_language, elements=len(per_language_nodes)):
+            for node in per_language_nodes:
+                render_template_element(final_image, node, canvas_width, canvas_height, current_language, default_lang_code, assets, render_scale)
+        yield current_language, final_image
+
+
+def save_image(final_image, output_path, output_format=None, quality=DEFAULT_QUALITY):
+    """Encodes final_image (format defaults to the output_path extension) and returns the path written."""
+    encoded_bytes, chosen_format = encode_image(final_image, output_format or format_from_path(output_path), quality)
+    output_path = write_encoded(output_path, encoded_bytes, chosen_format)
     print(f"Image saved to {output_path}")
+    return output_path
+
+
+def encode_image(final_image, output_format, quality=DEFAULT_QUALITY):
+    """(encoded_bytes, chosen_format) for final_image, traced as an 'encode' span."""
+    with span('encode', format=output_format) as encode_span:
+        encoded_bytes, chosen_format = encode_pil_image(final_image, output_format, quality)
+        encode_span.set(chosen_format=chosen_format, bytes=len(encoded_bytes))
+    return encoded_bytes, chosen_format
+
+
+def save_cached_images(template, languages, output_path_for, output_cache, max_prefetch_workers=8, output_format='png', quality=DEFAULT_QUALITY, scale=None, target_width=None, static_split=DEFAULT_STATIC_SPLIT):
+    """Writes each language's image to output_path_for(lang), rendering only those not in output_cache. Returns {lang: path}."""
+    options = {'format': output_format, 'quality': quality, 'scale': scale, 'target_width': target_width}
+    render = lambda missing: render_languages(template, missing, max_prefetch_workers=max_prefetch_workers, scale=scale, target_width=target_width, static_split=static_split)
+    encode = lambda final_image: encode_image(final_image, output_format, quality)
+    output_paths = {}
+    for lang, encoded_bytes, chosen_format, _cached in output_cache.outputs(template, languages, 'pil', options, render, encode):
+        output_paths[lang] = write_encoded(output_path_for(lang), encoded_bytes, chosen_format)
+        print(f"Image saved to {output_paths[lang]}")
+    return output_paths
+
+
+def create_image_from_json(json_data, output_path="output_image.png", font_asset_path="assets/fonts", max_prefetch_workers=8, output_format=None, quality=DEFAULT_QUALITY, scale=None, target_width=None, static_split=DEFAULT_STATIC_SPLIT, output_cache=None):
+    """Renders the current language and returns the path written.
+
+    With an output_cache (see output_cache), an unchanged poster is copied from the cache instead of rendered.
+    """
+    lang_settings = json_data.language_settings if isinstance(json_data, CompiledTemplate) else json_data.get('language_settings', {})
+    current_language = lang_settings.get('current_language', 'en')
+    if output_cache is not None:
+        template = json_data if isinstance(json_data, CompiledTemplate) else compile_pil_template(json_data, font_asset_path)
+        return save_cached_images(template, [current_language], lambda _lang: output_path, output_cache, max_prefetch_workers, output_format or format_from_path(output_path), quality, scale, target_width, static_split).get(current_language)
+    for _lang, final_image in render_languages(json_data, [current_language], font_asset_path, max_prefetch_workers, scale, target_width, static_split):
+        return save_image(final_image, output_path, output_format, quality)
+
+
+def create_images_from_json(json_data, languages, output_path="output_image_{lang}.png", font_asset_path="assets/fonts", max_prefetch_workers=8, output_format=None, quality=DEFAULT_QUALITY, scale=None, target_width=None, static_split=DEFAULT_STATIC_SPLIT, output_cache=None):
+    """Renders one image per language, sharing the language-independent layers. Returns {lang: path}.
+
+    With an output_cache, only the languages whose output changed are rendered.
+    """
+    if output_cache is not None:
+        template = json_data if isinstance(json_data, CompiledTemplate) else compile_pil_template(json_data, font_asset_path)
+        return save_cached_images(template, languages, lambda lang: language_output_path(output_path, lang), output_cache, max_prefetch_workers, output_format or format_from_path(output_path), quality, scale, target_width, static_split)
+    output_paths = {}
+    for lang, final_image in render_languages(json_data, languages, font_asset_path, max_prefetch_workers, scale, target_width, static_split):
+        output_paths[lang] = save_image(final_image, language_output_path(output_path, lang), output_format, quality)
+    return output_paths
 
 # --- Main ---
 if __name__ == '__main__':
@@ -646,6 +797,39 @@ if __name__ == '__main__':
     }
 }
     
-    font_directory = "assets/fonts" 
-    
-    create_image_from_json(example_json_data, output_path="generated_image_py.png", font_asset_path=font_directory)
+    parser = argparse.ArgumentParser(description="Generate a poster image from a JSON template using Pillow.")
+    parser.add_argument('--json', default=None, help='Path to the JSON file containing poster data (default: built-in example)')
+    lang_group = parser.add_mutually_exclusive_group()
+    lang_group.add_argument('--lang', default=None, help='Language key to use for text rendering (e.g., en-IN, hi-IN)')
+    lang_group.add_argument('--langs', default=None, help='Comma-separated languages to render in one pass (e.g., hi-IN,en-IN,mr-IN)')
+    parser.add_argument('--output', default='generated_image_py.png', help="Output image file path; with --langs, '{lang}' is replaced or '_<lang>' is appended")
+    parser.add_argument('--fonts', default='assets/fonts', help='Path to font assets directory (default: assets/fonts)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None, help="Output format (default: from --output extension). 'auto' picks the smallest acceptable encoding")
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY, help=f'JPEG/WebP quality (default: {DEFAULT_QUALITY})')
+    size_group = parser.add_mutually_exclusive_group()
+    size_group.add_argument('--scale', type=float, default=None, help='Render at this fraction of the template size (e.g., 0.25 for thumbnails)')
+    size_group.add_argument('--target-width', type=int, default=None, help='Render directly at this output width in pixels')
+    parser.add_argument('--static-split', choices=STATIC_SPLITS, default=DEFAULT_STATIC_SPLIT, help="Which elements count as the cached static background: 'auto' (all but personal tags and text), 'tags' (all but personal tags) or 'none'")
+    parser.add_argument('--output-cache', action='store_true', help='Copy unchanged posters from the output cache instead of rendering them (directory: $POSTER_OUTPUT_CACHE_DIR)')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure_tracing_from_args(args)
+
+    if args.json:
+        with open(args.json, 'r', encoding='utf-8') as f:
+            example_json_data = json.load(f)
+
+    font_directory = args.fonts
+    output_cache = get_output_cache() if args.output_cache else None
+    lang_settings = example_json_data.setdefault('language_settings', {})
+    if args.langs:
+        languages = parse_languages(args.langs)
+        if not languages:
+            parser.error("--langs must list at least one language")
+        lang_settings.setdefault('default_language', {'code': languages[0]})
+        create_images_from_json(example_json_data, languages, output_path=args.output, font_asset_path=font_directory, output_format=args.format, quality=args.quality, scale=args.scale, target_width=args.target_width, static_split=args.static_split, output_cache=output_cache)
+    else:
+        if args.lang:
+            lang_settings['current_language'] = args.lang
+            lang_settings.setdefault('default_language', {'code': args.lang})
+        create_image_from_json(example_json_data, output_path=args.output, font_asset_path=font_directory, output_format=args.format, quality=args.quality, scale=args.scale, target_width=args.target_width, static_split=args.static_split, output_cache=output_cache)
@@ -0,0 +1,404 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+from display_list import ImageNode, LeaderStripNode, ShapeNode, TextNode, compile_template
+from geometry import resolve_render_scale, scaled_size
+from image_fetch import get_image_fetcher
+from image_encoding import DEFAULT_QUALITY, OUTPUT_FORMATS
+from reduced_decode import image_decode_hints
+from static_layers import DEFAULT_STATIC_SPLIT, STATIC_SPLITS
+from tracing import add_trace_arguments, configure_tracing_from_args, span
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR)) # generate_thumbnail.py (Pillow) lives in the repo root
+
+# --- Backend Routing ---
+# One front-end for both renderers: render(template, lang, backend='auto')
+# profiles the template (output size, element area, images and the megapixels
+# decoded from them, text volume, nested masks, rotation, shadows, leaders) and
+# routes it to the backend predicted to be faster. Decoded megapixels follow
+# the reduced-decode hints (a 4000x3000 photo in a thumbnail decodes far fewer
+# pixels than at print size); source sizes are read from the image headers,
+# fetched through the shared image cache the render then reads from. Pillow does not draw shadows or leader strips, so
+# templates using them always go to Skia. Otherwise each backend's per-render
+# cost (decode + draw) is predicted by a linear model over the profile, plus
+# the backend's import time while it is not loaded in this process yet
+# (skia-python takes several times longer to import than Pillow, so a one-shot
+# render of a trivial template can finish sooner on Pillow):
+#   ms = intercept + sum(coefficient * feature for feature in COST_FEATURES)
+#        (+ startup_ms before the backend's first use)
+# The models are fitted from benchmark runs by the calibrate command and read
+# from backend_calibration.json next to this file (or POSTER_BACKEND_CALIBRATION);
+# without one, DEFAULT_COST_MODELS (fitted on a development machine) are used.
+#
+#   python backend_routing.py render --json template.json --lang hi-IN --output poster.png
+#   python backend_routing.py calibrate --runs 5                 # runs the benchmark cases
+#   python backend_routing.py calibrate results_a.json results_b.json  # or fits saved benchmark.py results
+
+BACKENDS = ('pil', 'skia')
+BACKEND_CHOICES = ('auto',) + BACKENDS
+PROFILE_FEATURES = ('pixels_mp', 'element_mp', 'images', 'decoded_mp', 'text_chars', 'nested', 'rotated', 'shadows', 'leaders')
+COST_FEATURES = ('pixels_mp', 'element_mp', 'images', 'decoded_mp', 'text_chars', 'nested', 'rotated')
+DEFAULT_SIZE_WORKERS = 8
+PIL_UNDRAWN = ('shadows', 'leaders') # Features the Pillow renderer does not draw
+CALIBRATION_PHASES = ('decode', 'draw') # Benchmark phases that depend on the backend; encoding depends on the output format
+CALIBRATION_SCHEMA = 2
+DEFAULT_CALIBRATION_PATH = os.path.join(SCRIPT_DIR, 'backend_calibration.json')
+DEFAULT_RIDGE = 0.01 # Shrinks each coefficient by this fraction of its feature's scale; keeps small fits stable
+FIT_SWEEPS = 500
+ROBUST_ROUNDS = 10
+MIN_RESIDUAL_MS = 1.0 # Caps the weight of samples the fit already matches
+STARTUP_SAMPLES = 5
+BACKEND_MODULES = {'pil': 'generate_thumbnail', 'skia': 'generate_thumbnial_skia'}
+
+DEFAULT_COST_MODELS = { # backend_routing.py calibrate on a 2026 development machine (skia-python 87.9, Pillow 12)
+    'pil': {'intercept': 0.0, 'startup_ms': 17.2,
+            'coefficients': {'pixels_mp': 0.0, 'element_mp': 0.0, 'images': 0.0, 'decoded_mp': 53.89, 'text_chars': 0.0, 'nested': 0.0, 'rotated': 0.26}},
+    'skia': {'intercept': 1.6, 'startup_ms': 115.5,
+             'coefficients': {'pixels_mp': 0.0, 'element_mp': 0.0, 'images': 0.0, 'decoded_mp': 16.82, 'text_chars': 0.0, 'nested': 0.0, 'rotated': 0.83}},
+}
+
+_cost_models = {} # calibration path -> models
+
+
+# --- Profiling ---
+
+def _add_node_features(profile, node, lang, default_lang_code, render_scale):
+    profile['element_mp'] += max(0, node.width) * max(0, node.height) * render_scale * render_scale / 1e6
+    if node.rotation:
+        profile['rotated'] += 1
+    if isinstance(node, ImageNode):
+        profile['images'] += bool(node.url)
+        profile['shadows'] += node.shadow is not None
+    elif isinstance(node, ShapeNode):
+        profile['shadows'] += node.shadow is not None
+    elif isinstance(node, TextNode):
+        profile['text_chars'] += len(node.text_for(lang, default_lang_code))
+        profile['shadows'] += node.text_shadow is not None
+    elif isinstance(node, LeaderStripNode):
+        profile['leaders'] += sum(1 for url in node.leader_urls if url)
+    if node.nested is not None:
+        profile['nested'] += 1
+        _add_node_features(profile, node.nested, lang, default_lang_code, render_scale)
+
+
+def _decoded_mp(url, hint):
+    try:
+        width, height = Image.open(BytesIO(get_image_fetcher().fetch(url))).size # Reads the header only
+    except Exception as e:
+        print(f"Warning: Could not read the size of {url} for routing ({e}).")
+        return 0.0
+    width, height = hint.decode_size(width, height) or (width, height)
+    return width * height / 1e6
+
+
+def decoded_megapixels(hints, max_workers=DEFAULT_SIZE_WORKERS):
+    """Total megapixels decoded for {url: DecodeHint}; images that cannot be fetched or read count as 0."""
+    if len(hints) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(hints))) as executor:
+            return sum(executor.map(_decoded_mp, hints, hints.values()))
+    return sum(_decoded_mp(url, hint) for url, hint in hints.items())
+
+
+def profile_template(template, lang, render_scale=1.0):
+    """{feature: value} (see PROFILE_FEATURES) for rendering a CompiledTemplate in lang at render_scale."""
+    nodes, cull_report = template.visible_nodes(render_scale)
+    base_image_url = None if cull_report['base_image_occluded'] else template.base_image_url
+    default_lang_code = template.language_settings.get('default_language', {}).get('code', 'en')
+    output_width, output_height = scaled_size(template.width, template.height, render_scale)
+    profile = dict.fromkeys(PROFILE_FEATURES, 0)
+    profile['pixels_mp'] = output_width * output_height / 1e6
+    profile['element_mp'] = 0.0
+    profile['images'] = int(bool(base_image_url))
+    for node in nodes:
+        _add_node_features(profile, node, lang, default_lang_code, render_scale)
+    profile['decoded_mp'] = decoded_megapixels(image_decode_hints(nodes, base_image_url, output_width, output_height, render_scale))
+    for feature in ('pixels_mp', 'element_mp', 'decoded_mp'):
+        profile[feature] = round(profile[feature], 4)
+    return profile
+
+
+# --- Routing ---
+
+def load_cost_models(path=None):
+    """The {backend: cost model} of a calibration file (default: POSTER_BACKEND_CALIBRATION or backend_calibration.json), or DEFAULT_COST_MODELS."""
+    path = path or os.environ.get('POSTER_BACKEND_CALIBRATION') or DEFAULT_CALIBRATION_PATH
+    models = _cost_models.get(path)
+    if models is None:
+        models = DEFAULT_COST_MODELS
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                calibration = json.load(f)
+            if calibration.get('schema') == CALIBRATION_SCHEMA:
+                models = calibration['models']
+            else: # Fitted on other features; its coefficients would be misread
+                print(f"Warning: Backend calibration '{path}' is from an older version. Using the default cost models; rerun calibrate.")
+        elif path != DEFAULT_CALIBRATION_PATH:
+            print(f"Warning: Backend calibration '{path}' not found. Using the default cost models.")
+        _cost_models[path] = models
+    return models
+
+
+def backend_loaded(backend):
+    return BACKEND_MODULES[backend] in sys.modules
+
+
+def predicted_ms(model, profile, loaded=True):
+    """Predicted render time of a profile; loaded=False adds the backend's startup (import) time."""
+    ms = model['intercept'] + sum(model['coefficients'].get(feature, 0.0) * profile.get(feature, 0) for feature in COST_FEATURES)
+    return ms if loaded else ms + model.get('startup_ms', 0.0)
+
+
+def choose_backend(profile, cost_models=None, loaded=None):
+    """(backend, reason) for a template profile: Skia when Pillow cannot draw it, otherwise the lower predicted cost.
+
+    loaded is {backend: already imported}; by default it is read from sys.modules.
+    """
+    undrawn = [feature for feature in PIL_UNDRAWN if profile.get(feature)]
+    if undrawn:
+        return 'skia', f"Pillow does not draw {', '.join(undrawn)}"
+    cost_models = cost_models or load_cost_models()
+    loaded = loaded or {backend: backend_loaded(backend) for backend in BACKENDS}
+    pil_ms, skia_ms = (predicted_ms(cost_models[backend], profile, loaded[backend]) for backend in BACKENDS)
+    return ('pil' if pil_ms < skia_ms else 'skia'), f"predicted pil {pil_ms:.1f} ms, skia {skia_ms:.1f} ms"
+
+
+def select_backend(json_data, lang, font_asset_path="assets/fonts", scale=None, target_width=None, cost_models=None):
+    """(backend, reason) for rendering a template dict in lang at the given output size."""
+    with span('select_backend'):
+        template = compile_template(json_data, font_asset_path)
+        render_scale = resolve_render_scale(template.width, scale, target_width)
+        return choose_backend(profile_template(template, lang, render_scale), cost_models)
+
+
+def backend_functions(backend):
+    """The entry points of a backend, imported lazily so a Pillow-only render never imports skia."""
+    if backend == 'pil':
+        import generate_thumbnail as pil
+        from image_encoding import encode_pil_image
+        return {'render': pil.render_languages, 'save': pil.save_image, 'encode': encode_pil_image, 'to_pil': lambda image: image}
+    if backend == 'skia':
+        import generate_thumbnial_skia as skia_backend
+        return {'render': skia_backend.render_languages_skia, 'save': skia_backend.save_skia_image,
+                'encode': skia_backend.encode_skia_image, 'to_pil': skia_backend.skia_image_to_pil}
+    raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKEND_CHOICES)}")
+
+
+def render(json_data, lang, backend='auto', font_asset_path="assets/fonts", scale=None, target_width=None,
+           static_split=DEFAULT_STATIC_SPLIT, cost_models=None):
+    """Renders a template dict (with original_width/original_height) in lang. Returns (backend, image).
+
+    backend is 'pil', 'skia' or 'auto' (see choose_backend). The image is a
+    Pillow RGBA image or a skia.Image; save_rendered/encode_rendered/
+    rendered_to_pil handle either.
+    """
+    if backend == 'auto':
+        backend, reason = select_backend(json_data, lang, font_asset_path, scale, target_width, cost_models)
+        print(f"Auto backend: {backend} ({reason})")
+    functions = backend_functions(backend)
+    for _lang, image in functions['render'](json_data, [lang], font_asset_path=font_asset_path, scale=scale,
+                                           target_width=target_width, static_split=static_split):
+        return backend, image
+
+
+def save_rendered(backend, image, output_path, output_format=None, quality=DEFAULT_QUALITY):
+    """Saves an image returned by render() with its backend's encoder. Returns the path written."""
+    return backend_functions(backend)['save'](image, output_path, output_format, quality)
+
+
+def encode_rendered(backend, image, output_format='png', quality=DEFAULT_QUALITY):
+    """(encoded_bytes, chosen_format) of an image returned by render()."""
+    return backend_functions(backend)['encode'](image, output_format, quality)
+
+
+def rendered_to_pil(backend, image):
+    return backend_functions(backend)['to_pil'](image)
+
+
+# --- Calibration ---
+
+def calibration_samples(results):
+    """Yields (backend, profile, ms) from benchmark.py results; cases Pillow cannot draw are skipped."""
+    for case_result in results['cases'].values():
+        profile = case_result.get('profile')
+        if profile is None or any(profile.get(feature) for feature in PIL_UNDRAWN):
+            continue
+        for backend, backend_result in case_result['backends'].items():
+            phases = backend_result.get('phases')
+            if phases:
+                yield backend, profile, sum(phases[phase]['median_ms'] for phase in CALIBRATION_PHASES)
+
+
+def _fit_weighted(rows, targets, sample_weights, ridge):
+    """Non-negative, ridge-shrunk weighted least squares by coordinate descent. Returns the coefficients (intercept first)."""
+    coefficients = [0.0] * len(rows[0])
+    residuals = list(targets)
+    norms = [sum(weight * row[j] * row[j] for row, weight in zip(rows, sample_weights)) for j in range(len(coefficients))]
+    for _sweep in range(FIT_SWEEPS):
+        for j, norm in enumerate(norms):
+            if norm == 0:
+                continue
+            penalty = 0.0 if j == 0 else ridge * norm # The intercept is not shrunk
+            correlation = sum(weight * row[j] * residual for row, residual, weight in zip(rows, residuals, sample_weights)) + norm * coefficients[j]
+            coefficient = max(0.0, correlation / (norm + penalty))
+            delta = coefficient - coefficients[j]
+            if delta:
+                residuals = [residual - delta * row[j] for row, residual in zip(rows, residuals)]
+                coefficients[j] = coefficient
+    return coefficients, residuals
+
+
+def fit_cost_model(samples, ridge=DEFAULT_RIDGE):
+    """A cost model fitted to (profile, ms) samples.
+
+    Minimizes the absolute error (iteratively reweighted least squares), so a
+    case the profile cannot explain (e.g. a huge source image) does not skew
+    the rest. Coefficients are non-negative, as no feature makes a render
+    cheaper, and ridge keeps features the samples barely vary from absorbing noise.
+    """
+    rows = [[1.0] + [float(profile.get(feature, 0)) for feature in COST_FEATURES] for profile, _ms in samples]
+    targets = [float(ms) for _profile, ms in samples]
+    sample_weights = [1.0] * len(rows)
+    for _round in range(ROBUST_ROUNDS):
+        coefficients, residuals = _fit_weighted(rows, targets, sample_weights, ridge)
+        sample_weights = [1.0 / max(abs(residual), MIN_RESIDUAL_MS) for residual in residuals]
+    mean_abs_error = sum(abs(residual) for residual in residuals) / len(residuals)
+    return {'intercept': round(coefficients[0], 4), 'coefficients': {feature: round(coefficient, 8) for feature, coefficient in zip(COST_FEATURES, coefficients[1:])},
+            'samples': len(rows), 'mean_abs_error_ms': round(mean_abs_error, 3)}
+
+
+STARTUP_SCRIPT = """
+import sys, time
+sys.path.insert(0, {script_dir!r})
+import backend_routing # Modules shared by both backends load with the front-end
+started = time.perf_counter()
+import {module}
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def measure_startup_ms(backend, samples=STARTUP_SAMPLES):
+    """Median time to import a backend in a fresh interpreter that already loaded the front-end."""
+    script = STARTUP_SCRIPT.format(script_dir=SCRIPT_DIR, module=BACKEND_MODULES[backend])
+    timings = []
+    for _ in range(samples):
+        completed = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+        timings.append(float(completed.stdout.split()[-1]))
+    return round(statistics.median(timings), 3)
+
+
+def calibrate(results_list, ridge=DEFAULT_RIDGE, startup=True):
+    """A calibration dict (models per backend) fitted to one or more benchmark.py results dicts.
+
+    startup also measures each backend's import time on this machine.
+    """
+    samples = {backend: [] for backend in BACKENDS}
+    for results in results_list:
+        for backend, profile, ms in calibration_samples(results):
+            samples[backend].append((profile, ms))
+    for backend, backend_samples in samples.items():
+        if len(backend_samples) < 2:
+            raise ValueError(f"Need benchmark cases drawable by both backends to calibrate, got {len(backend_samples)} for {backend}")
+    models = {backend: fit_cost_model(backend_samples, ridge) for backend, backend_samples in samples.items()}
+    for backend, model in models.items():
+        model['startup_ms'] = measure_startup_ms(backend) if startup else 0.0
+    return {
+        'schema': CALIBRATION_SCHEMA,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'features': list(COST_FEATURES),
+        'phases': list(CALIBRATION_PHASES),
+        'models': models,
+    }
+
+
+def routing_report(results_list, cost_models):
+    """Lines comparing the routed backend with the measured faster one for every calibration case."""
+    lines = []
+    for results in results_list:
+        for case, case_result in results['cases'].items():
+            measured = {backend: ms for backend, _profile, ms in calibration_samples({'cases': {case: case_result}})}
+            if len(measured) < len(BACKENDS):
+                continue
+            backend, reason = choose_backend(case_result['profile'], cost_models, dict.fromkeys(BACKENDS, True))
+            fastest = min(measured, key=measured.get)
+            lines.append(f"{case:<24} routed {backend:<5} measured pil {measured['pil']:.1f} ms, skia {measured['skia']:.1f} ms"
+                         f"{'' if backend == fastest else '  (slower choice)'}; {reason}")
+    return lines
+
+
+def run_calibration_benchmarks(template_paths, font_dir, runs, warmup):
+    """Runs the benchmark cases (no golden comparison) and returns the results dict."""
+    import benchmark
+    with tempfile.TemporaryDirectory(prefix='poster_calibration_') as work_dir:
+        # Must be set before the image fetcher is first used
+        os.environ.setdefault('POSTER_IMAGE_CACHE_DIR', os.path.join(work_dir, 'image_cache'))
+        return benchmark.run_benchmarks(template_paths, font_dir, os.path.join(work_dir, 'golden'), runs=runs, warmup=warmup)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render a poster on the faster backend, or calibrate the backend routing.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    render_parser = commands.add_parser('render', help='Render one template in one language')
+    render_parser.add_argument('--json', required=True, help='Path to the JSON template')
+    render_parser.add_argument('--lang', required=True, help='Language key to use for text rendering (e.g., en-IN, hi-IN)')
+    render_parser.add_argument('--backend', choices=BACKEND_CHOICES, default='auto', help="Renderer (default: auto)")
+    render_parser.add_argument('--output', default='generated_poster.png', help='Output image path (default: generated_poster.png)')
+    render_parser.add_argument('--fonts', default='./assets/fonts', help='Path to font assets directory (default: ./assets/fonts)')
+    render_parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None, help="Output format (default: from --output extension)")
+    render_parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY, help=f'JPEG/WebP quality (default: {DEFAULT_QUALITY})')
+    size_group = render_parser.add_mutually_exclusive_group()
+    size_group.add_argument('--scale', type=float, default=None, help='Render at this fraction of the template size (e.g., 0.25 for thumbnails)')
+    size_group.add_argument('--target-width', type=int, default=None, help='Render directly at this output width in pixels')
+    render_parser.add_argument('--static-split', choices=STATIC_SPLITS, default=DEFAULT_STATIC_SPLIT, help="Which elements count as the cached static background")
+    render_parser.add_argument('--calibration', default=None, help='Backend calibration JSON (default: POSTER_BACKEND_CALIBRATION or backend_calibration.json)')
+    add_trace_arguments(render_parser)
+
+    calibrate_parser = commands.add_parser('calibrate', help='Fit the routing cost models from benchmark runs')
+    calibrate_parser.add_argument('results', nargs='*', help='benchmark.py results JSON files to fit (default: run the benchmark cases now)')
+    calibrate_parser.add_argument('--template', action='append', default=None, help='Real template JSON to benchmark as well (repeatable; default: sample_content.json)')
+    calibrate_parser.add_argument('--runs', type=int, default=5, help='Timed runs per phase when benchmarking (default: 5)')
+    calibrate_parser.add_argument('--warmup', type=int, default=1, help='Untimed runs before timing (default: 1)')
+    calibrate_parser.add_argument('--fonts', default=os.path.join(SCRIPT_DIR, 'assets', 'fonts'), help='Path to font assets directory')
+    calibrate_parser.add_argument('--ridge', type=float, default=DEFAULT_RIDGE, help=f'Coefficient shrinkage (default: {DEFAULT_RIDGE})')
+    calibrate_parser.add_argument('--no-startup', action='store_true', help='Do not measure backend import times (routing then ignores them)')
+    calibrate_parser.add_argument('--output', default=DEFAULT_CALIBRATION_PATH, help='Path for the calibration JSON (default: backend_calibration.json next to this script)')
+    args = parser.parse_args()
+
+    if args.command == 'render':
+        configure_tracing_from_args(args)
+        with open(args.json, 'r', encoding='utf-8') as f:
+            json_data = json.load(f)
+        cost_models = load_cost_models(args.calibration) if args.calibration else None
+        backend, image = render(json_data, args.lang, args.backend, args.fonts, args.scale, args.target_width, args.static_split, cost_models)
+        saved_path = save_rendered(backend, image, args.output, args.format, args.quality)
+        if not saved_path:
+            sys.exit(1)
+        print(f"Rendered with {backend}: {saved_path}")
+    else:
+        if args.results:
+            results_list = []
+            for path in args.results:
+                with open(path, 'r', encoding='utf-8') as f:
+                    results_list.append(json.load(f))
+        else:
+            results_list = [run_calibration_benchmarks(args.template or [os.path.join(SCRIPT_DIR, 'sample_content.json')],
+                                                       args.fonts, args.runs, args.warmup)]
+        calibration = calibrate(results_list, args.ridge, not args.no_startup)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(calibration, f, indent=2)
+        for backend, model in calibration['models'].items():
+            print(f"{backend}: {model['samples']} samples, mean abs error {model['mean_abs_error_ms']} ms, startup {model['startup_ms']} ms, "
+                  f"intercept {model['intercept']} ms, {model['coefficients']}")
+        print("\n".join(routing_report(results_list, calibration['models'])))
+        print(f"Calibration written to {args.output}")
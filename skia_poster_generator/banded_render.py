@@ -0,0 +1,117 @@
+import os
+import struct
+import zlib
+
+from PIL import Image, ImageChops
+
+from culling import element_draw_bounds
+
+# --- Banded Rendering ---
+# Print-size posters (A2 at 7000x10000 px and up) are rendered one horizontal
+# band at a time: each band draws only the elements whose bounds reach it,
+# clipped to the band, and its rows go straight to the output file, so the
+# raster in memory is output width x band height rather than the whole poster.
+# Only PNG is written, filtered and deflated band by band. Pillow has no
+# incremental JPEG or WebP encoder, and assembling the poster to encode it at
+# the end would undo the memory bound, so check_banded_format rejects them.
+
+DEFAULT_BAND_HEIGHT = 512 # Output rows per band
+PNG_COMPRESS_LEVEL = 6 # zlib level, as Pillow's and Skia's PNG encoders default to
+PNG_FILTER_UP = 2 # Every row is stored as its difference from the row above
+PNG_FILTER_ROWS = 64 # Rows filtered and compressed at a time, bounding the encoder's copies of a band
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+BANDED_FORMATS = ('png',)
+
+
+def check_banded_format(output_format):
+    """Raises ValueError unless output_format can be written band by band."""
+    if output_format not in BANDED_FORMATS:
+        raise ValueError(f"Banded rendering writes PNG only, not '{output_format}': it cannot be encoded band by band")
+
+
+def band_ranges(height, band_height=DEFAULT_BAND_HEIGHT):
+    """[(top, bottom), ...] output row ranges covering height rows, top to bottom."""
+    band_height = max(1, int(band_height))
+    return [(top, min(top + band_height, height)) for top in range(0, height, band_height)]
+
+
+def nodes_in_band(template, nodes, top, bottom):
+    """The draw-ordered nodes whose bounds reach template rows [top, bottom).
+
+    Bounds are those used for culling, widened by the shadow blur, whose tail
+    runs past the culling margin; a node drawn in one band but dropped from
+    its neighbour would leave a seam.
+    """
+    kept = []
+    for node in nodes:
+        _left, node_top, _right, node_bottom = element_draw_bounds(node.element, template.width, template.height)
+        shadow = getattr(node, 'shadow', None)
+        pad = shadow.blur_radius if shadow is not None else 0
+        if node_bottom + pad >= top and node_top - pad <= bottom:
+            kept.append(node)
+    return kept
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+
+class PNGStreamWriter:
+    """Writes an RGBA PNG band by band; only the band being compressed is held in memory.
+
+    The file is written next to path and moved into place on close().
+    """
+
+    def __init__(self, path, width, height, compress_level=PNG_COMPRESS_LEVEL):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._tmp_path = f"{path}.tmp-{os.getpid()}"
+        self._file = open(self._tmp_path, 'wb')
+        self._compressor = zlib.compressobj(compress_level)
+        self._previous_row = Image.new('RGBA', (width, 1)) # The row above the first is all zeros
+        self._file.write(PNG_SIGNATURE)
+        self._file.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+
+    def write_band(self, band):
+        """Appends an RGBA band (width pixels wide) below the rows written so far."""
+        if band.size[0] != self.width or self.rows_written + band.size[1] > self.height:
+            raise ValueError(f"Band of {band.size} does not fit a {self.width}x{self.height} PNG at row {self.rows_written}")
+        for top in range(0, band.size[1], PNG_FILTER_ROWS):
+            self._write_rows(band.crop((0, top, self.width, min(top + PNG_FILTER_ROWS, band.size[1]))))
+
+    def _write_rows(self, rows):
+        # Up filter: each row minus the row above it (mod 256), computed by Pillow for the whole run of rows
+        above = Image.new('RGBA', rows.size)
+        above.paste(self._previous_row, (0, 0))
+        above.paste(rows.crop((0, 0, self.width, rows.size[1] - 1)), (0, 1))
+        filtered = ImageChops.subtract_modulo(rows, above).tobytes()
+        stride = self.width * 4
+        filter_byte = bytes([PNG_FILTER_UP])
+        data = b''.join(filter_byte + filtered[offset:offset + stride] for offset in range(0, len(filtered), stride))
+        self._write_idat(self._compressor.compress(data))
+        self._previous_row = rows.crop((0, rows.size[1] - 1, self.width, rows.size[1]))
+        self.rows_written += rows.size[1]
+
+    def _write_idat(self, compressed):
+        if compressed:
+            self._file.write(_png_chunk(b'IDAT', compressed))
+
+    def close(self):
+        """Finishes the file and moves it to path. Returns path."""
+        if self.rows_written != self.height:
+            self.abort()
+            raise ValueError(f"PNG has {self.rows_written} of {self.height} rows")
+        self._write_idat(self._compressor.flush())
+        self._file.write(_png_chunk(b'IEND', b''))
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
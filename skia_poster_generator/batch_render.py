@@ -0,0 +1,228 @@
+import argparse
+import json
+import multiprocessing.util
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from image_encoding import FORMAT_EXTENSIONS, OUTPUT_FORMATS
+from tracing import add_trace_arguments, close_tracing, configure_tracing, process_trace_output
+
+# --- Batch Rendering ---
+# Renders a directory of template JSON files or a JSONL stream of templates/jobs
+# on a process pool. Inputs are streamed and at most max_in_flight jobs are
+# queued at once, so memory stays bounded for arbitrarily large batches. Each
+# pool process keeps its font registry and image cache warm across jobs.
+#
+# A JSONL line is either a bare template (has "content_json") or a render_worker
+# job ({"id": ..., "template": {...} | "template_path": ..., "lang"/"langs": ...}).
+# Every job yields one manifest line: {"id", "ok", "outputs" | "error", "elapsed_ms"}.
+# With --output-cache, jobs reuse the stored outputs of posters that did not
+# change since an earlier run (listed under "cached"), see output_cache.
+#
+# A render process that dies (segfault in a native library, OOM kill) breaks
+# the whole pool: every job queued on it fails with BrokenProcessPool. Those
+# jobs get failure entries and the rest of the batch runs on a new pool.
+
+SAFE_NAME_PATTERN = re.compile(r"[^A-Za-z0-9._-]+")
+
+_worker_font_dir = None
+
+
+def iter_directory_jobs(directory):
+    """Yields (job_id, source) for each *.json file, streaming the directory listing."""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith('.json'):
+                yield os.path.splitext(entry.name)[0], ('path', entry.path)
+
+
+def iter_jsonl_jobs(stream):
+    """Yields (line_number, source) for each non-empty line; parsing happens in the worker."""
+    for line_number, line in enumerate(stream, start=1):
+        if line.strip():
+            yield line_number, ('line', line)
+
+
+def init_worker_process(font_dir, quiet, trace=None):
+    """Pool process initializer: default font directory, renderer output and per-process tracing."""
+    global _worker_font_dir
+    _worker_font_dir = font_dir
+    # Renderer prints would interleave across processes; keep them off stdout
+    sys.stdout = open(os.devnull, 'w') if quiet else sys.stderr
+    if trace:
+        # One trace file per worker process; a shared file would interleave partial writes
+        level, output, trace_format = trace
+        configure_tracing(level, process_trace_output(output), trace_format)
+        # Pool processes skip atexit handlers; multiprocessing finalizers still run
+        multiprocessing.util.Finalize(None, close_tracing, exitpriority=10)
+
+
+def _build_job(job_id, source, output_dir, lang, output_format, output_cache=False):
+    kind, value = source
+    if kind == 'path':
+        job = {'template_path': value}
+    else:
+        parsed = json.loads(value)
+        job = {'template': parsed} if 'content_json' in parsed else parsed
+    job.setdefault('id', job_id)
+    if lang and not job.get('lang') and not job.get('langs'):
+        job['lang'] = lang
+    if output_format and 'format' not in job:
+        job['format'] = output_format
+    if output_cache:
+        job.setdefault('output_cache', True)
+    if 'output' not in job:
+        stem = SAFE_NAME_PATTERN.sub('_', str(job['id']))
+        suffix = '_{lang}' if job.get('langs') else ''
+        extension = FORMAT_EXTENSIONS.get(job.get('format'), '.png') # 'auto' fixes the extension once encoded
+        job['output'] = os.path.join(output_dir, f"{stem}{suffix}{extension}")
+    return job
+
+
+def render_batch_job(job_id, source, output_dir, lang, output_format=None, output_cache=False):
+    """Runs in a pool process. Never raises; failures are reported in the manifest entry."""
+    from render_worker import run_job
+
+    started = time.perf_counter()
+    try:
+        job = _build_job(job_id, source, output_dir, lang, output_format, output_cache)
+        job_id = job['id']
+        result = run_job(job, _worker_font_dir)
+        entry = {'id': job_id, 'ok': True, **result}
+    except Exception as e:
+        entry = {'id': job_id, 'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    entry['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return entry
+
+
+class _BatchPool:
+    """The batch's process pool, replaced when a render process dies."""
+
+    def __init__(self, workers, initargs):
+        self.workers = workers
+        self.initargs = initargs
+        self.restarts = 0
+        self.executor = self._new_executor()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker_process, initargs=self.initargs)
+
+    def submit(self, *args):
+        try:
+            return self.executor, self.executor.submit(*args)
+        except BrokenProcessPool: # Broke since the last result was collected; nothing ran on it yet
+            self.replace(self.executor)
+            return self.executor, self.executor.submit(*args)
+
+    def replace(self, broken):
+        """Swaps a broken executor for a new one (unless it was already replaced)."""
+        if self.executor is not broken:
+            return
+        self.restarts += 1
+        print("A render process died; restarting the render process pool.", file=sys.stderr)
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.executor = self._new_executor()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def _collect(pool, job_id, submitted, executor, future):
+    """The manifest entry of a finished job; jobs lost with a broken pool get a failure entry."""
+    try:
+        return future.result()
+    except BrokenProcessPool as e:
+        pool.replace(executor)
+        return {'id': job_id, 'ok': False, 'error': f"BrokenProcessPool: {e}", 'elapsed_ms': round((time.perf_counter() - submitted) * 1000, 1)}
+
+
+def run_batch(jobs, output_dir, font_dir, lang=None, workers=None, max_in_flight=None, ordered=True, quiet=True, output_format=None, trace=None, output_cache=False):
+    """Renders (job_id, source) pairs on a process pool and yields manifest entries.
+
+    With ordered=True entries come back in input order; otherwise as they finish.
+    trace is an optional (level, output, format) tuple configuring tracing in each worker.
+    output_cache makes jobs that do not set "output_cache" reuse unchanged outputs.
+    Jobs in flight when a render process dies fail; later jobs run on a new pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 4
+    os.makedirs(output_dir, exist_ok=True)
+
+    pool = _BatchPool(workers, (font_dir, quiet, trace))
+    try:
+        pending = deque() # (job_id, submitted, executor, future)
+        jobs = iter(jobs)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_in_flight:
+                try:
+                    job_id, source = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((job_id, time.perf_counter(), *pool.submit(render_batch_job, job_id, source, output_dir, lang, output_format, output_cache)))
+            if not pending:
+                break
+            if ordered:
+                yield _collect(pool, *pending.popleft())
+            else:
+                done, _ = wait([item[-1] for item in pending], return_when=FIRST_COMPLETED)
+                for item in [item for item in pending if item[-1] in done]:
+                    pending.remove(item)
+                    yield _collect(pool, *item)
+    finally:
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render a directory or JSONL stream of poster templates on a process pool.")
+    parser.add_argument('input', help="Directory of *.json templates, a .jsonl file, or '-' for JSONL on stdin")
+    parser.add_argument('--output-dir', default='batch_output', help='Directory for rendered images (default: batch_output)')
+    parser.add_argument('--manifest', default='-', help="Path for the JSONL success/failure manifest, or '-' for stdout")
+    parser.add_argument('--lang', default=None, help='Language for jobs that do not specify one')
+    parser.add_argument('--fonts', default='./assets/fonts', help='Path to font assets directory (default: ./assets/fonts)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None, help='Output format for jobs that do not specify one (default: png)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of render processes (default: CPU count)')
+    parser.add_argument('--max-in-flight', type=int, default=None, help='Maximum queued jobs (default: 4 x workers)')
+    parser.add_argument('--unordered', action='store_true', help='Write manifest entries as jobs finish instead of in input order')
+    parser.add_argument('--verbose', action='store_true', help='Forward renderer logs to stderr')
+    parser.add_argument('--output-cache', action='store_true', help='Skip posters whose output is unchanged since an earlier run (directory: $POSTER_OUTPUT_CACHE_DIR)')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    trace = (args.trace, args.trace_output, args.trace_format) if args.trace != 'off' else None
+
+    input_stream = None
+    if os.path.isdir(args.input):
+        jobs = iter_directory_jobs(args.input)
+    else:
+        input_stream = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+        jobs = iter_jsonl_jobs(input_stream)
+
+    manifest = sys.stdout if args.manifest == '-' else open(args.manifest, 'w', encoding='utf-8')
+    succeeded = failed = reused = 0
+    started = time.perf_counter()
+    try:
+        for entry in run_batch(jobs, args.output_dir, args.fonts, lang=args.lang, workers=args.workers,
+                               max_in_flight=args.max_in_flight, ordered=not args.unordered, quiet=not args.verbose,
+                               output_format=args.format, trace=trace, output_cache=args.output_cache):
+            manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            manifest.flush()
+            if entry['ok']:
+                succeeded += 1
+                reused += len(entry.get('cached', []))
+            else:
+                failed += 1
+    finally:
+        if manifest is not sys.stdout:
+            manifest.close()
+        if input_stream is not None and input_stream is not sys.stdin:
+            input_stream.close()
+
+    reused_note = f" ({reused} outputs reused from the output cache)" if args.output_cache else ""
+    print(f"Batch finished: {succeeded} succeeded, {failed} failed{reused_note} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    sys.exit(1 if failed else 0)
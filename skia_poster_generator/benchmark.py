@@ -0,0 +1,536 @@
+import argparse
+import contextlib
+import copy
+import functools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageChops, ImageDraw
+
+from backend_routing import profile_template
+from display_list import compile_template
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR)) # generate_thumbnail.py (Pillow) lives in the repo root
+
+# --- Rendering Benchmark ---
+# Offline, deterministic benchmark of both backends. Fixture images are
+# generated with Pillow and served by a local HTTP stand-in, so templates go
+# through the normal fetch path without touching the network; the image cache
+# lives in a temporary directory unless --image-cache is given. Every case is
+# timed per phase for generate_thumbnail (Pillow) and generate_thumbnial_skia:
+#   compile  template JSON -> display list
+#   fetch    image bytes through the image fetcher (disk cache after warm-up)
+#   decode   bytes -> backend images, reduced to the drawn size (reduced_decode)
+#   draw     rasterization from decoded images, static background and fitted image caches off
+#   encode   PNG encoding of the output
+#   total    create_image_from_json(_skia) end to end, static background and fitted image caches cleared
+# The drawn output is compared with golden PNGs (--update-golden writes them)
+# and results are written as JSON; --baseline compares medians with an earlier
+# results file and lists phases that got slower. Each case also records its
+# template profile, which backend_routing.py calibrate fits the routing to.
+#
+#   python benchmark.py --runs 5 --output results.json --baseline previous.json
+
+DEFAULT_RUNS = 5
+DEFAULT_WARMUP = 1
+DEFAULT_TOLERANCE = 0 # Largest per-channel difference still counted as a matching pixel
+DEFAULT_REGRESSION_THRESHOLD = 0.15 # Relative median slowdown reported as a regression
+MIN_REGRESSION_MS = 1.0 # Ignore slowdowns smaller than this (timer noise)
+PHASES = ('compile', 'fetch', 'decode', 'draw', 'encode', 'total')
+BACKENDS = ('pil', 'skia')
+LEADER_FIXTURES = 20
+RESULTS_SCHEMA = 1
+
+HINDI_COPY = ("केशव बलिराम हेडगेवार भारतीय राष्ट्रवाद के एक प्रमुख विचारक थे। उनके नेतृत्व में एक ऐसे संगठन की स्थापना हुई "
+              "जो आज भी सेवा, अनुशासन और संस्कृति की रक्षा का काम करता है। ")
+BENGALI_COPY = "বাংলার মানুষের আস্থা মমতা বন্দ্যোপাধ্যায়। উন্নয়নের পথে এগিয়ে চলেছে রাজ্য, প্রতিটি ঘরে পৌঁছেছে সরকারি প্রকল্পের সুবিধা। "
+TAMIL_COPY = "தமிழ்நாட்டின் வளர்ச்சிக்காக அனைவரும் ஒன்றிணைந்து உழைப்போம். கல்வி, சுகாதாரம், வேலைவாய்ப்பு அனைவருக்கும். "
+
+LANGUAGE_SETTINGS = {
+    'current_language': 'hi-IN',
+    'default_language': {'code': 'hi-IN'},
+    'enabled_languages': [
+        {'code': 'hi-IN', 'fontFamily': 'Lohit-Devanagari'},
+        {'code': 'bn-IN', 'fontFamily': 'Lohit-Bengali'},
+        {'code': 'ta-IN', 'fontFamily': 'Lohit-Tamil'},
+        {'code': 'en-IN', 'fontFamily': 'English'},
+    ],
+}
+
+
+# --- Fixtures ---
+
+def _pattern_image(width, height, seed):
+    """A deterministic RGB test image with gradients and hard edges."""
+    gradient = Image.linear_gradient('L')
+    red = gradient.rotate(seed * 37 % 360).resize((width, height))
+    green = Image.radial_gradient('L').resize((width, height))
+    blue = gradient.rotate(90 + seed * 53 % 360).resize((width, height))
+    image = Image.merge('RGB', (red, green, blue))
+    draw = ImageDraw.Draw(image)
+    step = max(8, min(width, height) // 8)
+    for i in range(0, max(width, height), step):
+        draw.line([(i, 0), (0, i)], fill=((seed * 61) % 256, 255 - i % 256, (i * 3) % 256), width=max(1, step // 10))
+    draw.ellipse([width // 4, height // 4, width * 3 // 4, height * 3 // 4], outline=(255, 255, 255), width=max(1, step // 6))
+    return image
+
+
+def write_fixture_images(fixture_dir):
+    """Writes the images the benchmark templates reference into fixture_dir."""
+    os.makedirs(fixture_dir, exist_ok=True)
+    _pattern_image(1080, 1080, 1).save(os.path.join(fixture_dir, 'base.jpg'), quality=90)
+    _pattern_image(4096, 4096, 2).save(os.path.join(fixture_dir, 'base_large.jpg'), quality=90)
+    _pattern_image(800, 1000, 3).save(os.path.join(fixture_dir, 'photo.jpg'), quality=90)
+    logo = _pattern_image(400, 400, 4).convert('RGBA')
+    mask = Image.new('L', logo.size, 0)
+    ImageDraw.Draw(mask).ellipse([20, 20, 380, 380], fill=255)
+    logo.putalpha(mask)
+    logo.save(os.path.join(fixture_dir, 'logo.png'))
+    for i in range(LEADER_FIXTURES):
+        _pattern_image(240, 240, 10 + i).save(os.path.join(fixture_dir, f'leader_{i:02d}.jpg'), quality=90)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve_fixtures(fixture_dir):
+    """Serves fixture_dir on a local port for the duration of the block; yields the base URL."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=fixture_dir))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# --- Templates ---
+
+def _style(**overrides):
+    style = {"color": "#000000", "opacity": 1, "imageFit": "BoxFit.cover", "font_size": 4, "font_family": "English",
+             "font_weight": "FontWeight.w400", "is_italic": False, "is_underlined": False, "box_shadow": None, "text_align": None}
+    style.update(overrides)
+    return style
+
+
+def _box(x, y, width, height, rotation=0, alignment=None):
+    box = {"x_px": x, "y_px": y, "width_px": width, "height_px": height, "rotation": rotation}
+    if alignment:
+        box["alignment"] = alignment
+    return box
+
+
+def _element(el_type, box, content, style=None, tag='defaulty', nested=None, fit='BoxFit.contain'):
+    return {"type": el_type, "box": box, "content": content, "style": style or _style(), "z_index": 0,
+            "tag": f"TemplateElementTag.{tag}", "nested_content": {"content": nested, "contentFit": fit} if nested else None}
+
+
+def _text(lang_texts):
+    return {lang: {"text": text} for lang, text in lang_texts.items()}
+
+
+def _shadow(blur, spread=0, offset=6, color="#00000080"):
+    return {"color": color, "offsetX": offset, "offsetY": offset, "blurRadius": blur, "spreadRadius": spread}
+
+
+def _template(url, elements, base_image='base.jpg'):
+    return {"original_width": 1080, "original_height": 1080, "base_image_url": url + base_image,
+            "content_json": elements, "language_settings": copy.deepcopy(LANGUAGE_SETTINGS)}
+
+
+def text_indic_template(url):
+    copy_text = {'hi-IN': HINDI_COPY, 'bn-IN': BENGALI_COPY, 'ta-IN': TAMIL_COPY}
+    elements = [_element('text', _box(60, 40, 960, 110, alignment='center'), _text({lang: text.split('।')[0] for lang, text in copy_text.items()}),
+                         _style(color="#ffffff", font_size=6, font_weight="FontWeight.w900"), tag='heading')]
+    for i in range(6):
+        elements.append(_element('text', _box(60, 170 + i * 140, 960, 130, alignment=('left', 'center', 'right')[i % 3]),
+                                 _text({lang: text * (1 + i % 3) for lang, text in copy_text.items()}),
+                                 _style(color="#fff8e0", font_size=2.4 + i * 0.3, text_align=('left', 'center', 'right', 'justify')[i % 4],
+                                        line_height=1.1 + i * 0.1, is_italic=i == 4, is_underlined=i == 5), tag='messaging'))
+    return _template(url, elements)
+
+
+def leader_strip_template(url):
+    leaders = [{"content": {"url": f"{url}leader_{i:02d}.jpg"}} for i in range(LEADER_FIXTURES)]
+    return _template(url, [
+        _element('leader_strip', _box(20, 20, 1040, 48, alignment='left'), {"leaders": leaders, "spacing": 4}, tag='leaderStrip'),
+        _element('leader_strip', _box(20, 980, 1040, 80, alignment='center'), {"leaders": leaders[:12], "spacing": 8}, tag='leaderStrip'),
+    ])
+
+
+def nested_shapes_template(url):
+    elements = []
+    for i, (shape_type, fit) in enumerate([('ShapeType.circle', 'BoxFit.cover'), ('ShapeType.oval', 'BoxFit.contain'),
+                                           ('ShapeType.rectangle', 'BoxFit.fill'), ('ShapeType.circle', 'BoxFit.fill'),
+                                           ('ShapeType.oval', 'BoxFit.cover'), ('ShapeType.rectangle', 'BoxFit.contain')]):
+        nested = _element('image', {"x_percent": 0, "y_percent": 0, "width_percent": 100, "height_percent": 100, "rotation": 0},
+                          {"url": url + ('photo.jpg', 'logo.png')[i % 2]})
+        elements.append(_element('shape', _box(40 + (i % 3) * 340, 60 + (i // 3) * 420, 320, 260 + (i % 2) * 100),
+                                 {"fillColor": "#FFFFFF", "shapeType": shape_type, "strokeColor": "#CC2200", "strokeWidth": 2 + i},
+                                 tag='keyVisual', nested=nested, fit=fit))
+    nested_text = _element('text', {"x_percent": 5, "y_percent": 5, "width_percent": 90, "height_percent": 90, "rotation": 0},
+                           _text({'hi-IN': HINDI_COPY}), _style(color="#202020", font_size=5, text_align='center'))
+    elements.append(_element('shape', _box(340, 900, 400, 160), {"fillColor": "#FFE08A", "shapeType": "ShapeType.oval"},
+                             tag='keyVisual', nested=nested_text))
+    return _template(url, elements)
+
+
+def rotated_template(url):
+    elements = []
+    for i in range(4):
+        elements.append(_element('image', _box(80 + i * 240, 120, 200, 260, rotation=-30 + i * 20), {"url": url + 'photo.jpg'}))
+        elements.append(_element('shape', _box(80 + i * 240, 480, 200, 120, rotation=15 + i * 25),
+                                 {"fillColor": "#3366CCCC", "shapeType": ('ShapeType.rectangle', 'ShapeType.oval')[i % 2], "strokeColor": "#FFFFFF", "strokeWidth": 3}))
+        elements.append(_element('text', _box(60 + i * 240, 700, 240, 160, rotation=-10 + i * 7),
+                                 _text({'hi-IN': HINDI_COPY}), _style(color="#ffffff", font_size=2.5, text_align='center')))
+    return _template(url, elements)
+
+
+def shadows_template(url):
+    elements = []
+    for i in range(6):
+        elements.append(_element('shape', _box(60 + (i % 3) * 340, 80 + (i // 3) * 300, 280, 220),
+                                 {"fillColor": ("#FFFFFF", "#F5C518", "#2E86AB")[i % 3], "shapeType": ('ShapeType.rectangle', 'ShapeType.circle')[i % 2],
+                                  "strokeColor": "#00000000", "strokeWidth": 0},
+                                 _style(box_shadow=_shadow(4 + i * 4, spread=i % 3 * 2)), tag='keyVisual'))
+    elements.append(_element('image', _box(120, 700, 360, 300), {"url": url + 'logo.png'},
+                             _style(imageFit='BoxFit.contain', box_shadow=_shadow(16))))
+    elements.append(_element('text', _box(520, 700, 500, 300), _text({'hi-IN': HINDI_COPY}),
+                             _style(color="#ffffff", font_size=3.5, text_align='center', text_shadow=_shadow(6, offset=3, color="#000000"))))
+    return _template(url, elements)
+
+
+def large_base_template(url):
+    return _template(url, [
+        _element('image', _box(680, 60, 340, 420), {"url": url + 'photo.jpg'}, tag='userPicture'),
+        _element('text', _box(60, 860, 960, 160, alignment='center'), _text({'hi-IN': HINDI_COPY}),
+                 _style(color="#ffffff", font_size=3, text_align='center'), tag='userName'),
+    ], base_image='base_large.jpg')
+
+
+def simple_card_template(url):
+    return _template(url, [
+        _element('image', _box(60, 60, 300, 300), {"url": url + 'photo.jpg'}, tag='userPicture'),
+        _element('text', _box(60, 900, 960, 100, alignment='center'), _text({'hi-IN': HINDI_COPY.split('।')[0]}),
+                 _style(color="#ffffff", font_size=4), tag='userName'),
+    ])
+
+
+def localize_urls(value, url, fixture_names):
+    """Copy of a template with every image URL replaced by a fixture URL, assigned in traversal order."""
+    counter = [0]
+
+    def visit(value):
+        if isinstance(value, dict):
+            localized = {}
+            for key, item in value.items():
+                if key in ('url', 'base_image_url') and isinstance(item, str) and item:
+                    localized[key] = url + ('base.jpg' if key == 'base_image_url' else fixture_names[counter[0] % len(fixture_names)])
+                    counter[0] += key == 'url'
+                else:
+                    localized[key] = visit(item)
+            return localized
+        if isinstance(value, list):
+            return [visit(item) for item in value]
+        return value
+
+    return visit(value)
+
+
+def real_template(path, url):
+    with open(path, 'r', encoding='utf-8') as f:
+        json_data = json.load(f)
+    json_data.setdefault('original_width', 1080) # The CLI takes the size from --base_image_url when the template has none
+    json_data.setdefault('original_height', 1080)
+    json_data.setdefault('base_image_url', 'base.jpg')
+    fixtures = ['photo.jpg', 'logo.png'] + [f'leader_{i:02d}.jpg' for i in range(LEADER_FIXTURES)]
+    return localize_urls(json_data, url, fixtures)
+
+
+# name -> (template builder, language, render scale)
+SYNTHETIC_CASES = {
+    'text_indic': (text_indic_template, 'hi-IN', None),
+    'leader_strip_20': (leader_strip_template, 'hi-IN', None),
+    'nested_masked_shapes': (nested_shapes_template, 'hi-IN', None),
+    'rotated': (rotated_template, 'hi-IN', None),
+    'box_shadows': (shadows_template, 'hi-IN', None),
+    'large_base_image': (large_base_template, 'hi-IN', None),
+    'large_base_thumbnail': (large_base_template, 'hi-IN', 0.25),
+    'simple_card': (simple_card_template, 'hi-IN', None),
+    'simple_card_thumbnail': (simple_card_template, 'hi-IN', 0.25),
+}
+
+
+def benchmark_cases(url, template_paths):
+    """Yields (name, template dict, language, scale) for the synthetic cases and each real template."""
+    for name, (builder, lang, scale) in SYNTHETIC_CASES.items():
+        yield name, builder(url), lang, scale
+    for path in template_paths:
+        json_data = real_template(path, url)
+        lang = (json_data.get('language_settings') or {}).get('current_language', 'en-IN')
+        yield os.path.splitext(os.path.basename(path))[0], json_data, lang, None
+
+
+# --- Measurement ---
+
+def time_phase(fn, runs, warmup, setup=None):
+    """Times fn(setup()) runs times after warmup untimed calls. Returns (timing summary, last result)."""
+    result = None
+    samples = []
+    for i in range(warmup + runs):
+        argument = setup() if setup else None
+        started = time.perf_counter()
+        result = fn(argument)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if i >= warmup:
+            samples.append(elapsed_ms)
+    return {
+        'runs': len(samples),
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }, result
+
+
+def backend_functions(backend):
+    """The per-phase entry points of a backend, imported lazily."""
+    from fitted_images import FITTED_IMAGES
+    from prefetch import prefetch_images
+    from static_layers import STATIC_LAYERS
+    if backend == 'pil':
+        import generate_thumbnail as pil
+        from image_encoding import encode_pil_image
+        return {
+            'compile': pil.compile_pil_template,
+            'decode': pil.decode_pil_image,
+            'render': pil.render_languages,
+            'create': pil.create_image_from_json,
+            'encode': lambda image: encode_pil_image(image, 'png'),
+            'to_pil': lambda image: image,
+            'prefetch': prefetch_images,
+            'static_layers': STATIC_LAYERS,
+            'fitted_images': FITTED_IMAGES,
+        }
+    import generate_thumbnial_skia as skia_backend
+    return {
+        'compile': skia_backend.compile_skia_template,
+        'decode': skia_backend.decode_skia_image,
+        'render': skia_backend.render_languages_skia,
+        'create': skia_backend.create_image_from_json_skia,
+        'encode': lambda image: skia_backend.encode_skia_image(image, 'png'),
+        'to_pil': skia_backend.skia_image_to_pil,
+        'prefetch': prefetch_images,
+        'static_layers': STATIC_LAYERS,
+        'fitted_images': FITTED_IMAGES,
+    }
+
+
+def benchmark_backend(backend, json_data, lang, scale, font_dir, work_dir, runs, warmup):
+    """Times every phase of one case on one backend. Returns (phase timings, drawn PIL image)."""
+    from display_list import node_image_urls
+    from geometry import scaled_size
+    from reduced_decode import image_decode_hints
+
+    functions = backend_functions(backend)
+    json_data = copy.deepcopy(json_data)
+    json_data['language_settings']['current_language'] = lang
+    phases = {}
+
+    phases['compile'], template = time_phase(lambda _: functions['compile'](json_data, font_dir), runs, warmup)
+    nodes, cull_report = template.visible_nodes(scale or 1.0)
+    base_image_url = None if cull_report['base_image_occluded'] else template.base_image_url
+    urls = node_image_urls(nodes, base_image_url)
+    phases['fetch'], encoded = time_phase(lambda _: functions['prefetch'](urls, lambda data: data), runs, warmup)
+    failed = {url: value for url, value in encoded.items() if isinstance(value, Exception)}
+    if failed:
+        raise RuntimeError(f"Fixture fetch failed: {failed}")
+    hints = image_decode_hints(nodes, base_image_url, *scaled_size(template.width, template.height, scale or 1.0), scale or 1.0)
+    phases['decode'], assets = time_phase(lambda _: {url: functions['decode'](data, hints.get(url)) for url, data in encoded.items()}, runs, warmup)
+
+    def draw(_):
+        for _lang, image in functions['render'](template, [lang], scale=scale, static_split='none', assets=assets):
+            return image
+    phases['draw'], image = time_phase(draw, runs, warmup, setup=functions['fitted_images'].clear)
+    phases['encode'], _encoded = time_phase(lambda _: functions['encode'](image), runs, warmup)
+
+    output_path = os.path.join(work_dir, f"total_{backend}.png")
+
+    def fresh_template():
+        functions['static_layers'].clear()
+        functions['fitted_images'].clear()
+        return copy.deepcopy(json_data)
+    phases['total'], _path = time_phase(lambda fresh: functions['create'](fresh, output_path, font_dir, scale=scale), runs, warmup, setup=fresh_template)
+    return phases, functions['to_pil'](image).convert('RGBA')
+
+
+def image_difference(image, reference, tolerance=DEFAULT_TOLERANCE):
+    """{'max_diff', 'diff_pixels'} between two RGBA images; pixels differing by more than tolerance in any channel count."""
+    if image.size != reference.size:
+        return {'size': list(image.size), 'reference_size': list(reference.size)}
+    difference = ImageChops.difference(image.convert('RGBA'), reference.convert('RGBA'))
+    per_pixel = functools.reduce(ImageChops.lighter, difference.split())
+    histogram = per_pixel.histogram()
+    return {'max_diff': per_pixel.getextrema()[1], 'diff_pixels': sum(histogram[tolerance + 1:])}
+
+
+def check_golden(image, golden_path, tolerance, update):
+    """Compares image with the golden PNG (writing it first with update). Returns a parity dict with a 'status'."""
+    if update:
+        os.makedirs(os.path.dirname(golden_path), exist_ok=True)
+        image.save(golden_path)
+        return {'status': 'updated', 'golden': golden_path}
+    if not os.path.exists(golden_path):
+        return {'status': 'missing', 'golden': golden_path}
+    with Image.open(golden_path) as golden:
+        parity = image_difference(image, golden, tolerance)
+    parity['status'] = 'match' if parity.get('diff_pixels') == 0 else 'mismatch'
+    parity['golden'] = golden_path
+    return parity
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """Phases whose median got slower than in baseline by more than threshold (and MIN_REGRESSION_MS)."""
+    regressions = []
+    for case, case_result in results['cases'].items():
+        for backend, backend_result in case_result['backends'].items():
+            base_phases = baseline.get('cases', {}).get(case, {}).get('backends', {}).get(backend, {}).get('phases', {})
+            for phase, timing in backend_result['phases'].items():
+                base_median = (base_phases.get(phase) or {}).get('median_ms')
+                if not base_median:
+                    continue
+                median = timing['median_ms']
+                if median > base_median * (1 + threshold) and median - base_median >= MIN_REGRESSION_MS:
+                    regressions.append({'case': case, 'backend': backend, 'phase': phase, 'baseline_ms': base_median,
+                                        'median_ms': median, 'ratio': round(median / base_median, 3)})
+    return regressions
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    try:
+        import skia
+        skia_version = skia.__version__
+    except ImportError:
+        skia_version = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'pillow': Image.__version__, 'skia': skia_version}
+
+
+def run_benchmarks(template_paths, font_dir, golden_dir, runs=DEFAULT_RUNS, warmup=DEFAULT_WARMUP, backends=BACKENDS,
+                   case_filter=None, tolerance=DEFAULT_TOLERANCE, update_golden=False, fixture_dir=None):
+    """Runs every case on every backend and returns the results dict (see the module header)."""
+    results = {
+        'schema': RESULTS_SCHEMA,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': environment_info(),
+        'settings': {'runs': runs, 'warmup': warmup, 'tolerance': tolerance, 'backends': list(backends)},
+        'cases': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='poster_bench_') as work_dir:
+        fixture_dir = fixture_dir or os.path.join(work_dir, 'fixtures')
+        write_fixture_images(fixture_dir)
+        with serve_fixtures(fixture_dir) as url:
+            for name, json_data, lang, scale in benchmark_cases(url, template_paths):
+                if case_filter and name not in case_filter:
+                    continue
+                print(f"Benchmarking {name} ({lang}, scale {scale or 1.0})...", file=sys.stderr)
+                # Template features, for fitting the backend routing (backend_routing.py calibrate)
+                profile = profile_template(compile_template(json_data, font_dir), lang, scale or 1.0)
+                case_result = {'lang': lang, 'scale': scale, 'profile': profile, 'backends': {}}
+                drawn = {}
+                for backend in backends:
+                    try:
+                        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull): # Renderer logs would dominate the timings
+                            phases, drawn[backend] = benchmark_backend(backend, json_data, lang, scale, font_dir, work_dir, runs, warmup)
+                    except Exception as e:
+                        case_result['backends'][backend] = {'error': f"{type(e).__name__}: {e}"}
+                        continue
+                    parity = check_golden(drawn[backend], os.path.join(golden_dir, f"{name}_{backend}.png"), tolerance, update_golden)
+                    case_result['backends'][backend] = {'phases': phases, 'parity': parity}
+                if len(drawn) == 2:
+                    case_result['backend_difference'] = image_difference(drawn['pil'], drawn['skia'], tolerance)
+                results['cases'][name] = case_result
+    return results
+
+
+def format_summary(results):
+    lines = [f"{'case':<24} {'backend':<7} " + " ".join(f"{phase:>9}" for phase in PHASES) + "  parity"]
+    for case, case_result in results['cases'].items():
+        for backend, backend_result in case_result['backends'].items():
+            if 'error' in backend_result:
+                lines.append(f"{case:<24} {backend:<7} error: {backend_result['error']}")
+                continue
+            medians = " ".join(f"{backend_result['phases'][phase]['median_ms']:>9.1f}" for phase in PHASES)
+            parity = backend_result['parity']
+            detail = f" ({parity['diff_pixels']} px, max {parity['max_diff']})" if parity['status'] == 'mismatch' and 'diff_pixels' in parity else ""
+            if parity['status'] == 'missing':
+                detail = " (record it with --update-golden)"
+            lines.append(f"{case:<24} {backend:<7} {medians}  {parity['status']}{detail}")
+    for regression in results.get('regressions', []):
+        lines.append(f"REGRESSION {regression['case']}/{regression['backend']}/{regression['phase']}: "
+                     f"{regression['baseline_ms']:.1f} -> {regression['median_ms']:.1f} ms (x{regression['ratio']})")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmark of the Pillow and Skia poster renderers.")
+    parser.add_argument('--template', action='append', default=None,
+                        help="Real template JSON to include (repeatable; image URLs are replaced by fixtures). Default: sample_content.json")
+    parser.add_argument('--case', action='append', default=None, help='Only run the named case (repeatable)')
+    parser.add_argument('--backend', choices=BACKENDS, action='append', default=None, help='Only run this backend (repeatable)')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help=f'Timed runs per phase (default: {DEFAULT_RUNS})')
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help=f'Untimed runs before timing (default: {DEFAULT_WARMUP})')
+    parser.add_argument('--fonts', default=os.path.join(SCRIPT_DIR, 'assets', 'fonts'), help='Path to font assets directory')
+    parser.add_argument('--golden', default=os.path.join(SCRIPT_DIR, 'benchmark_golden'), help='Directory of golden PNGs (default: benchmark_golden next to this script)')
+    parser.add_argument('--update-golden', action='store_true', help='Write the drawn outputs as the new golden PNGs')
+    parser.add_argument('--tolerance', type=int, default=DEFAULT_TOLERANCE, help=f'Per-channel difference still counted as matching (default: {DEFAULT_TOLERANCE})')
+    parser.add_argument('--fixtures', default=None, help='Directory to write and serve fixture images from (default: a temporary directory)')
+    parser.add_argument('--image-cache', default=None, help='Image cache directory (default: a temporary directory)')
+    parser.add_argument('--output', default='benchmark_results.json', help="Path for the JSON results, or '-' for stdout")
+    parser.add_argument('--baseline', default=None, help='Earlier results JSON to compare medians against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD, help=f'Relative slowdown reported as a regression (default: {DEFAULT_REGRESSION_THRESHOLD})')
+    args = parser.parse_args()
+    if args.runs < 1 or args.warmup < 0:
+        parser.error("--runs must be at least 1 and --warmup at least 0")
+
+    with tempfile.TemporaryDirectory(prefix='poster_bench_cache_') as cache_dir:
+        # Must be set before the image fetcher is first used
+        os.environ['POSTER_IMAGE_CACHE_DIR'] = args.image_cache or cache_dir
+        results = run_benchmarks(args.template or [os.path.join(SCRIPT_DIR, 'sample_content.json')], args.fonts, args.golden,
+                                 runs=args.runs, warmup=args.warmup, backends=args.backend or BACKENDS, case_filter=args.case,
+                                 tolerance=args.tolerance, update_golden=args.update_golden, fixture_dir=args.fixtures)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            results['regressions'] = find_regressions(results, json.load(f), args.threshold)
+
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    print(format_summary(results), file=sys.stderr)
+
+    # A missing golden fails too: a run that compares nothing must not pass as parity
+    parity_failed = any(backend_result.get('parity', {}).get('status') in ('mismatch', 'missing') or 'error' in backend_result
+                        for case_result in results['cases'].values() for backend_result in case_result['backends'].values())
+    sys.exit(1 if parity_failed else 0)
@@ -0,0 +1,224 @@
+import math
+from urllib.parse import urlsplit
+
+from geometry import element_box, scaled_size
+
+# --- Visibility Culling ---
+# Pre-render pass over draw-ordered content_json elements. It drops elements
+# that cannot contribute a pixel: fully transparent ones, ones whose (rotated,
+# shadow-expanded) bounds lie outside the canvas, and ones entirely covered by
+# a later opaque element. It runs before image prefetch, so culled elements
+# never cost a fetch or decode. Decisions are conservative: anything whose
+# appearance depends on decoded pixels or text layout is kept. An image only
+# counts as opaque from its URL; renderers fetch the covering images first
+# (cull_with_fetched_covers) and cull again without any that fail to load.
+
+TEXT_OVERFLOW_FRACTION = 0.5 # Text may overflow its box (fit/centering); pad bounds by this much of the box
+OPAQUE_IMAGE_EXTENSIONS = ('.jpg', '.jpeg') # Formats without alpha: known opaque before decoding
+COVERING_FITS = ('BoxFit.cover', 'BoxFit.fill')
+
+
+def color_alpha_range(hex_color):
+    """(min, max) alpha a hex colour can have in either renderer.
+
+    Pillow reads 8-digit colours as RRGGBBAA, Skia as AARRGGBB, so both bytes are considered.
+    """
+    hex_color = (hex_color or '').lstrip('#')
+    if len(hex_color) in (3, 6):
+        return 255, 255
+    if len(hex_color) == 8:
+        try:
+            alphas = int(hex_color[0:2], 16), int(hex_color[6:8], 16)
+        except ValueError:
+            return 0, 255
+        return min(alphas), max(alphas)
+    return 0, 255
+
+
+def rotated_bounds(x, y, width, height, rotation_degrees):
+    """Axis-aligned (left, top, right, bottom) of a box rotated about its centre."""
+    if not rotation_degrees:
+        return x, y, x + width, y + height
+    angle = math.radians(rotation_degrees)
+    cos_a, sin_a = abs(math.cos(angle)), abs(math.sin(angle))
+    half_w = (width * cos_a + height * sin_a) / 2
+    half_h = (width * sin_a + height * cos_a) / 2
+    center_x, center_y = x + width / 2, y + height / 2
+    return center_x - half_w, center_y - half_h, center_x + half_w, center_y + half_h
+
+
+def _shadow_margin(style):
+    shadow = style.get('box_shadow')
+    if not shadow:
+        return 0
+    offset = max(abs(shadow.get('offsetX', 0.0)), abs(shadow.get('offsetY', 2.0)))
+    return offset + shadow.get('blurRadius', 4.0) + abs(shadow.get('spreadRadius', 0.0))
+
+
+def _leader_strip_bounds(element_data):
+    box = element_data.get('box', {})
+    x, y = box.get('x_px', 0), box.get('y_px', 0)
+    width, height = box.get('width_px', 0), box.get('height_px', 0)
+    content = element_data.get('content') or {}
+    leaders = content.get('leaders') or []
+    spacing = content.get('spacing', 8.0)
+    total_width = len(leaders) * height + max(len(leaders) - 1, 0) * spacing
+    alignment = box.get('alignment', 'left')
+    if alignment == 'left':
+        start_x = x
+    elif alignment == 'right':
+        start_x = x + width - total_width
+    else:
+        start_x = x + (width - total_width) / 2
+    return min(x, start_x), y, max(x + width, start_x + total_width), y + height
+
+
+def element_draw_bounds(element_data, canvas_width, canvas_height):
+    """Conservative canvas-space bounds of everything an element can draw."""
+    if element_data.get('type') == 'leader_strip':
+        return _leader_strip_bounds(element_data)
+    box = element_data.get('box', {})
+    style = element_data.get('style') or {}
+    x, y, width, height = element_box(box, canvas_width, canvas_height)
+    pad = _shadow_margin(style)
+    if element_data.get('type') == 'text':
+        pad = max(pad, TEXT_OVERFLOW_FRACTION * max(width, height))
+    left, top, right, bottom = rotated_bounds(x, y, max(1, width), max(1, height), box.get('rotation', 0))
+    return left - pad, top - pad, right + pad, bottom + pad
+
+
+def opaque_cover_rect(element_data, canvas_width, canvas_height, render_scale=1.0):
+    """Output-pixel rect (left, top, right, bottom) the element paints fully opaque in both renderers, or None."""
+    box = element_data.get('box', {})
+    style = element_data.get('style') or {}
+    content = element_data.get('content') or {}
+    el_type = element_data.get('type')
+    if box.get('rotation', 0) or style.get('opacity', 1.0) < 1.0:
+        return None
+    inset = 0
+    if el_type == 'shape':
+        if content.get('shapeType') not in (None, 'ShapeType.rectangle'):
+            return None
+        if color_alpha_range(content.get('fillColor', '#00000000'))[0] < 255:
+            return None
+        stroke_width = float(content.get('strokeWidth', 0) or 0)
+        if stroke_width > 0 and color_alpha_range(content.get('strokeColor', '#00000000'))[0] < 255:
+            inset = math.ceil(stroke_width * render_scale) + 1 # Pillow writes a translucent outline over the fill
+    elif el_type == 'image':
+        url_path = urlsplit(content.get('url') or '').path.lower()
+        if not url_path.endswith(OPAQUE_IMAGE_EXTENSIONS):
+            return None
+        if style.get('imageFit', 'BoxFit.contain') not in COVERING_FITS:
+            return None
+    else:
+        return None
+    x, y, width, height = (v * render_scale for v in element_box(box, canvas_width, canvas_height))
+    # Skia fully covers the pixels inside the exact rect; Pillow truncates position and size separately
+    left = max(math.ceil(x), int(x)) + inset
+    top = max(math.ceil(y), int(y)) + inset
+    right = min(math.floor(x + width), int(x) + int(width)) - inset
+    bottom = min(math.floor(y + height), int(y) + int(height)) - inset
+    if left >= right or top >= bottom:
+        return None
+    return left, top, right, bottom
+
+
+def invisible_reason(element_data):
+    """Why an element draws nothing regardless of position, or None."""
+    style = element_data.get('style') or {}
+    content = element_data.get('content') or {}
+    el_type = element_data.get('type')
+    if el_type == 'leader_strip':
+        return None if content.get('leaders') else 'empty'
+    if style.get('opacity', 1.0) <= 0:
+        return 'transparent'
+    if el_type == 'image' and not content.get('url'):
+        return 'empty'
+    if el_type == 'shape':
+        nested_content_data = element_data.get('nested_content')
+        has_nested = bool(nested_content_data and nested_content_data.get('content'))
+        fill_visible = color_alpha_range(content.get('fillColor', '#00000000'))[1] > 0
+        stroke_visible = float(content.get('strokeWidth', 0) or 0) > 0 and color_alpha_range(content.get('strokeColor', '#00000000'))[1] > 0
+        if not (has_nested or fill_visible or stroke_visible or style.get('box_shadow')):
+            return 'transparent'
+    return None
+
+
+def _contains(outer, inner):
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+
+def _image_url(element):
+    return (element.get('content') or {}).get('url') if element.get('type') == 'image' else None
+
+
+def cull_elements(elements, canvas_width, canvas_height, render_scale=1.0, unavailable_urls=frozenset()):
+    """Filters draw-ordered elements down to those that can affect the output.
+
+    Bounds are template pixels; occlusion is decided in output pixels at render_scale.
+    Images at unavailable_urls (failed to fetch or decode) cover nothing.
+    Returns (visible_elements, report) where report is
+    {'skipped': [(index, type, tag, reason), ...], 'base_image_occluded': bool,
+     'cover_urls': [image URLs whose covering hid an element or the base image]}.
+    """
+    output_rect = (0, 0) + scaled_size(canvas_width, canvas_height, render_scale)
+    covers = [] # (opaque output rect, image URL or None) of elements above the one being examined
+    cover_urls = {}
+    kept = []
+    skipped = []
+    for idx in range(len(elements) - 1, -1, -1): # Top-most first, so covers only come from later elements
+        element = elements[idx]
+        reason = invisible_reason(element)
+        if reason is None:
+            left, top, right, bottom = element_draw_bounds(element, canvas_width, canvas_height)
+            if right <= 0 or bottom <= 0 or left >= canvas_width or top >= canvas_height:
+                reason = 'offscreen'
+            else:
+                # Output pixels the element may touch, with a pixel of slack for rounding
+                touched = (max(math.floor(left * render_scale) - 1, 0), max(math.floor(top * render_scale) - 1, 0),
+                           min(math.ceil(right * render_scale) + 1, output_rect[2]), min(math.ceil(bottom * render_scale) + 1, output_rect[3]))
+                covering = [url for cover, url in covers if _contains(cover, touched)]
+                if covering:
+                    reason = 'occluded'
+                    cover_urls.update(dict.fromkeys(url for url in covering if url))
+        if reason:
+            skipped.append((idx, element.get('type'), element.get('tag'), reason))
+            continue
+        kept.append(element)
+        if _image_url(element) in unavailable_urls:
+            continue
+        cover = opaque_cover_rect(element, canvas_width, canvas_height, render_scale)
+        if cover:
+            covers.append((cover, _image_url(element)))
+    kept.reverse()
+    skipped.reverse()
+    covering = [url for cover, url in covers if _contains(cover, output_rect)]
+    cover_urls.update(dict.fromkeys(url for url in covering if url))
+    return kept, {'skipped': skipped, 'base_image_occluded': bool(covering), 'cover_urls': list(cover_urls)}
+
+
+def cull_with_fetched_covers(template, render_scale, assets, prefetch):
+    """template.visible_nodes(render_scale), with every image that hides something known to load.
+
+    prefetch(urls) returns {url: decoded image or Exception} (see prefetch.prefetch_images);
+    the covering images are fetched into assets, and while one fails the template
+    is culled again without it, so a missing image cannot blank what is under it.
+    """
+    unavailable = frozenset()
+    while True:
+        nodes, report = template.visible_nodes(render_scale, unavailable)
+        missing = [url for url in report['cover_urls'] if url not in assets]
+        if missing:
+            assets.update(prefetch(missing))
+        failed = frozenset(url for url in report['cover_urls'] if assets[url] is None or isinstance(assets[url], Exception))
+        if not failed:
+            return nodes, report
+        print(f"Covering image(s) failed to load; culling again without them: {', '.join(sorted(failed))}")
+        unavailable |= failed
+
+
+def log_cull_report(report):
+    for idx, el_type, tag, reason in report['skipped']:
+        print(f"Skipping element {idx} type: {el_type}, tag: {tag} ({reason})")
+    if report['base_image_occluded']:
+        print("Skipping base image (fully covered by an opaque element)")
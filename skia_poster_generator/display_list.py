@@ -0,0 +1,248 @@
+import os
+
+from culling import cull_elements
+from geometry import element_box
+from prefetch import iter_element_image_urls
+
+# --- Display List ---
+# Compiles a template's raw JSON into typed nodes once, so renders stop
+# re-parsing dicts per element, per language and per call. Top-level elements
+# form a list; a shape's nested content is its own node in Node.nested, with
+# geometry relative to the parent box. Nodes hold geometry resolved to template
+# pixels, colours parsed to (r, g, b, a) tuples, font paths, the image
+# URLs they draw and whether they show localized text. Both renderers draw from
+# the same nodes; each memoizes its backend font handles on the text node.
+#
+# A CompiledTemplate is immutable apart from those caches and is safe to reuse
+# for any number of languages and renders.
+
+
+def parse_hex_color(hex_color):
+    """(r, g, b, a) for a #RGB, #RRGGBB or #RRGGBBAA colour, or None if it is missing or invalid."""
+    hex_color = (hex_color or '').lstrip('#')
+    if len(hex_color) == 3: # Expand shorthand hex (e.g., #03F to #0033FF)
+        hex_color = "".join([c*2 for c in hex_color])
+    try:
+        if len(hex_color) == 6:
+            return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4)) + (255,)
+        if len(hex_color) == 8:
+            return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4, 6))
+    except ValueError:
+        pass
+    return None
+
+
+def with_opacity(rgba, opacity=1.0):
+    """Modulates a parsed colour's alpha by opacity, as the renderers always have (truncating)."""
+    r, g, b, a = rgba
+    return (r, g, b, int((a / 255.0) * opacity * 255))
+
+
+def compile_color(hex_color, opacity=1.0, default=(0, 0, 0, 0)):
+    rgba = parse_hex_color(hex_color)
+    if rgba is None:
+        if hex_color:
+            print(f"Warning: Invalid hex color format: {hex_color}. Defaulting to transparent.")
+        return default
+    return with_opacity(rgba, opacity)
+
+
+class ShadowSpec:
+    """A box or text shadow with its colour parsed."""
+    __slots__ = ('color', 'offset_x', 'offset_y', 'blur_radius', 'spread_radius')
+
+    def __init__(self, shadow_data):
+        self.color = compile_color(shadow_data.get('color', '#000000'))
+        self.offset_x = shadow_data.get('offsetX', 0.0)
+        self.offset_y = shadow_data.get('offsetY', 2.0)
+        self.blur_radius = shadow_data.get('blurRadius', 4.0)
+        self.spread_radius = shadow_data.get('spreadRadius', 0.0)
+
+
+def compile_shadow(shadow_data):
+    return ShadowSpec(shadow_data) if shadow_data else None
+
+
+class Node:
+    """An element with resolved geometry. Unknown element types compile to a plain Node and draw nothing."""
+    __slots__ = ('kind', 'tag', 'z_index', 'x', 'y', 'width', 'height', 'rotation', 'opacity',
+                 'nested', 'nested_fit', 'language_dependent', 'image_urls', 'element')
+
+    def __init__(self, element_data, x, y, width, height, nested=None):
+        box = element_data.get('box') or {}
+        style = element_data.get('style') or {}
+        nested_content_data = element_data.get('nested_content') or {}
+        self.kind = element_data.get('type')
+        self.tag = element_data.get('tag')
+        self.z_index = element_data.get('z_index')
+        self.x, self.y, self.width, self.height = x, y, width, height
+        self.rotation = box.get('rotation', 0)
+        self.opacity = style.get('opacity', 1.0)
+        self.nested = nested
+        self.nested_fit = nested_content_data.get('contentFit', 'BoxFit.contain')
+        self.language_dependent = self.kind == 'text' or bool(nested and nested.language_dependent)
+        self.image_urls = tuple(iter_element_image_urls(element_data))
+        self.element = element_data # Source dict, for culling and logging
+
+
+class ImageNode(Node):
+    __slots__ = ('url', 'fit', 'shadow')
+
+    def __init__(self, element_data, *args, **kwargs):
+        super().__init__(element_data, *args, **kwargs)
+        style = element_data.get('style') or {}
+        self.url = (element_data.get('content') or {}).get('url')
+        self.fit = style.get('imageFit', 'BoxFit.contain')
+        self.shadow = compile_shadow(style.get('box_shadow'))
+
+
+class ShapeNode(Node):
+    __slots__ = ('shape_type', 'fill', 'stroke', 'stroke_width', 'shadow')
+
+    def __init__(self, element_data, *args, **kwargs):
+        super().__init__(element_data, *args, **kwargs)
+        content = element_data.get('content') or {}
+        self.shape_type = content.get('shapeType')
+        self.fill = compile_color(content.get('fillColor', '#00000000'))
+        self.stroke_width = float(content.get('strokeWidth', 0) or 0)
+        self.stroke = compile_color(content.get('strokeColor', '#00000000')) if self.stroke_width > 0 else None
+        self.shadow = compile_shadow((element_data.get('style') or {}).get('box_shadow'))
+
+    @property
+    def is_rectangle(self):
+        return self.shape_type in (None, "ShapeType.rectangle")
+
+    @property
+    def is_oval(self):
+        return self.shape_type in ("ShapeType.circle", "ShapeType.oval")
+
+
+class TextNode(Node):
+    __slots__ = ('content', 'color', 'faded_color', 'font_size_vw', 'font_family', 'font_path', 'font_weight',
+                 'italic', 'underlined', 'box_alignment', 'text_align', 'vertical_align', 'line_height',
+                 'has_text_shadow', 'text_shadow', 'fonts')
+
+    def __init__(self, element_data, *args, font_asset_path="assets/fonts", **kwargs):
+        super().__init__(element_data, *args, **kwargs)
+        style = element_data.get('style') or {}
+        content = element_data.get('content')
+        self.content = content if isinstance(content, dict) else {}
+        color = style.get('color', '#000000')
+        self.color = compile_color(color)
+        self.faded_color = compile_color(color, self.opacity) # Colour with the element opacity folded in
+        self.font_size_vw = style.get('font_size', 4.0)
+        self.font_family = style.get('font_family', 'English')
+        self.font_path = f"{font_asset_path}/{self.font_family}.ttf"
+        self.font_weight = style.get('font_weight', 'FontWeight.w400')
+        self.italic = style.get('is_italic', False)
+        self.underlined = style.get('is_underlined', False)
+        self.box_alignment = (element_data.get('box') or {}).get('alignment')
+        self.text_align = style.get('text_align')
+        self.vertical_align = style.get('text_vertical_align', 'center')
+        line_height = style.get('line_height')
+        self.line_height = line_height if isinstance(line_height, (int, float)) and line_height > 0 else None
+        # The Skia renderer draws a (possibly null) text_shadow pass whenever the key is present
+        self.has_text_shadow = 'text_shadow' in style
+        self.text_shadow = compile_shadow(style.get('text_shadow'))
+        self.fonts = {} # Backend font handles, memoized by the renderers
+
+    def text_for(self, language, default_language_code):
+        """The text to draw for language, falling back to the default language, 'fallback' and 'text'."""
+        text_to_render = ""
+        lang_content = self.content.get(language) or self.content.get(default_language_code) or self.content.get('fallback')
+        if isinstance(lang_content, dict):
+            text_to_render = lang_content.get('text', "")
+        elif isinstance(lang_content, str):
+            text_to_render = lang_content
+        if not text_to_render and 'text' in self.content:
+            text_to_render = self.content['text']
+        return text_to_render
+
+
+class LeaderStripNode(Node):
+    __slots__ = ('leader_urls', 'spacing', 'alignment')
+
+    def __init__(self, element_data, *args, **kwargs):
+        super().__init__(element_data, *args, **kwargs)
+        content = element_data.get('content') or {}
+        self.leader_urls = [(leader.get('content') or {}).get('url') for leader in content.get('leaders') or []]
+        self.spacing = content.get('spacing', 8.0)
+        self.alignment = (element_data.get('box') or {}).get('alignment', 'left')
+
+
+NODE_TYPES = {'image': ImageNode, 'shape': ShapeNode, 'text': TextNode, 'leader_strip': LeaderStripNode}
+
+
+def compile_element(element_data, parent_width, parent_height, font_asset_path="assets/fonts"):
+    """Compiles one element (and its nested content) against a parent of the given template size."""
+    box = element_data.get('box') or {}
+    if element_data.get('type') == 'leader_strip': # Leader strips are laid out in absolute pixels only
+        x, y, width, height = box.get('x_px', 0), box.get('y_px', 0), box.get('width_px', 0), box.get('height_px', 0)
+    else:
+        x, y, width, height = element_box(box, parent_width, parent_height)
+    nested = None
+    nested_content_data = element_data.get('nested_content')
+    if nested_content_data and nested_content_data.get('content'):
+        nested = compile_element(nested_content_data['content'], max(1, width), max(1, height), font_asset_path)
+    node_type = NODE_TYPES.get(element_data.get('type'), Node)
+    if node_type is TextNode:
+        return TextNode(element_data, x, y, width, height, nested=nested, font_asset_path=font_asset_path)
+    return node_type(element_data, x, y, width, height, nested=nested)
+
+
+class CompiledTemplate:
+    """A template compiled to a draw-ordered display list."""
+    __slots__ = ('width', 'height', 'base_image_url', 'language_settings', 'language_font_families',
+                 'font_asset_path', 'nodes', 'bound_tags', '_visible')
+
+    def __init__(self, width, height, base_image_url, language_settings, font_asset_path, nodes, bound_tags=frozenset()):
+        self.width = width
+        self.height = height
+        self.base_image_url = base_image_url
+        self.language_settings = language_settings
+        self.language_font_families = {
+            lang.get('code'): lang.get('fontFamily', 'English')
+            for lang in language_settings.get('enabled_languages', []) or []
+        }
+        self.font_asset_path = font_asset_path
+        self.nodes = nodes
+        self.bound_tags = bound_tags # Tags whose content is replaced per render (mail merge); always dynamic
+        self._visible = {} # (render_scale, unavailable image URLs) -> (nodes, cull report)
+
+    def language_font_family(self, lang_code):
+        return self.language_font_families.get(lang_code, 'English')
+
+    def visible_nodes(self, render_scale=1.0, unavailable_urls=frozenset()):
+        """(nodes, cull report) for a render at render_scale; see culling.cull_elements."""
+        key = (render_scale, frozenset(unavailable_urls))
+        cached = self._visible.get(key)
+        if cached is None:
+            kept, report = cull_elements([node.element for node in self.nodes], self.width, self.height, render_scale, key[1])
+            kept_ids = {id(element) for element in kept}
+            cached = [node for node in self.nodes if id(node.element) in kept_ids], report
+            self._visible[key] = cached
+        return cached
+
+
+def node_image_urls(nodes, base_image_url=None):
+    """Unique image URLs drawn by nodes (base image first), in first-use order."""
+    urls = [base_image_url] if base_image_url else []
+    for node in nodes:
+        urls.extend(node.image_urls)
+    return list(dict.fromkeys(urls))
+
+
+def compile_template(json_data, font_asset_path="assets/fonts", canvas_width=None, canvas_height=None, sort_by_z=False):
+    """Compiles a template dict into a CompiledTemplate.
+
+    canvas_width/canvas_height override the template's original size. sort_by_z
+    orders elements by z_index (stable); otherwise they are drawn in array order.
+    """
+    if canvas_width is None or canvas_height is None:
+        canvas_width, canvas_height = json_data['original_width'], json_data['original_height']
+    elements = json_data.get('content_json', []) or []
+    if sort_by_z:
+        elements = sorted(elements, key=lambda el: el.get('z_index', 0))
+    nodes = [compile_element(element, canvas_width, canvas_height, font_asset_path) for element in elements]
+    return CompiledTemplate(canvas_width, canvas_height, json_data.get('base_image_url'),
+                            json_data.get('language_settings', {}) or {}, os.fspath(font_asset_path), nodes)
@@ -0,0 +1,58 @@
+from font_cache import SizedLRUCache
+from image_fetch import get_image_fetcher
+from reduced_decode import output_box
+
+# --- Fitted Image Cache ---
+# The same leader photos, party logos and base images are fitted into the same
+# boxes for thousands of posters. Both renderers keep the box-fitted pixels in
+# a process-wide LRU bounded by bytes, keyed by
+#   (backend, SHA-256 of the image bytes, output box w x h, BoxFit, resample filter)
+# so a repeated asset skips the resample, and, when every box it is drawn into
+# this render is cached, prefetch skips decoding it too (see NOT_DECODED in
+# prefetch). The digest comes from the image fetcher, so presigned URLs of the
+# same object and identical images behind different URLs share entries.
+# Images fetched outside the fetcher have no digest and are fitted uncached.
+
+DEFAULT_MAX_FITTED_BYTES = 128 * 1024 * 1024
+
+
+class FittedImage:
+    """Box-fitted pixels of one image (Pillow or skia.Image).
+
+    dst is where they go inside the box, in output pixels (Skia draws them
+    there 1:1); Pillow's apply_box_fit already pads to the full box.
+    """
+    __slots__ = ('image', 'dst', 'nbytes')
+
+    def __init__(self, image, nbytes, dst=None):
+        self.image = image
+        self.nbytes = nbytes
+        self.dst = dst
+
+
+# Shared by every render in this process; images must not be mutated
+FITTED_IMAGES = SizedLRUCache(DEFAULT_MAX_FITTED_BYTES, lambda fitted: fitted.nbytes)
+
+
+def fitted_image_key(backend, digest, box_width, box_height, fit, resample):
+    box_width, box_height = output_box(box_width, box_height)
+    return (backend, digest, round(box_width, 3), round(box_height, 3), fit, resample)
+
+
+def fitted_image(backend, url, box_width, box_height, fit, resample, fit_image):
+    """The FittedImage for url in a box_width x box_height output-pixel box, from the cache or fit_image().
+
+    fit_image decodes and fits the image; a None result is returned but not cached.
+    """
+    digest = get_image_fetcher().content_digest(url)
+    if digest is None:
+        return fit_image()
+    return FITTED_IMAGES.get(fitted_image_key(backend, digest, box_width, box_height, fit, resample), fit_image)
+
+
+def fitted_boxes_cached(backend, resample, url, hint):
+    """True if every box of hint (a reduced_decode.DecodeHint) is cached for url, so it need not be decoded."""
+    digest = get_image_fetcher().content_digest(url)
+    return digest is not None and all(
+        fitted_image_key(backend, digest, box_width, box_height, fit, resample) in FITTED_IMAGES
+        for box_width, box_height, fit in hint.boxes)
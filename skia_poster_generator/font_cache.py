@@ -0,0 +1,174 @@
+import threading
+from collections import OrderedDict
+
+from tracing import ELEMENT, span
+
+# --- Font Registry ---
+# Both renderers resolve fonts through a single process-wide registry so each
+# font file is parsed once per worker instead of once per text element.
+# Backends are imported lazily so the Pillow renderer never pulls in skia.
+# Skia typefaces are keyed by file and face index only: MakeFromFile takes no
+# style, so weight and slant come from the font file itself.
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_SIZED_ENTRIES = 65536 # SizedLRUCache is meant to be bounded by max_bytes
+
+
+class LRUCache:
+    """Thread-safe bounded LRU mapping with hit/miss/eviction counters."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, loader):
+        """Returns the cached value for key, calling loader() on a miss.
+
+        Loader exceptions propagate to the caller and None results are not
+        cached, so a failed load is retried rather than pinned.
+        """
+        value = self.lookup(key)
+        if value is not None:
+            return value
+        value = loader()
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def lookup(self, key):
+        """Returns the cached value for key (counting a hit), or None (counting a miss)."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Stores value as the most recently used entry, evicting the oldest beyond max_entries."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+class SizedLRUCache(LRUCache):
+    """LRUCache bounded by the total size of its values as well, e.g. bytes of pixels.
+
+    sizeof(value) gives a value's size; a value larger than max_bytes is not cached.
+    """
+
+    def __init__(self, max_bytes, sizeof, max_entries=DEFAULT_MAX_SIZED_ENTRIES):
+        super().__init__(max_entries)
+        self.max_bytes = max(1, int(max_bytes))
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._sizes = {}
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self.bytes -= self._sizes.pop(key, 0)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                evicted, _value = self._entries.popitem(last=False)
+                self.bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        """Membership without counting a hit or refreshing recency."""
+        with self._lock:
+            return key in self._entries
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._sizes.clear()
+            self.bytes = 0
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(bytes=self.bytes, max_bytes=self.max_bytes)
+        return stats
+
+
+class FontRegistry(LRUCache):
+    """Bounded LRU cache of parsed fonts/typefaces with hit/miss counters."""
+
+    # --- Pillow ---
+
+    def get_pil_font(self, font_path, size, index=0):
+        """Returns a cached ImageFont.FreeTypeFont. Raises IOError like ImageFont.truetype."""
+        size = max(1, int(size))
+
+        def load():
+            from PIL import ImageFont
+            with span('font_load', ELEMENT, font=font_path, size=size, backend='pil'):
+                return ImageFont.truetype(font_path, size, index=index)
+
+        return self.get(("pil", font_path, index, size), load)
+
+    # --- Skia ---
+
+    def get_skia_typeface(self, font_path, index=0):
+        """Returns a cached skia.Typeface, or None if the file cannot be loaded."""
+
+        def load():
+            import skia
+            with span('font_load', ELEMENT, font=font_path, backend='skia'):
+                return skia.Typeface.MakeFromFile(font_path, index)
+
+        return self.get(("skia-typeface", font_path, index), load)
+
+    def get_skia_font(self, font_path, size, index=0):
+        """Returns a cached anti-aliased, subpixel skia.Font for the typeface at size.
+
+        Callers must treat the returned font as read-only since it is shared.
+        """
+
+        def load():
+            import skia
+            typeface = self.get_skia_typeface(font_path, index) or skia.Typeface.MakeDefault()
+            font = skia.Font(typeface, size)
+            font.setEdging(skia.Font.Edging.kAntiAlias)
+            font.setSubpixel(True)
+            return font
+
+        return self.get(("skia-font", font_path, index, float(size)), load)
+
+
+# Shared by every render in this process (one per worker).
+FONT_REGISTRY = FontRegistry()
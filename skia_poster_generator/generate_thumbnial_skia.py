@@ -1,58 +1,94 @@
 import skia
 import requests
-from io import BytesIO
+from PIL import Image
 import math
 import os
+import threading
 import argparse
 import json
 
+from banded_render import DEFAULT_BAND_HEIGHT, PNGStreamWriter, band_ranges, check_banded_format, nodes_in_band
+from font_cache import FONT_REGISTRY
+from culling import cull_with_fetched_covers, log_cull_report
+from display_list import CompiledTemplate, compile_template, node_image_urls
+from fitted_images import FittedImage, fitted_boxes_cached, fitted_image
+from geometry import resolve_render_scale, scaled_size
+from image_encoding import DEFAULT_QUALITY, OUTPUT_FORMATS, encode_pil_image, format_from_path, output_path_for_format, write_encoded
+from image_fetch import fetch_digests, fetch_image_bytes
+from layers import language_output_path, parse_languages, split_static_prefix
+from output_cache import get_output_cache
+from prefetch import prefetch_images, resolve_image
+from reduced_decode import image_decode_hints, reduction_factor
+from shadow_masks import SHAPES, draw_cached_shadow
+from static_layers import DEFAULT_STATIC_SPLIT, DYNAMIC_TAGS, STATIC_LAYERS, STATIC_SPLITS, assets_complete, split_static_layers, static_layer_key
+from tracing import DEBUG, ELEMENT, add_trace_arguments, configure_tracing_from_args, element_span, span, trace_enabled, trace_event
+from text_wrap import WORD_WRAPPER, LineBox
+
 # --- Skia Helper Functions ---
 
-def hex_to_skia_color(hex_color_str, opacity=1.0):
-    """Converts hex color string (e.g., #RRGGBB or #AARRGGBB) to skia.Color."""
-    if not hex_color_str:
-        return skia.Color(0, 0, 0, 0) # Transparent black for invalid/missing color
-    hex_color = hex_color_str.lstrip('#')
-    if len(hex_color) == 3: # Expand shorthand hex (e.g., #03F to #0033FF)
-        hex_color = "".join([c*2 for c in hex_color])
-
-    if len(hex_color) == 6: # RGB
-        r = int(hex_color[0:2], 16)
-        g = int(hex_color[2:4], 16)
-        b = int(hex_color[4:6], 16)
-        a = int(opacity * 255)
-        return skia.Color(r, g, b, a)
-    elif len(hex_color) == 8: # ARGB (from hex) or RGBA (if alpha is at end)
-        # Assuming standard web RGBA hex if 8 chars, then modulate with opacity
-        # If it were AARRGGBB, Skia would parse it directly with skia.ColorSetARGBFromString
-        try: # Try parsing as AARRGGBB first
-            return skia.ColorSetARGBFromString(f"#{hex_color}") # Skia expects #AARRGGBB
-        except: # Fallback to RGBA parsing
-            r = int(hex_color[0:2], 16)
-            g = int(hex_color[2:4], 16)
-            b = int(hex_color[4:6], 16)
-            a_hex = int(hex_color[6:8], 16)
-            # Modulate the hex alpha with the style's opacity
-            final_alpha = int((a_hex / 255.0) * opacity * 255)
-            return skia.Color(r, g, b, final_alpha)
-    print(f"Warning: Invalid hex color format: {hex_color_str}. Defaulting to transparent.")
-    return skia.Color(0,0,0,0)
-
-
-def get_skia_font_weight(font_weight_str):
-    """Maps Flutter FontWeight string to Skia FontStyle.Weight."""
-    weights = {
-        "FontWeight.w100": skia.FontStyle.kThin_Weight,
-        "FontWeight.w200": skia.FontStyle.kExtraLight_Weight,
-        "FontWeight.w300": skia.FontStyle.kLight_Weight,
-        "FontWeight.w400": skia.FontStyle.kNormal_Weight,
-        "FontWeight.w500": skia.FontStyle.kMedium_Weight,
-        "FontWeight.w600": skia.FontStyle.kSemiBold_Weight,
-        "FontWeight.w700": skia.FontStyle.kBold_Weight,
-        "FontWeight.w800": skia.FontStyle.kExtraBold_Weight,
-        "FontWeight.w900": skia.FontStyle.kBlack_Weight,
-    }
-    return weights.get(font_weight_str, skia.FontStyle.kNormal_Weight)
+SKIA_ENCODED_FORMATS = {
+    'png': skia.EncodedImageFormat.kPNG,
+    'jpeg': skia.EncodedImageFormat.kJPEG,
+    'webp': skia.EncodedImageFormat.kWEBP,
+}
+
+# Colour type of raster surfaces (skia.kN32_ColorType is RGBA in these bindings); images decoded to it draw without swizzling
+SURFACE_COLOR_TYPE = skia.Surface(1, 1).imageInfo().colorType()
+
+
+def decode_skia_image(data, hint=None):
+    """Decodes encoded image bytes into a raster skia.Image, or None if undecodable.
+
+    With a reduced_decode.DecodeHint, images much larger than they are drawn
+    are decoded at reduced size (the codec's scaled decode, then an integer reduction).
+    """
+    if hint is not None:
+        image = _decode_skia_image_scaled(data, hint)
+        if image is not None:
+            return image
+    image = skia.Image.MakeFromEncoded(skia.Data.MakeWithCopy(data))
+    if not image:
+        return None
+    # Force the decode now (on the prefetch thread) rather than lazily at first draw
+    image = image.makeRasterImage()
+    if hint is not None:
+        image = _reduce_skia_image(image, hint.decode_size(image.width(), image.height()))
+    return image
+
+
+def _decode_skia_image_scaled(data, hint):
+    """Decodes straight to a reduced size with the codec, or returns None to fall back to a full decode."""
+    encoded = skia.Data.MakeWithCopy(data) # The codec reads from it until getPixels returns
+    codec = skia.Codec.MakeFromData(encoded)
+    if codec is None or codec.getOrigin() != skia.EncodedOrigin.kTopLeft_EncodedOrigin:
+        return None # EXIF-rotated images are decoded (and rotated) by MakeFromEncoded, then reduced
+    dimensions = codec.dimensions()
+    decode_size = hint.decode_size(dimensions.width(), dimensions.height())
+    if decode_size is None:
+        return None
+    # JPEG decodes in eighths and WebP at any scale; other codecs only at full size
+    for eighths in range(1, 9):
+        scaled = codec.getScaledDimensions(eighths / 8)
+        if scaled.width() >= decode_size[0] and scaled.height() >= decode_size[1]:
+            break
+    info = codec.getInfo().makeWH(scaled.width(), scaled.height()).makeColorType(SURFACE_COLOR_TYPE)
+    if info.alphaType() == skia.AlphaType.kUnpremul_AlphaType:
+        info = info.makeAlphaType(skia.AlphaType.kPremul_AlphaType)
+    bitmap = skia.Bitmap() # Owns the pixels; the image shares them once the bitmap is immutable
+    bitmap.allocPixels(info)
+    if codec.getPixels(info, memoryview(bitmap), bitmap.rowBytes()) != skia.Codec.Result.kSuccess:
+        return None
+    bitmap.setImmutable()
+    return _reduce_skia_image(skia.Image.MakeFromBitmap(bitmap), decode_size)
+
+
+def _reduce_skia_image(image, decode_size):
+    factor = reduction_factor(image.width(), image.height(), decode_size)
+    if factor == 1:
+        return image
+    # Mip-mapped (box filtered) downscale by an integer factor
+    return image.resize(math.ceil(image.width() / factor), math.ceil(image.height() / factor), skia.FilterQuality.kMedium_FilterQuality)
+
 
 def get_skia_text_align(text_align_str, box_alignment=None, is_multiline=False):
     # For multiline text, use text_align_str if provided, otherwise use box_alignment
@@ -118,60 +154,150 @@ def calculate_box_fit_rects(img_width, img_height, target_width, target_height,
         return src_rect, skia.Rect.MakeXYWH(x_offset, 0, final_w, target_height)
 
 
-def get_language_font_family(lang_settings, lang_code):
-    enabled = lang_settings.get('enabled_languages', [])
-    for lang in enabled:
-        if lang.get('code') == lang_code:
-            return lang.get('fontFamily', 'English')
-    return 'English'
+SKIA_RESAMPLE = 'mipmap' # Filter fitted images are resampled with, part of the fitted image cache key
 
 
-def apply_shadow_paint(canvas, paint, shadow_data, stroke_paint=None):
-    """Helper function to apply shadow effects."""
-    if shadow_data is None:
-        return paint, 0, 0
+def fitted_skia_image(assets, url, box_width, box_height, fit, render_scale):
+    """(image, src_rect, dst_rect) to draw the image at url box-fitted into a box_width x box_height output-pixel box.
+
+    The image is the fitted crop pre-scaled to output pixels (mip-mapped), so
+    drawing it is a 1:1 copy; it is cached in fitted_images by content and box.
+    dst_rect is in template pixels (output pixels / render_scale) relative to
+    the box. Returns None if the image could not be decoded.
+
+    In banded drawing the decoded image itself is returned with the source
+    crop, as a box-sized copy could be poster-sized; draw it with
+    fitted_image_paint so it is filtered.
+    """
+    if banded_drawing():
+        image = resolve_image(assets, url, decode_skia_image)
+        if not image:
+            return None
+        src_rect, dst = calculate_box_fit_rects(image.width(), image.height(), box_width, box_height, fit)
+        return image, src_rect, skia.Rect.MakeXYWH(dst.x() / render_scale, dst.y() / render_scale, dst.width() / render_scale, dst.height() / render_scale)
+
+    def fit_image():
+        image = resolve_image(assets, url, decode_skia_image)
+        if not image:
+            return None
+        src_rect, dst_rect = calculate_box_fit_rects(image.width(), image.height(), box_width, box_height, fit)
+        width, height = max(1, round(dst_rect.width())), max(1, round(dst_rect.height()))
+        surface = skia.Surface(width, height)
+        surface.getCanvas().drawImageRect(image, src_rect, skia.Rect.MakeWH(width, height), skia.Paint(FilterQuality=skia.kMedium_FilterQuality))
+        return FittedImage(surface.makeImageSnapshot(), width * height * 4, dst_rect)
+
+    fitted = fitted_image('skia', url, box_width, box_height, fit, SKIA_RESAMPLE, fit_image)
+    if fitted is None:
+        return None
+    dst = fitted.dst
+    dst_rect = skia.Rect.MakeXYWH(dst.x() / render_scale, dst.y() / render_scale, dst.width() / render_scale, dst.height() / render_scale)
+    return fitted.image, skia.Rect.MakeWH(fitted.image.width(), fitted.image.height()), dst_rect
+
 
-    # Extract shadow parameters
-    shadow_color_str = shadow_data.get('color', '#000000')
-    shadow_offset_x = shadow_data.get('offsetX', 0.0)
-    shadow_offset_y = shadow_data.get('offsetY', 2.0)
-    shadow_blur = shadow_data.get('blurRadius', 4.0)
-    shadow_spread = shadow_data.get('spreadRadius', 0.0)
+def fitted_image_paint(paint=None):
+    """paint (or a default one) for drawing a fitted_skia_image, filtered when the image is not pre-fitted."""
+    paint = paint if paint is not None else skia.Paint()
+    if banded_drawing():
+        paint.setFilterQuality(skia.kMedium_FilterQuality)
+    return paint
+
+
+# Offscreen layers (saveLayer / temporary surfaces) allocated by the current render, per thread
+_render_counters = threading.local()
+
+def banded_drawing():
+    """True while the current thread draws a poster band by band (see render_bands_skia)."""
+    return getattr(_render_counters, 'banded', False)
+
+def reset_offscreen_layer_count():
+    _render_counters.offscreen_layers = 0
+
+def count_offscreen_layer():
+    _render_counters.offscreen_layers = offscreen_layer_count() + 1
+
+def offscreen_layer_count():
+    return getattr(_render_counters, 'offscreen_layers', 0)
+
+def save_offscreen_layer(canvas, bounds, paint):
+    """canvas.saveLayer with tight bounds, counted towards the render's offscreen layers."""
+    count_offscreen_layer()
+    return canvas.saveLayer(bounds, paint)
+
+def apply_shadow_paint(canvas, paint, shadow, stroke_paint=None):
+    """Helper function to apply shadow effects from a compiled display_list.ShadowSpec."""
+    if shadow is None:
+        return paint, 0, 0
 
     # Create shadow paint
     shadow_paint = skia.Paint(AntiAlias=True)
-    shadow_paint.setColor(hex_to_skia_color(shadow_color_str))
+    shadow_paint.setColor(skia.Color(*shadow.color))
     
     # Set blur mask filter
-    if shadow_blur > 0:
-        shadow_paint.setMaskFilter(skia.MaskFilter.MakeBlur(skia.kNormal_BlurStyle, shadow_blur/2, True))
+    if shadow.blur_radius > 0:
+        shadow_paint.setMaskFilter(skia.MaskFilter.MakeBlur(skia.kNormal_BlurStyle, shadow.blur_radius/2, True))
     
     # For stroking effects
     if stroke_paint is not None:
         shadow_paint.setStyle(skia.Paint.kStroke_Style)
-        shadow_paint.setStrokeWidth(stroke_paint.getStrokeWidth() + shadow_spread*2)
+        shadow_paint.setStrokeWidth(stroke_paint.getStrokeWidth() + shadow.spread_radius*2)
     else:
         shadow_paint.setStyle(paint.getStyle())
     
-    return shadow_paint, shadow_offset_x, shadow_offset_y
+    return shadow_paint, shadow.offset_x, shadow.offset_y
+
+def draw_box_shadow(canvas, shape, rect, shadow, shadow_paint):
+    """Draws a filled shape's box shadow at rect: blurred ones from the shadow mask cache, others with shadow_paint."""
+    if shadow.blur_radius > 0 and shape in SHAPES and not banded_drawing(): # Masks span the whole shape, not just the band
+        if draw_cached_shadow(canvas, shape, rect.x(), rect.y(), rect.width(), rect.height(), shadow.blur_radius / 2, skia.Color(*shadow.color)):
+            return
+    if shape == 'oval':
+        canvas.drawOval(rect, shadow_paint)
+    elif shape == 'rect':
+        canvas.drawRect(rect, shadow_paint)
+
+def resolve_skia_text_font(node, template, current_language, el_width):
+    """(font_path, skia.Font) for a text node in current_language, memoized on the node per font family."""
+    # The font family comes from the language settings, not the element style
+    font_family_name = template.language_font_family(current_language)
+    resolved = node.fonts.get(('skia', font_family_name))
+    if resolved is not None:
+        return resolved
+
+    initial_font_size_px = max(1.0, (node.font_size_vw / 100.0) * el_width)
+    # Weight and slant come from the font file: typefaces are loaded by path, which takes no style
+    # Try to load italic font variant if needed
+    font_file = f"{font_family_name}{'-Italic' if node.italic else ''}.ttf"
+    actual_font_path = os.path.join(template.font_asset_path, font_file)
+    if not os.path.exists(actual_font_path):
+        actual_font_path = os.path.join(template.font_asset_path, f"{font_family_name}.ttf")
+    try:
+        final_font = FONT_REGISTRY.get_skia_font(actual_font_path, initial_font_size_px)
+    except Exception as e:
+        print(f"Warning: Could not load font '{actual_font_path}': {e}. Using default.")
+        final_font = skia.Font(skia.Typeface.MakeDefault(), initial_font_size_px)
+        final_font.setEdging(skia.Font.Edging.kAntiAlias)
+        final_font.setSubpixel(True)
+    resolved = node.fonts[('skia', font_family_name)] = (actual_font_path, final_font)
+    return resolved
 
-def render_template_element_skia(canvas, element_data, parent_canvas_width, parent_canvas_height, current_language, default_language_code, font_asset_path, lang_settings=None):
+def render_template_element_skia(canvas, node, template, current_language, default_language_code, assets=None, render_scale=1.0):
+    """Renders a single display-list node onto the Skia canvas, traced as a 'raster' span."""
+    with element_span('raster', node):
+        draw_template_element_skia(canvas, node, template, current_language, default_language_code, assets, render_scale)
+
+def draw_template_element_skia(canvas, node, template, current_language, default_language_code, assets=None, render_scale=1.0):
     # Handle leader_strip type first
-    if element_data.get('type') == 'leader_strip':
-        box_data = element_data.get('box', {})
-        x = box_data.get('x_px', 0)
-        y = box_data.get('y_px', 0)
-        width = box_data.get('width_px', 0)
-        height = box_data.get('height_px', 0)
+    if node.kind == 'leader_strip':
+        x, y, width, height = node.x, node.y, node.width, node.height
         
         # Get leaders from content
-        leaders = element_data.get('content', {}).get('leaders', [])
-        if not leaders:
+        leader_urls = node.leader_urls
+        if not leader_urls:
             return
         
         # Calculate spacing and layout
-        horizontal_spacing = element_data.get('content', {}).get('spacing', 8.0)
-        alignment = box_data.get('alignment', 'left')
+        horizontal_spacing = node.spacing
+        alignment = node.alignment
         # Convert alignment to justify_content values
         if alignment == 'left':
             justify_content = 'start'
@@ -182,7 +308,7 @@ def render_template_element_skia(canvas, element_data, parent_canvas_width, pare
         
         # Calculate image size based on height
         image_size = height
-        total_width = len(leaders) * image_size + (len(leaders) - 1) * horizontal_spacing
+        total_width = len(leader_urls) * image_size + (len(leader_urls) - 1) * horizontal_spacing
         
         # Calculate starting x based on justification
         if justify_content == 'center':
@@ -194,20 +320,16 @@ def render_template_element_skia(canvas, element_data, parent_canvas_width, pare
         
         # Draw each leader
         current_x = start_x
-        for leader in leaders:
-            leader_content = leader.get('content', {})
-            image_url = leader_content.get('url')
+        for image_url in leader_urls:
             if not image_url:
                 continue
                 
             try:
-                # Fetch and load the image
-                response = requests.get(image_url, timeout=10)
-                response.raise_for_status()
-                image_data = skia.Data(response.content)
-                image = skia.Image.MakeFromEncoded(image_data)
+                # Load the (prefetched) image, stretched to the leader square
+                fitted = fitted_skia_image(assets, image_url, image_size * render_scale, image_size * render_scale, 'BoxFit.fill', render_scale)
                 
-                if image:
+                if fitted:
+                    image, src_rect, dst_rect = fitted
                     # Create circular clip for the image
                     with skia.AutoCanvasRestore(canvas):
                         # Create circular path
@@ -216,30 +338,26 @@ def render_template_element_skia(canvas, element_data, parent_canvas_width, pare
                         canvas.clipPath(circle_path, skia.ClipOp.kIntersect)
                         
                         # Draw the image
-                        src_rect = skia.Rect.MakeWH(image.width(), image.height())
-                        dst_rect = skia.Rect.MakeXYWH(current_x, y, image_size, image_size)
-                        canvas.drawImageRect(image, src_rect, dst_rect)
+                        canvas.drawImageRect(image, src_rect, dst_rect.makeOffset(current_x, y), fitted_image_paint())
             except Exception as e:
                 print(f"Error loading leader image {image_url}: {e}")
             
             current_x += image_size + horizontal_spacing
         
         return
-    """Renders a single TemplateElement onto the Skia canvas."""
-    box = element_data['box']
-    style = element_data.get('style', {})
-    content = element_data.get('content', {})
-    el_type = element_data['type']
-
-    # Calculate element dimensions and position
-    el_x = box.get('x_px', (box.get('x_percent', 0) / 100.0) * parent_canvas_width)
-    el_y = box.get('y_px', (box.get('y_percent', 0) / 100.0) * parent_canvas_height)
-    el_width = box.get('width_px', (box.get('width_percent', 100) / 100.0) * parent_canvas_width)
-    el_height = box.get('height_px', (box.get('height_percent', 100) / 100.0) * parent_canvas_height)
-    rotation_angle = box.get('rotation', 0)
-
-    # Debug log for element position and size
-    print(f"[DEBUG] Element type: {el_type}, tag: {element_data.get('tag')}, x: {el_x}, y: {el_y}, width: {el_width}, height: {el_height}, rotation: {rotation_angle}")
+    """Renders a single display-list node onto the Skia canvas.
+
+    Geometry is in template pixels; render_scale is the canvas-to-device scale,
+    used to size any offscreen surfaces so they rasterize at output resolution.
+    """
+    el_type = node.kind
+
+    # Element dimensions and position were resolved when the template was compiled
+    el_x, el_y, el_width, el_height = node.x, node.y, node.width, node.height
+    rotation_angle = node.rotation
+
+    if trace_enabled(DEBUG):
+        trace_event('element', tag=node.tag, type=el_type, x=el_x, y=el_y, width=el_width, height=el_height, rotation=rotation_angle)
 
     # Ensure non-zero dimensions for drawing
     el_width = max(1, el_width)
@@ -253,55 +371,38 @@ def render_template_element_skia(canvas, element_data, parent_canvas_width, pare
         canvas.translate(-el_width / 2, -el_height / 2)
 
     paint = skia.Paint(AntiAlias=True)
-    opacity = style.get('opacity', 1.0)
+    opacity = node.opacity
     # General opacity for the layer will be applied at the end using saveLayer if needed
 
     element_rect = skia.Rect.MakeWH(el_width, el_height)
 
     if el_type == 'image':
-        img_url = content.get('url')
+        img_url = node.url
         if img_url:
             try:
-                print(f"Attempting to load image for element: {element_data.get('tag', 'N/A')}, URL: {img_url}")
-                response = requests.get(img_url, timeout=10)
-                response.raise_for_status() # Will raise an HTTPError for bad responses (4xx or 5xx)
-                image_data = skia.Data(response.content)
-                skia_image = skia.Image.MakeFromEncoded(image_data)
-                if skia_image:
-                    print(f"Successfully loaded image: {img_url} (w:{skia_image.width()}, h:{skia_image.height()})")
-                    box_fit_str = style.get('imageFit', 'BoxFit.contain')
-                    src_rect, dst_rect_fitted = calculate_box_fit_rects(
-                        skia_image.width(), skia_image.height(),
-                        el_width, el_height, box_fit_str
-                    )
-                    print(f"[DEBUG] BoxFit: {box_fit_str}, src_rect: {src_rect}, dst_rect: {dst_rect_fitted}")
-                    paint = skia.Paint(AntiAlias=True)
+                fitted = fitted_skia_image(assets, img_url, el_width * render_scale, el_height * render_scale, node.fit, render_scale) # Raises HTTPError for bad responses (4xx or 5xx)
+                if fitted:
+                    box_fit_str = node.fit
+                    skia_image, src_rect, dst_rect_fitted = fitted
+                    if trace_enabled(DEBUG):
+                        trace_event('box_fit', tag=node.tag, fit=box_fit_str, src=str(src_rect), dst=str(dst_rect_fitted))
+                    paint = fitted_image_paint(skia.Paint(AntiAlias=True))
                     paint.setAlphaf(opacity)
                     
                     # Handle box shadow for images
-                    if style.get('box_shadow'):
-                        shadow_paint, shadow_x, shadow_y = apply_shadow_paint(canvas, paint, style['box_shadow'])
-                        # Create a temporary surface for the image with shadow
-                        surface = skia.Surface(int(el_width + abs(shadow_x) * 2), int(el_height + abs(shadow_y) * 2))
-                        shadow_canvas = surface.getCanvas()
-                        
-                        # Draw shadow
-                        shadow_canvas.translate(abs(shadow_x) if shadow_x < 0 else 0, abs(shadow_y) if shadow_y < 0 else 0)
-                        shadow_canvas.drawRect(skia.Rect.MakeXYWH(0, 0, dst_rect_fitted.width(), dst_rect_fitted.height()), shadow_paint)
-                        
-                        # Draw actual image
-                        shadow_canvas.drawImageRect(skia_image, src_rect, dst_rect_fitted, paint)
-                        
-                        # Get the image with shadow
-                        shadow_image = surface.makeImageSnapshot()
-                        
-                        # Draw the combined image+shadow
-                        canvas.drawImage(shadow_image, 
-                                      -abs(shadow_x) if shadow_x < 0 else 0, 
-                                      -abs(shadow_y) if shadow_y < 0 else 0)
-                    else:
-                        # Draw image normally if no shadow
-                        canvas.drawImageRect(skia_image, src_rect, dst_rect_fitted, paint)
+                    if node.shadow:
+                        shadow_paint, shadow_x, shadow_y = apply_shadow_paint(canvas, paint, node.shadow)
+                        # The shadow is a fitted-size rect at the box origin, clipped to the area the
+                        # old per-image shadow surface covered (the box grown by twice the offset)
+                        surface_left = -abs(shadow_x) if shadow_x < 0 else 0
+                        surface_top = -abs(shadow_y) if shadow_y < 0 else 0
+                        canvas.save()
+                        canvas.clipRect(skia.Rect.MakeXYWH(surface_left, surface_top,
+                                                           int((el_width + abs(shadow_x) * 2) * render_scale) / render_scale,
+                                                           int((el_height + abs(shadow_y) * 2) * render_scale) / render_scale))
+                        draw_box_shadow(canvas, 'rect', skia.Rect.MakeWH(dst_rect_fitted.width(), dst_rect_fitted.height()), node.shadow, shadow_paint)
+                        canvas.restore()
+                    canvas.drawImageRect(skia_image, src_rect, dst_rect_fitted, paint)
                 else:
                     print(f"Failed to decode Skia image from URL: {img_url}")
             except requests.exceptions.RequestException as e:
@@ -310,211 +411,152 @@ def render_template_element_skia(canvas, element_data, parent_canvas_width, pare
                 print(f"Generic Exception loading/processing image {img_url}: {e}")
 
     elif el_type == 'shape':
-        shape_type = content.get('shapeType')
-        fill_color_str = content.get('fillColor', '#00000000')
-        stroke_color_str = content.get('strokeColor', '#00000000')
-        stroke_width = float(content.get('strokeWidth', 0))
+        stroke_width = node.stroke_width
 
         # Create shape path
         path = skia.Path()
-        if shape_type == "ShapeType.rectangle" or shape_type is None:
+        if node.is_rectangle:
             path.addRect(element_rect)
-        elif shape_type == "ShapeType.circle" or shape_type == "ShapeType.oval":
+        elif node.is_oval:
             path.addOval(element_rect)
         
-        # Create a temporary surface that includes space for shadow
+        # Shapes draw straight onto the target canvas. The 20px margin the old
+        # per-shape offscreen surface had is kept as a clip so output is unchanged.
         shadow_margin = 20
-        temp_surface = skia.Surface(int(el_width + shadow_margin * 2), int(el_height + shadow_margin * 2))
-        temp_canvas = temp_surface.getCanvas()
-        temp_canvas.clear(skia.ColorTRANSPARENT)
-        
-        # Translate to account for shadow margin
-        temp_canvas.translate(shadow_margin, shadow_margin)
+        canvas.clipRect(skia.Rect.MakeLTRB(-shadow_margin, -shadow_margin, el_width + shadow_margin, el_height + shadow_margin))
         
         # Prepare paint for fill
         fill_paint = skia.Paint(AntiAlias=True, Style=skia.Paint.kFill_Style)
-        fill_paint.setColor(hex_to_skia_color(fill_color_str, 1.0))
+        fill_paint.setColor(skia.Color(*node.fill))
         
         # Prepare paint for stroke
         stroke_paint = None
         if stroke_width > 0:
             stroke_paint = skia.Paint(AntiAlias=True, Style=skia.Paint.kStroke_Style, StrokeWidth=stroke_width)
-            stroke_paint.setColor(hex_to_skia_color(stroke_color_str, 1.0))
+            stroke_paint.setColor(skia.Color(*node.stroke))
         
-        # Handle shadows
-        if style.get('box_shadow'):
-            shadow_paint, shadow_x, shadow_y = apply_shadow_paint(temp_canvas, fill_paint, style['box_shadow'])
-            # Draw shadow
-            temp_canvas.save()
-            temp_canvas.translate(shadow_x, shadow_y)
-            temp_canvas.drawPath(path, shadow_paint)
-            temp_canvas.restore()
+        # Handle shadows (a single blurred draw underneath; needs no isolation)
+        if node.shadow:
+            shadow_paint, shadow_x, shadow_y = apply_shadow_paint(canvas, fill_paint, node.shadow)
+            canvas.save()
+            canvas.translate(shadow_x, shadow_y)
+            draw_box_shadow(canvas, 'rect' if node.is_rectangle else 'oval' if node.is_oval else None, element_rect, node.shadow, shadow_paint)
+            canvas.restore()
         
         # Handle nested content with masking
-        nested_content_data = element_data.get('nested_content')
-        if nested_content_data and nested_content_data.get('content'):
-            # Apply overall element opacity using a layer
-            layer_paint = skia.Paint(Alphaf=opacity)
-            temp_canvas.saveLayer(element_rect, layer_paint)
+        if node.nested:
+            if opacity < 1.0:
+                # Fill, nested content and stroke fade together: isolate them in a tight layer
+                save_offscreen_layer(canvas, element_rect, skia.Paint(Alphaf=opacity))
+            else:
+                canvas.save()
+                canvas.clipRect(element_rect)
             
             # Draw parent shape's fill
             if fill_paint.getAlphaf() > 0:
-                temp_canvas.drawPath(path, fill_paint)
+                canvas.drawPath(path, fill_paint)
             
             # Render nested content within the shape's path
-            temp_canvas.save()
-            temp_canvas.clipPath(path, doAntiAlias=True)
+            canvas.save()
+            canvas.clipPath(path, doAntiAlias=True)
             
-            nested_el_data = nested_content_data['content']
-            render_template_element_skia(temp_canvas, nested_el_data, el_width, el_height, current_language, default_language_code, font_asset_path, lang_settings)
+            render_template_element_skia(canvas, node.nested, template, current_language, default_language_code, assets, render_scale)
             
-            temp_canvas.restore()
+            canvas.restore()
             
             # Draw stroke on top if any
             if stroke_paint:
-                temp_canvas.drawPath(path, stroke_paint)
+                canvas.drawPath(path, stroke_paint)
             
-            temp_canvas.restore()
+            canvas.restore()
         else:
             # No nested content, just draw the shape
             fill_paint.setAlphaf(fill_paint.getAlphaf() * opacity)
             if fill_paint.getAlphaf() > 0:
-                temp_canvas.drawPath(path, fill_paint)
+                canvas.drawPath(path, fill_paint)
             if stroke_paint:
                 stroke_paint.setAlphaf(stroke_paint.getAlphaf() * opacity)
-                temp_canvas.drawPath(path, stroke_paint)
-        
-        # Draw the final result with shadow to the main canvas
-        result_image = temp_surface.makeImageSnapshot()
-        canvas.drawImage(result_image, -shadow_margin, -shadow_margin)
+                canvas.drawPath(path, stroke_paint)
         
     elif el_type == 'text':
-        text_to_render = ""
-        lang_content_map = content # content is the map of languages
-        if isinstance(lang_content_map, dict):
-            lang_specific_content = lang_content_map.get(current_language) or lang_content_map.get(default_language_code) or lang_content_map.get('fallback')
-            if isinstance(lang_specific_content, dict):
-                text_to_render = lang_specific_content.get('text', "")
-            elif isinstance(lang_specific_content, str): # Direct fallback string
-                 text_to_render = lang_specific_content
-            if not text_to_render and 'text' in lang_content_map : # for cases where content is just {"text": "..."}
-                text_to_render = lang_content_map['text']
+        text_to_render = node.text_for(current_language, default_language_code)
         
         if text_to_render:
-            font_color_str = style.get('color', '#000000')
-            font_size_vw = style.get('font_size', 4.0) # Default to 4vw
-            # Use font_family from style if present, else from language settings
-            font_family_name = get_language_font_family(lang_settings, current_language)
-            font_weight_str = style.get('font_weight', 'FontWeight.w400')
-            is_italic = style.get('is_italic', False)
-            is_underlined = style.get('is_underlined', False)
+            font_size_vw = node.font_size_vw # Default to 4vw
+            is_underlined = node.underlined
             # Get text alignment from box and style
-            box_alignment = box.get('alignment')
-            text_align_style = style.get('text_align')
+            box_alignment = node.box_alignment
+            text_align_style = node.text_align
             
             # Check if text is multiline
             lines = text_to_render.split('\n')
             is_multiline = len(lines) > 1
             
             initial_font_size_px = max(1.0, (font_size_vw / 100.0) * el_width)
-            skia_font_weight = get_skia_font_weight(font_weight_str)
-            skia_font_slant = skia.FontStyle.kItalic_Slant if is_italic else skia.FontStyle.kUpright_Slant
-            skia_font_style = skia.FontStyle(skia_font_weight, skia.FontStyle.kNormal_Width, skia_font_slant)
-
-            # Try to load italic font variant if needed
-            font_file = f"{font_family_name}{'-Italic' if is_italic else ''}.ttf"
-            actual_font_path = os.path.join(font_asset_path, font_file)
-            if not os.path.exists(actual_font_path):
-                actual_font_path = os.path.join(font_asset_path, f"{font_family_name}.ttf")
-            print(f"[DEBUG] Text element: '{text_to_render}', font: {actual_font_path}, font_size_vw: {font_size_vw}, initial_font_size_px: {initial_font_size_px}, color: {font_color_str}, align: {text_align_style}")
-            try:
-                typeface = skia.Typeface.MakeFromFile(actual_font_path, 0) or skia.Typeface.MakeDefault()
-            except Exception as e:
-                print(f"Warning: Could not load font '{actual_font_path}': {e}. Using default.")
-                typeface = skia.Typeface.MakeDefault()
-
-            # --- Word wrapping ---
-            def wrap_text(text, font, max_width):
-                words = text.split()
-                lines = []
-                current_line = ''
-                for word in words:
-                    test_line = current_line + (' ' if current_line else '') + word
-                    if font.measureText(test_line) <= max_width:
-                        current_line = test_line
-                    else:
-                        if current_line:
-                            lines.append(current_line)
-                        current_line = word
-                if current_line:
-                    lines.append(current_line)
-                return lines
-
-            # Word wrapping without font size scaling (use specified font size directly)
-            current_font_size_px = initial_font_size_px
-            max_width = el_width
-            final_lines = []
-
-            # Get the line_height multiplier from style, if available
-            json_line_height_multiplier = style.get('line_height')
-            use_custom_line_height = isinstance(json_line_height_multiplier, (int, float)) and json_line_height_multiplier > 0
-
-            temp_font = skia.Font(typeface, current_font_size_px)
-            temp_font.setEdging(skia.Font.Edging.kAntiAlias)
-            temp_font.setSubpixel(True)
-
-            # Wrap text for each paragraph without adjusting font size
-            for para in text_to_render.split('\n'):
-                final_lines.extend(wrap_text(para, temp_font, max_width))
-
-            # Fallback: if wrapping produced no lines but text exists, keep the raw text as a single line
-            if not final_lines and text_to_render:
-                final_lines = [text_to_render]
+            actual_font_path, final_font = resolve_skia_text_font(node, template, current_language, el_width)
+            if trace_enabled(DEBUG):
+                trace_event('text', tag=node.tag, text=text_to_render, font=actual_font_path, font_size_vw=font_size_vw,
+                            font_size_px=initial_font_size_px, align=text_align_style)
+
+            with element_span('layout', node):
+                # --- Word wrapping ---
+                # Word wrapping without font size scaling (use specified font size directly)
+                current_font_size_px = initial_font_size_px
+                max_width = el_width
 
-            # --- End of Word Wrapping ---
+                # line_height multiplier from style, if a positive number was given
+                json_line_height_multiplier = node.line_height
+                use_custom_line_height = json_line_height_multiplier is not None
 
-            final_font = skia.Font(typeface, current_font_size_px)
-            final_font.setEdging(skia.Font.Edging.kAntiAlias)
-            final_font.setSubpixel(True)
-            text_paint = skia.Paint(AntiAlias=True, Color=hex_to_skia_color(font_color_str, opacity))
+                # Wrap each paragraph into line boxes without adjusting font size
+                final_lines = WORD_WRAPPER.wrap(text_to_render, final_font, max_width)
 
-            font_metrics = final_font.getMetrics()
+                # Fallback: if wrapping produced no lines but text exists, keep the raw text as a single line
+                if not final_lines and text_to_render:
+                    final_lines = [LineBox(text_to_render, final_font.measureText(text_to_render))]
+
+                # --- End of Word Wrapping ---
+
+                text_paint = skia.Paint(AntiAlias=True, Color=skia.Color(*node.faded_color))
+
+                font_metrics = final_font.getMetrics()
             
-            final_render_line_height = 0
-            if use_custom_line_height:
-                final_render_line_height = json_line_height_multiplier * current_font_size_px
-            else:
-                final_render_line_height = font_metrics.fDescent - font_metrics.fAscent + font_metrics.fLeading
+                final_render_line_height = 0
+                if use_custom_line_height:
+                    final_render_line_height = json_line_height_multiplier * current_font_size_px
+                else:
+                    final_render_line_height = font_metrics.fDescent - font_metrics.fAscent + font_metrics.fLeading
 
-            # Ensure line height is positive if there are lines to draw
-            if len(final_lines) > 0 and final_render_line_height <= 0:
-                final_render_line_height = current_font_size_px # Fallback
+                # Ensure line height is positive if there are lines to draw
+                if len(final_lines) > 0 and final_render_line_height <= 0:
+                    final_render_line_height = current_font_size_px # Fallback
 
-            if not final_lines:
-                total_text_height = 0
-            else:
-                total_text_height = final_render_line_height * len(final_lines)
-                total_text_height = max(0, total_text_height)
-
-            # Handle vertical text alignment
-            text_vertical_align = style.get('text_vertical_align', 'center')
-            if text_vertical_align == 'top':
-                y_cursor = -font_metrics.fAscent
-            elif text_vertical_align == 'bottom':
-                y_cursor = el_height - total_text_height - font_metrics.fAscent
-            else:  # center or any other value
-                y_cursor = (el_height - total_text_height) / 2 - font_metrics.fAscent
-
-            print(f"[DEBUG] Final font size px: {current_font_size_px}, lines: {len(final_lines)}, line_height: {final_render_line_height}, total_text_height: {total_text_height}")
+                if not final_lines:
+                    total_text_height = 0
+                else:
+                    total_text_height = final_render_line_height * len(final_lines)
+                    total_text_height = max(0, total_text_height)
+
+                # Handle vertical text alignment
+                text_vertical_align = node.vertical_align
+                if text_vertical_align == 'top':
+                    y_cursor = -font_metrics.fAscent
+                elif text_vertical_align == 'bottom':
+                    y_cursor = el_height - total_text_height - font_metrics.fAscent
+                else:  # center or any other value
+                    y_cursor = (el_height - total_text_height) / 2 - font_metrics.fAscent
+
+            if trace_enabled(DEBUG):
+                trace_event('text_layout', tag=node.tag, font_size_px=current_font_size_px, lines=len(final_lines),
+                            line_height=final_render_line_height, total_text_height=total_text_height)
             
             if not final_lines and text_to_render:
                  print(f"[WARNING] Text '{text_to_render}' could not be wrapped into lines for the given constraints.")
 
-            for line_text in final_lines:
-                line_width = final_font.measureText(line_text)
+            for line in final_lines:
                 # Calculate x_offset based on box alignment for single line text
                 # or text_align for multiline text
-                line_width = final_font.measureText(line_text)
+                line_text, line_width = line.text, line.width
                 if is_multiline:
                     if text_align_style == 'center':
                         x_text_offset = (el_width - line_width) / 2
@@ -529,16 +571,15 @@ def render_template_element_skia(canvas, element_data, parent_canvas_width, pare
                         x_text_offset = el_width - line_width
                     else: # left or None
                         x_text_offset = 0
-                print(f"[DEBUG] Drawing text line: '{line_text}', x: {x_text_offset}, y: {y_cursor}, width: {line_width}")
-                if 'text_shadow' in style:
-                    shadow_paint, shadow_x, shadow_y = apply_shadow_paint(canvas, text_paint, style['text_shadow'])
+                if node.has_text_shadow:
+                    shadow_paint, shadow_x, shadow_y = apply_shadow_paint(canvas, text_paint, node.text_shadow)
                     canvas.drawString(line_text, x_text_offset + shadow_x, y_cursor + shadow_y, final_font, shadow_paint)
                 
                 canvas.drawString(line_text, x_text_offset, y_cursor, final_font, text_paint)
                 
                 if is_underlined:
                     underline_y = y_cursor + font_metrics.fDescent * 0.8 
-                    if 'text_shadow' in style:
+                    if node.has_text_shadow:
                         # shadow_paint, shadow_x, shadow_y should be defined from above
                         canvas.drawLine(x_text_offset + shadow_x, underline_y + shadow_y, 
                                    x_text_offset + line_width + shadow_x, underline_y + shadow_y, shadow_paint)
@@ -549,35 +590,20 @@ def render_template_element_skia(canvas, element_data, parent_canvas_width, pare
     canvas.restore()
 
 
-def create_image_from_json_skia(json_data, output_path="output_image_skia.png", font_asset_path="assets/fonts", canvas_width=None, canvas_height=None, base_image_url=None):
-    if canvas_width is None or canvas_height is None:
-        canvas_width = json_data['original_width']
-        canvas_height = json_data['original_height']
+def compile_skia_template(json_data, font_asset_path="assets/fonts", canvas_width=None, canvas_height=None):
+    """Compiles a template for the Skia renderer (elements drawn in array order); reusable across renders."""
+    return compile_template(json_data, font_asset_path, canvas_width, canvas_height)
 
-    surface = skia.Surface(canvas_width, canvas_height)
-    canvas = surface.getCanvas()
-    canvas.clear(skia.ColorTRANSPARENT) # Start with a transparent background
-
-    # 1. Render base_image_url
-    if base_image_url is None:
-        base_image_url = json_data.get('base_image_url')
 
+def draw_static_layers_skia(canvas, template, static_nodes, base_image_url, draw_white_fallback, current_language, default_lang_code, assets, render_scale):
+    """Draws the base image (or the white fallback) and the static elements."""
+    canvas_width, canvas_height = template.width, template.height
     if base_image_url:
         try:
-            print(f"Fetching base_image_url: {base_image_url}")
-            response = requests.get(base_image_url, timeout=10)
-            response.raise_for_status() # Will raise an HTTPError for bad responses (4xx or 5xx)
-            # Corrected: Use skia.Data(bytes_object) constructor
-            base_image_data = skia.Data(response.content)
-            skia_base_image = skia.Image.MakeFromEncoded(base_image_data)
-            if skia_base_image:
-                print(f"Successfully loaded base image: {base_image_url} (w:{skia_base_image.width()}, h:{skia_base_image.height()})")
-                src_rect, dst_rect_fitted = calculate_box_fit_rects(
-                    skia_base_image.width(), skia_base_image.height(),
-                    canvas_width, canvas_height, "BoxFit.cover" # Base image covers canvas
-                )
-                canvas.drawImageRect(skia_base_image, src_rect, dst_rect_fitted, skia.Paint(AntiAlias=True))
-                print("Base image rendered with Skia.")
+            fitted = fitted_skia_image(assets, base_image_url, *scaled_size(canvas_width, canvas_height, render_scale), "BoxFit.cover", render_scale) # Base image covers canvas
+            if fitted:
+                skia_base_image, src_rect, dst_rect_fitted = fitted
+                canvas.drawImageRect(skia_base_image, src_rect, dst_rect_fitted, fitted_image_paint(skia.Paint(AntiAlias=True)))
             else:
                 print(f"Failed to decode Skia base image from URL: {base_image_url}. Drawing white fallback.")
                 canvas.drawColor(skia.ColorWHITE) # Fallback to white background
@@ -587,60 +613,359 @@ def create_image_from_json_skia(json_data, output_path="output_image_skia.png",
         except Exception as e:
             print(f"Generic Exception processing base_image_url {base_image_url}: {e}. Drawing white fallback.")
             canvas.drawColor(skia.ColorWHITE)
-    else:
-        print("No base_image_url provided. Canvas will be white if not otherwise painted.")
+    elif draw_white_fallback:
         canvas.drawColor(skia.ColorWHITE) # Default to white if no base image at all
 
-    # 2. Render elements from content_json
+    for node in static_nodes:
+        render_template_element_skia(canvas, node, template, current_language, default_lang_code, assets=assets, render_scale=render_scale)
+
+
+def render_languages_skia(json_data, languages, font_asset_path="assets/fonts", canvas_width=None, canvas_height=None, base_image_url=None, max_prefetch_workers=8, scale=None, target_width=None, static_split=DEFAULT_STATIC_SPLIT, assets=None):
+    """Yields (language, skia.Image) per language.
+
+    json_data is a template dict or a CompiledTemplate from compile_skia_template
+    (which already fixes the font directory and canvas size).
+    The base image and the static (non-personalized) elements below the first
+    dynamic one are drawn once and cached as a bitmap across renders, see
+    static_layers. Images are fetched/decoded once; language-independent dynamic
+    layers below the first text element are drawn once into a shared bitmap,
+    and language-independent elements above text are recorded once as
+    skia.Pictures and replayed for each language.
+    scale/target_width render directly at a reduced (or enlarged) output size:
+    drawing stays in template coordinates under a canvas scale transform.
+    assets holds already decoded images (url -> skia.Image) that are not fetched again.
+    """
+    template = json_data if isinstance(json_data, CompiledTemplate) else compile_skia_template(json_data, font_asset_path, canvas_width, canvas_height)
+    canvas_width, canvas_height = template.width, template.height
+    render_scale = resolve_render_scale(canvas_width, scale, target_width)
+    output_width, output_height = scaled_size(canvas_width, canvas_height, render_scale)
+    reset_offscreen_layer_count()
+
+    # 1. Render base_image_url
+    if base_image_url is None:
+        base_image_url = template.base_image_url
+
+    # Elements are drawn in array order; drop the ones that cannot show before fetching anything
+    # but the images covering them, which must load for the cull to stand
+    assets = dict(assets or {})
+    skip_decode = lambda url, hint: fitted_boxes_cached('skia', SKIA_RESAMPLE, url, hint)
+    cover_hints = image_decode_hints(template.nodes, None, output_width, output_height, render_scale)
+    with span('cull', backend='skia'):
+        nodes, cull_report = cull_with_fetched_covers(template, render_scale, assets, lambda urls: prefetch_images(urls, decode_skia_image, max_prefetch_workers, cover_hints, skip_decode))
+    log_cull_report(cull_report)
+    if cull_report['base_image_occluded']:
+        base_image_url = None
+
+    # 2. Render the display list
     # Elements with same z_index are drawn in array order.
     # The Dart exampleJson has all z_index: 0 for content_json elements.
     # No explicit sorting by z_index needed here if we process in given order.
     
-    lang_settings = json_data.get('language_settings', {})
-    current_language = lang_settings.get('current_language', 'en-IN') # Match Dart example
+    lang_settings = template.language_settings
     default_lang_code = lang_settings.get('default_language', {}).get('code', 'en-IN') # Corrected
 
-    elements = json_data.get('content_json', []) # Corrected: content_json is a list
+    if not nodes:
+        print("No elements found in content_json or content_json was empty.")
+
+    # Static background: reuse the cached bitmap, or draw it (once per distinct key) and cache it
+    static_nodes, dynamic_nodes = split_static_layers(nodes, static_split, DYNAMIC_TAGS | template.bound_tags)
+    static_urls = node_image_urls(static_nodes, base_image_url)
+    # Backgrounds are keyed by the content of their images; without it (a fetch failed) they are drawn and not cached
+    static_digests = fetch_digests(static_urls) if static_split != 'none' else None
+    cache_background = static_digests is not None
+    background_keys = {lang: static_layer_key('skia', template, static_nodes, base_image_url, render_scale, lang, default_lang_code, static_digests) for lang in languages}
+    backgrounds = {key: STATIC_LAYERS.lookup(key) if cache_background else None for key in set(background_keys.values())}
+    needs_static_assets = any(background is None for background in backgrounds.values())
 
-    if elements:
-        for element in elements:
-            print(f"Rendering element (Skia) type: {element['type']}, tag: {element.get('tag')}") # Moved log here
-            render_template_element_skia(canvas, element, canvas_width, canvas_height, current_language, default_lang_code, font_asset_path, lang_settings=lang_settings)
-        print("All elements rendered with Skia.")
+    # Download and decode every referenced image not passed in concurrently before drawing
+    urls = (static_urls if needs_static_assets else []) + node_image_urls(dynamic_nodes)
+    # Images are decoded no larger than drawing them needs (see reduced_decode)
+    hints = image_decode_hints(nodes, base_image_url, output_width, output_height, render_scale)
+    assets.update(prefetch_images([url for url in urls if url not in assets], decode_skia_image, max_prefetch_workers, hints, skip_decode))
+
+    def background_surface(current_language):
+        lang_surface = skia.Surface(output_width, output_height)
+        lang_canvas = lang_surface.getCanvas()
+        key = background_keys[current_language]
+        background = backgrounds[key]
+        if background is not None:
+            trace_event('static_background', cached=True, elements=len(static_nodes), lang=current_language)
+            with span('composite', ELEMENT, layer='static_background'):
+                lang_canvas.drawImage(background, 0, 0)
+            lang_canvas.scale(render_scale, render_scale)
+            return lang_surface
+        lang_canvas.clear(skia.ColorTRANSPARENT) # Start with a transparent background
+        lang_canvas.scale(render_scale, render_scale)
+        with span('static_background', elements=len(static_nodes), lang=current_language):
+            draw_static_layers_skia(lang_canvas, template, static_nodes, base_image_url, not cull_report['base_image_occluded'],
+                                    current_language, default_lang_code, assets, render_scale)
+        backgrounds[key] = lang_surface.makeImageSnapshot() # Copy-on-write: drawing on continues unaffected
+        if cache_background and assets_complete(assets, static_urls):
+            STATIC_LAYERS.put(key, backgrounds[key])
+        return lang_surface
+
+    # With one background for every language, everything below the first text element is shared too
+    shared_background = len(backgrounds) == 1
+    if shared_background:
+        shared_nodes, per_language_nodes = split_static_prefix(dynamic_nodes, lambda node: node.language_dependent)
+        surface = background_surface(languages[0])
+        with span('draw', layer='shared', elements=len(shared_nodes)):
+            for node in shared_nodes:
+                render_template_element_skia(surface.getCanvas(), node, template, languages[0], default_lang_code, assets=assets, render_scale=render_scale)
+        static_image = surface.makeImageSnapshot() if len(languages) > 1 else None
     else:
-        print("No elements found in content_json or content_json was empty.")
-    
-    # 3. Save the final image
-    print("Attempting to save Skia image...")
-    image_snapshot = None
-    encoded_data = None
-    try:
-        image_snapshot = surface.makeImageSnapshot()
-        if image_snapshot:
-            print("Image snapshot created successfully.")
-            # Corrected call to encodeToData with format and quality
-            encoded_data = image_snapshot.encodeToData(skia.EncodedImageFormat.kPNG, 100)
-            if encoded_data:
-                print("Image data encoded successfully.")
-                # Use a with statement for safer file handling
-                with open(output_path, "wb") as f:
-                    f.write(encoded_data.bytes())
-                print(f"Image saved to {output_path}")
-            else:
-                print("Error: Failed to encode image snapshot to PNG data.")
+        per_language_nodes = dynamic_nodes
+    recorded_pictures = {} # index in per_language_nodes -> skia.Picture
+
+    for lang_idx, current_language in enumerate(languages):
+        if not shared_background:
+            lang_surface = background_surface(current_language)
+        elif lang_idx == len(languages) - 1:
+            lang_surface = surface # The last language can draw straight onto the shared layers
         else:
-            print("Error: Failed to create image snapshot from surface.")
+            lang_surface = skia.Surface(output_width, output_height)
+            with span('composite', ELEMENT, layer='shared'):
+                lang_surface.getCanvas().drawImage(static_image, 0, 0)
+            lang_surface.getCanvas().scale(render_scale, render_scale)
+        lang_canvas = lang_surface.getCanvas()
+
+        with span('draw', lang=current_language, elements=len(per_language_nodes)):
+            for idx, node in enumerate(per_language_nodes):
+                if len(languages) == 1 or node.language_dependent:
+                    render_template_element_skia(lang_canvas, node, template, current_language, default_lang_code, assets=assets, render_scale=render_scale)
+                    continue
+                picture = recorded_pictures.get(idx)
+                if picture is None:
+                    recorder = skia.PictureRecorder()
+                    recording_canvas = recorder.beginRecording(skia.Rect.MakeWH(canvas_width, canvas_height))
+                    render_template_element_skia(recording_canvas, node, template, current_language, default_lang_code, assets=assets, render_scale=render_scale)
+                    picture = recorder.finishRecordingAsPicture()
+                    recorded_pictures[idx] = picture
+                with element_span('composite', node, layer='picture'):
+                    lang_canvas.drawPicture(picture)
+        trace_event('offscreen_layers', lang=current_language, count=offscreen_layer_count())
+        reset_offscreen_layer_count()
+
+        yield current_language, lang_surface.makeImageSnapshot()
+
+
+def render_bands_skia(json_data, current_language, band_height=DEFAULT_BAND_HEIGHT, font_asset_path="assets/fonts", canvas_width=None, canvas_height=None, base_image_url=None, max_prefetch_workers=8, scale=None, target_width=None, assets=None):
+    """Renders one language band by band, top to bottom. Yields (top, band) with band an RGBA Pillow image.
+
+    Bands are at most band_height output rows; only the elements reaching a
+    band are drawn into it (see banded_render). Images are drawn from their
+    decoded sources and the static-layer, fitted-image and shadow-mask caches
+    are bypassed, so no poster-sized raster is allocated.
+    """
+    template = json_data if isinstance(json_data, CompiledTemplate) else compile_skia_template(json_data, font_asset_path, canvas_width, canvas_height)
+    render_scale = resolve_render_scale(template.width, scale, target_width)
+    output_width, output_height = scaled_size(template.width, template.height, render_scale)
+    if base_image_url is None:
+        base_image_url = template.base_image_url
+
+    assets = dict(assets or {})
+    cover_hints = image_decode_hints(template.nodes, None, output_width, output_height, render_scale)
+    with span('cull', backend='skia'):
+        nodes, cull_report = cull_with_fetched_covers(template, render_scale, assets, lambda urls: prefetch_images(urls, decode_skia_image, max_prefetch_workers, cover_hints))
+    log_cull_report(cull_report)
+    if cull_report['base_image_occluded']:
+        base_image_url = None
+    default_lang_code = template.language_settings.get('default_language', {}).get('code', 'en-IN')
+
+    urls = node_image_urls(nodes, base_image_url)
+    hints = image_decode_hints(nodes, base_image_url, output_width, output_height, render_scale)
+    assets.update(prefetch_images([url for url in urls if url not in assets], decode_skia_image, max_prefetch_workers, hints))
+
+    bands = band_ranges(output_height, band_height)
+    trace_event('bands', width=output_width, height=output_height, bands=len(bands), band_height=band_height)
+    surface = skia.Surface(output_width, bands[0][1] - bands[0][0])
+    canvas = surface.getCanvas()
+    reset_offscreen_layer_count()
+    for top, bottom in bands:
+        band_nodes = nodes_in_band(template, nodes, top / render_scale, bottom / render_scale)
+        with span('band', top=top, rows=bottom - top, elements=len(band_nodes), lang=current_language):
+            canvas.clear(skia.ColorTRANSPARENT)
+            canvas.save()
+            canvas.translate(0, -top)
+            canvas.scale(render_scale, render_scale)
+            _render_counters.banded = True # Only while drawing; the caller runs between bands
+            try:
+                draw_static_layers_skia(canvas, template, band_nodes, base_image_url, not cull_report['base_image_occluded'],
+                                        current_language, default_lang_code, assets, render_scale)
+            finally:
+                _render_counters.banded = False
+            canvas.restore()
+            band = Image.fromarray(surface.toarray(colorType=skia.kRGBA_8888_ColorType), 'RGBA') # Read without an image snapshot
+            if bottom - top < band.height:
+                band = band.crop((0, 0, output_width, bottom - top))
+        yield top, band
+    trace_event('offscreen_layers', lang=current_language, count=offscreen_layer_count())
+
+
+def save_banded_skia_image(template, current_language, output_path, band_height=DEFAULT_BAND_HEIGHT, base_image_url=None, max_prefetch_workers=8, scale=None, target_width=None):
+    """Renders one language of a CompiledTemplate band by band into a PNG at output_path (see render_bands_skia).
+
+    Returns the path written (extension adjusted to .png), or None on failure.
+    """
+    render_scale = resolve_render_scale(template.width, scale, target_width)
+    writer = PNGStreamWriter(output_path_for_format(output_path, 'png'), *scaled_size(template.width, template.height, render_scale))
+    try:
+        for top, band in render_bands_skia(template, current_language, band_height, base_image_url=base_image_url,
+                                           max_prefetch_workers=max_prefetch_workers, scale=scale, target_width=target_width):
+            with span('encode', format='png', top=top):
+                writer.write_band(band)
+        with span('encode', format='png'):
+            output_path = writer.close()
+        print(f"Image saved to {output_path}")
+        return output_path
+    except Exception as e:
+        print(f"Error during banded rendering: {e}")
+        writer.abort()
+    return None
+
+
+def skia_image_to_pil(image_snapshot):
+    """Copies a skia.Image into an unpremultiplied RGBA Pillow image."""
+    return Image.fromarray(image_snapshot.toarray(colorType=skia.kRGBA_8888_ColorType), 'RGBA')
+
+
+def encode_skia_image(image_snapshot, output_format='png', quality=DEFAULT_QUALITY):
+    """Encodes a skia.Image. Returns (encoded_bytes, chosen_format), or (None, None) on failure.
+
+    PNG, JPEG and WebP use Skia's encoders; palette PNG and 'auto' go through Pillow.
+    """
+    with span('encode', format=output_format) as encode_span:
+        encoded_bytes, chosen_format = _encode_skia_image(image_snapshot, output_format, quality)
+        encode_span.set(chosen_format=chosen_format, bytes=len(encoded_bytes) if encoded_bytes else 0)
+    return encoded_bytes, chosen_format
+
+
+def _encode_skia_image(image_snapshot, output_format, quality):
+    if not image_snapshot:
+        print("Error: Failed to create image snapshot from surface.")
+        return None, None
+    if output_format in ('png8', 'auto'):
+        return encode_pil_image(skia_image_to_pil(image_snapshot), output_format, quality)
+
+    if output_format == 'jpeg': # JPEG has no alpha: flatten transparent areas onto white
+        flat_surface = skia.Surface(image_snapshot.width(), image_snapshot.height())
+        flat_canvas = flat_surface.getCanvas()
+        flat_canvas.clear(skia.ColorWHITE)
+        flat_canvas.drawImage(image_snapshot, 0, 0)
+        image_snapshot = flat_surface.makeImageSnapshot()
+    encoded_data = image_snapshot.encodeToData(SKIA_ENCODED_FORMATS[output_format], 100 if output_format == 'png' else quality)
+    if not encoded_data:
+        print(f"Error: Failed to encode image snapshot to {output_format} data.")
+        return None, None
+    return encoded_data.bytes(), output_format
+
+
+def save_skia_image(image_snapshot, output_path, output_format=None, quality=DEFAULT_QUALITY):
+    """Encodes a skia.Image and writes it to output_path (extension adjusted to the format).
+
+    Returns the path written, or None on failure. The format defaults to the output_path extension.
+    """
+    try:
+        encoded_bytes, chosen_format = encode_skia_image(image_snapshot, output_format or format_from_path(output_path), quality)
+        if encoded_bytes:
+            # Use a with statement for safer file handling
+            output_path = write_encoded(output_path, encoded_bytes, chosen_format)
+            print(f"Image saved to {output_path}")
+            return output_path
     except Exception as e:
         print(f"Error during image saving process: {e}")
+    return None
+
+
+def save_cached_skia_images(template, languages, output_path_for, output_cache, base_image_url=None, max_prefetch_workers=8, output_format='png', quality=DEFAULT_QUALITY, scale=None, target_width=None, static_split=DEFAULT_STATIC_SPLIT):
+    """Writes each language's image to output_path_for(lang), rendering only those not in output_cache. Returns {lang: path}."""
+    options = {'format': output_format, 'quality': quality, 'scale': scale, 'target_width': target_width}
+    render = lambda missing: render_languages_skia(template, missing, base_image_url=base_image_url, max_prefetch_workers=max_prefetch_workers, scale=scale, target_width=target_width, static_split=static_split)
+    encode = lambda image_snapshot: encode_skia_image(image_snapshot, output_format, quality)
+    output_paths = {}
+    for lang, encoded_bytes, chosen_format, _cached in output_cache.outputs(template, languages, 'skia', options, render, encode, base_image_url):
+        output_paths[lang] = write_encoded(output_path_for(lang), encoded_bytes, chosen_format)
+        print(f"Image saved to {output_paths[lang]}")
+    return output_paths
+
+
+def create_image_from_json_skia(json_data, output_path="output_image_skia.png", font_asset_path="assets/fonts", canvas_width=None, canvas_height=None, base_image_url=None, max_prefetch_workers=8, output_format=None, quality=DEFAULT_QUALITY, scale=None, target_width=None, static_split=DEFAULT_STATIC_SPLIT, output_cache=None, band_height=None):
+    """Renders the current language. Returns the path written, or None if saving failed.
+
+    With an output_cache (see output_cache), an unchanged poster is copied from the cache instead of rendered.
+    With a band_height, the poster is rendered and written as a PNG in bands of that many rows (see
+    banded_render); other formats raise ValueError.
+    """
+    lang_settings = json_data.language_settings if isinstance(json_data, CompiledTemplate) else json_data.get('language_settings', {})
+    current_language = lang_settings.get('current_language', 'en-IN') # Match Dart example
+    if band_height:
+        check_banded_format(output_format or format_from_path(output_path))
+        template = json_data if isinstance(json_data, CompiledTemplate) else compile_skia_template(json_data, font_asset_path, canvas_width, canvas_height)
+        return save_banded_skia_image(template, current_language, output_path, band_height, base_image_url, max_prefetch_workers, scale, target_width)
+    if output_cache is not None:
+        template = json_data if isinstance(json_data, CompiledTemplate) else compile_skia_template(json_data, font_asset_path, canvas_width, canvas_height)
+        return save_cached_skia_images(template, [current_language], lambda _lang: output_path, output_cache, base_image_url, max_prefetch_workers, output_format or format_from_path(output_path), quality, scale, target_width, static_split).get(current_language)
+    saved_path = None
+    for _lang, image_snapshot in render_languages_skia(json_data, [current_language], font_asset_path, canvas_width, canvas_height, base_image_url, max_prefetch_workers, scale, target_width, static_split):
+        # 3. Save the final image
+        saved_path = save_skia_image(image_snapshot, output_path, output_format, quality)
+    return saved_path
+
+
+def create_images_from_json_skia(json_data, languages, output_path="output_image_skia_{lang}.png", font_asset_path="assets/fonts", canvas_width=None, canvas_height=None, base_image_url=None, max_prefetch_workers=8, output_format=None, quality=DEFAULT_QUALITY, scale=None, target_width=None, static_split=DEFAULT_STATIC_SPLIT, output_cache=None, band_height=None):
+    """Renders one image per language, sharing the language-independent layers. Returns {lang: path}.
+
+    With an output_cache, only the languages whose output changed are rendered.
+    With a band_height, each language is rendered in bands on its own (nothing is shared), as PNG only.
+    """
+    if band_height:
+        check_banded_format(output_format or format_from_path(output_path))
+        template = json_data if isinstance(json_data, CompiledTemplate) else compile_skia_template(json_data, font_asset_path, canvas_width, canvas_height)
+        output_paths = {}
+        for lang in languages:
+            saved_path = save_banded_skia_image(template, lang, language_output_path(output_path, lang), band_height, base_image_url, max_prefetch_workers, scale, target_width)
+            if saved_path:
+                output_paths[lang] = saved_path
+        return output_paths
+    if output_cache is not None:
+        template = json_data if isinstance(json_data, CompiledTemplate) else compile_skia_template(json_data, font_asset_path, canvas_width, canvas_height)
+        return save_cached_skia_images(template, languages, lambda lang: language_output_path(output_path, lang), output_cache, base_image_url, max_prefetch_workers, output_format or format_from_path(output_path), quality, scale, target_width, static_split)
+    output_paths = {}
+    for lang, image_snapshot in render_languages_skia(json_data, languages, font_asset_path, canvas_width, canvas_height, base_image_url, max_prefetch_workers, scale, target_width, static_split):
+        saved_path = save_skia_image(image_snapshot, language_output_path(output_path, lang), output_format, quality)
+        if saved_path:
+            output_paths[lang] = saved_path
+    return output_paths
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Generate a poster image from a JSON template using Skia.")
     parser.add_argument('--json', required=True, help='Path to the JSON file containing poster data')
-    parser.add_argument('--lang', required=True, help='Language key to use for text rendering (e.g., en-IN, hi-IN)')
-    parser.add_argument('--output', default='generated_image_skia.png', help='Output image file path')
+    lang_group = parser.add_mutually_exclusive_group(required=True)
+    lang_group.add_argument('--lang', help='Language key to use for text rendering (e.g., en-IN, hi-IN)')
+    lang_group.add_argument('--langs', help='Comma-separated languages to render in one pass, sharing non-text layers (e.g., hi-IN,en-IN,mr-IN)')
+    parser.add_argument('--output', default='generated_image_skia.png', help="Output image file path; with --langs, '{lang}' is replaced or '_<lang>' is appended")
     parser.add_argument('--fonts', default='./assets/fonts', help='Path to font assets directory (default: ./assets/fonts)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None, help="Output format (default: from --output extension). 'auto' picks the smallest acceptable encoding")
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY, help=f'JPEG/WebP quality (default: {DEFAULT_QUALITY})')
+    size_group = parser.add_mutually_exclusive_group()
+    size_group.add_argument('--scale', type=float, default=None, help='Render at this fraction of the template size (e.g., 0.25 for thumbnails)')
+    size_group.add_argument('--target-width', type=int, default=None, help='Render directly at this output width in pixels')
+    parser.add_argument('--static-split', choices=STATIC_SPLITS, default=DEFAULT_STATIC_SPLIT, help="Which elements count as the cached static background: 'auto' (all but personal tags and text), 'tags' (all but personal tags) or 'none'")
     parser.add_argument('--base_image_url', default=None, help='URL of the base image to use (overrides JSON)')
+    parser.add_argument('--output-cache', action='store_true', help='Copy unchanged posters from the output cache instead of rendering them (directory: $POSTER_OUTPUT_CACHE_DIR)')
+    parser.add_argument('--band-height', type=int, default=None, help=f'Render and write the poster in horizontal bands of this many output rows to bound memory, for print sizes (e.g., {DEFAULT_BAND_HEIGHT})')
+    add_trace_arguments(parser)
     args = parser.parse_args()
+    configure_tracing_from_args(args)
+    languages = parse_languages(args.langs) if args.langs else [args.lang]
+    if not languages:
+        parser.error("--langs must list at least one language")
+    if args.band_height is not None and args.band_height < 1:
+        parser.error("--band-height must be at least 1")
+    if args.band_height and args.output_cache:
+        parser.error("--band-height cannot be combined with --output-cache")
+    if args.band_height and (args.format or format_from_path(args.output)) != 'png':
+        parser.error("--band-height writes PNG only; use a .png --output or --format png")
 
     print(f">>> PYTHON SCRIPT EXECUTION STARTED (generate_thumbnail.py) <<<")
     # Load JSON data
@@ -654,17 +979,15 @@ if __name__ == '__main__':
     # Set language in the data
     if 'language_settings' not in json_data:
         json_data['language_settings'] = {}
-    json_data['language_settings']['current_language'] = args.lang
+    json_data['language_settings']['current_language'] = languages[0]
     if 'default_language' not in json_data['language_settings']:
-        json_data['language_settings']['default_language'] = {'code': args.lang}
+        json_data['language_settings']['default_language'] = {'code': languages[0]}
 
     # Handle base_image_url override and set canvas size from image if provided
     if args.base_image_url:
         try:
             print(f"Fetching base image from URL: {args.base_image_url} to determine dimensions...")
-            response = requests.get(args.base_image_url, timeout=10)
-            response.raise_for_status()
-            base_image_data = skia.Data(response.content)
+            base_image_data = skia.Data.MakeWithCopy(fetch_image_bytes(args.base_image_url))
             skia_base_image = skia.Image.MakeFromEncoded(base_image_data)
             if skia_base_image:
                 canvas_width = skia_base_image.width()
@@ -694,7 +1017,13 @@ if __name__ == '__main__':
         font_dir = os.path.join(current_script_dir, "assets", "fonts")
     print(f"Font directory set to: {font_dir}")
 
+    output_cache = get_output_cache() if args.output_cache else None
     # Call the rendering function with local canvas size and base image url
-    create_image_from_json_skia(json_data, output_path=args.output, font_asset_path=font_dir, canvas_width=canvas_width, canvas_height=canvas_height, base_image_url=base_image_url)
-    print(f"Image generated at: {args.output}")
+    if args.langs:
+        output_paths = create_images_from_json_skia(json_data, languages, output_path=args.output, font_asset_path=font_dir, canvas_width=canvas_width, canvas_height=canvas_height, base_image_url=base_image_url, output_format=args.format, quality=args.quality, scale=args.scale, target_width=args.target_width, static_split=args.static_split, output_cache=output_cache, band_height=args.band_height)
+        for lang, lang_output_path in output_paths.items():
+            print(f"Image generated at: {lang_output_path} ({lang})")
+    else:
+        saved_path = create_image_from_json_skia(json_data, output_path=args.output, font_asset_path=font_dir, canvas_width=canvas_width, canvas_height=canvas_height, base_image_url=base_image_url, output_format=args.format, quality=args.quality, scale=args.scale, target_width=args.target_width, static_split=args.static_split, output_cache=output_cache, band_height=args.band_height)
+        print(f"Image generated at: {saved_path}")
     print(">>> PYTHON SCRIPT EXECUTION FINISHED (generate_thumbnail.py) <<<")
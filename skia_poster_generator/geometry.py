@@ -0,0 +1,30 @@
+# --- Template Geometry ---
+# Shared box resolution and output scaling for both renderers.
+
+
+def element_box(box, parent_width, parent_height):
+    """Resolves an element box to (x, y, width, height) in template pixels.
+
+    Explicit *_px values win; otherwise *_percent values are taken relative to the parent.
+    """
+    x = box.get('x_px', (box.get('x_percent', 0) / 100.0) * parent_width)
+    y = box.get('y_px', (box.get('y_percent', 0) / 100.0) * parent_height)
+    width = box.get('width_px', (box.get('width_percent', 100) / 100.0) * parent_width)
+    height = box.get('height_px', (box.get('height_percent', 100) / 100.0) * parent_height)
+    return x, y, width, height
+
+
+def resolve_render_scale(canvas_width, scale=None, target_width=None):
+    """Output/template scale factor from an explicit scale or a target output width (default 1.0)."""
+    if target_width:
+        return max(1, int(target_width)) / float(canvas_width)
+    if scale:
+        if scale <= 0:
+            raise ValueError(f"Render scale must be positive, got {scale}")
+        return float(scale)
+    return 1.0
+
+
+def scaled_size(canvas_width, canvas_height, render_scale):
+    """Output pixel size for a template canvas at render_scale (at least 1x1)."""
+    return max(1, int(round(canvas_width * render_scale))), max(1, int(round(canvas_height * render_scale)))
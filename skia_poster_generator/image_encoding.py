@@ -0,0 +1,101 @@
+import os
+from io import BytesIO
+
+from PIL import Image
+
+# --- Output Encoding ---
+# Shared output format handling for both renderers. Supported formats:
+#   png   - lossless RGBA (the previous behaviour)
+#   jpeg  - lossy, opaque; transparent areas are flattened onto white
+#   webp  - lossy with alpha
+#   png8  - palette PNG; exact when the image has <= 256 colours, else quantized
+#   auto  - palette PNG for flat graphics, otherwise the smaller of JPEG/WebP
+#           (WebP only when the image has transparency)
+
+OUTPUT_FORMATS = ('png', 'jpeg', 'webp', 'png8', 'auto')
+DEFAULT_QUALITY = 85 # Matches the JPEG quality the Dart bulk processor recompressed to
+
+FORMAT_EXTENSIONS = {'png': '.png', 'png8': '.png', 'jpeg': '.jpg', 'webp': '.webp'}
+EXTENSION_FORMATS = {'.jpg': 'jpeg', '.jpeg': 'jpeg', '.webp': 'webp', '.png': 'png'}
+
+
+def format_from_path(output_path):
+    """Infers the output format from the file extension, defaulting to PNG."""
+    return EXTENSION_FORMATS.get(os.path.splitext(output_path)[1].lower(), 'png')
+
+
+def output_path_for_format(output_path, output_format):
+    """Swaps the extension of output_path to match output_format (png8 keeps .png)."""
+    root, ext = os.path.splitext(output_path)
+    if format_from_path(output_path) == ('png' if output_format == 'png8' else output_format):
+        return output_path
+    return root + FORMAT_EXTENSIONS[output_format]
+
+
+def is_opaque(image):
+    if image.mode != 'RGBA':
+        return True
+    return image.getchannel('A').getextrema()[0] == 255
+
+
+def flatten_on_white(image):
+    if image.mode != 'RGBA':
+        return image.convert('RGB')
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, (0, 0), image)
+    return background
+
+
+def to_palette_image(image):
+    """Converts to mode 'P'. Exact (with a tRNS alpha table) for <= 256 colours, quantized otherwise."""
+    image = image.convert('RGBA')
+    colors = image.getcolors(256)
+    if colors is None:
+        return image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+
+    import numpy as np # Imported on use: only palette output needs it, and the Pillow renderer starts faster without it
+    pixels = np.asarray(image).view(np.uint32).reshape(image.height, image.width)
+    palette_values, indices = np.unique(pixels, return_inverse=True)
+    palette_rgba = palette_values.view(np.uint8).reshape(-1, 4)
+    palette_image = Image.fromarray(indices.reshape(image.height, image.width).astype(np.uint8), 'P')
+    palette_image.putpalette(palette_rgba[:, :3].tobytes())
+    if palette_rgba[:, 3].min() < 255:
+        palette_image.info['transparency'] = palette_rgba[:, 3].tobytes()
+    return palette_image
+
+
+def encode_pil_image(image, output_format='png', quality=DEFAULT_QUALITY):
+    """Encodes a Pillow image. Returns (encoded_bytes, chosen_format)."""
+    if output_format == 'auto':
+        return _encode_auto(image, quality)
+
+    buffer = BytesIO()
+    if output_format == 'jpeg':
+        flatten_on_white(image).save(buffer, format='JPEG', quality=quality)
+    elif output_format == 'webp':
+        image.save(buffer, format='WEBP', quality=quality)
+    elif output_format == 'png8':
+        palette_image = to_palette_image(image)
+        palette_image.save(buffer, format='PNG', optimize=True, transparency=palette_image.info.get('transparency'))
+    elif output_format == 'png':
+        image.save(buffer, format='PNG')
+    else:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    return buffer.getvalue(), output_format
+
+
+def _encode_auto(image, quality):
+    if image.getcolors(256) is not None: # Flat graphics: lossless palette PNG is both exact and small
+        return encode_pil_image(image, 'png8', quality)
+    candidates = [encode_pil_image(image, 'webp', quality)]
+    if is_opaque(image):
+        candidates.append(encode_pil_image(image, 'jpeg', quality))
+    return min(candidates, key=lambda candidate: len(candidate[0]))
+
+
+def write_encoded(output_path, encoded_bytes, chosen_format):
+    """Writes encoded bytes, adjusting the extension to the chosen format. Returns the path written."""
+    output_path = output_path_for_format(output_path, chosen_format)
+    with open(output_path, 'wb') as f:
+        f.write(encoded_bytes)
+    return output_path
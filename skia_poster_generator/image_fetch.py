@@ -0,0 +1,331 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- Image Fetching ---
+# One keep-alive session pool per process plus an on-disk cache shared by every
+# worker on the machine. Cache entries are keyed by the canonical object URL
+# with presign parameters stripped, so hourly re-signed S3 links still hit.
+# Bodies are stored content-addressed (by SHA-256), so identical images behind
+# different URLs share one blob. Past max_cache_bytes the least recently used
+# blobs are evicted, with the index entries pointing at them, down to
+# EVICT_TO_FRACTION of the limit, so the scan runs once per batch of evictions
+# rather than on every store.
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 16
+DEFAULT_MAX_CACHE_BYTES = 512 * 1024 * 1024
+EVICT_TO_FRACTION = 0.9 # Eviction frees space down to this fraction of max_cache_bytes
+DEFAULT_REVALIDATE_AFTER = 300 # Seconds a cached entry is served without a conditional request
+DEFAULT_MAX_DIGESTS = 65536 # Canonical URLs whose content digest is remembered in memory
+DEFAULT_DIGEST_WORKERS = 8
+
+# Query parameters added by S3 presigning (SigV4 X-Amz-*, legacy SigV2) that do not identify the object.
+PRESIGN_PARAM_PATTERN = re.compile(r"^(x-amz-.*|signature|expires|awsaccesskeyid)$", re.IGNORECASE)
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+def default_cache_dir():
+    return os.environ.get(
+        "POSTER_IMAGE_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "poster_generator", "images"),
+    )
+
+
+def canonical_url(url):
+    """Strips presign parameters and the fragment; keeps any other query params in sorted order."""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not PRESIGN_PARAM_PATTERN.match(k))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ""))
+
+
+def url_cache_key(url):
+    return hashlib.sha256(canonical_url(url).encode("utf-8")).hexdigest()
+
+
+class ImageFetcher:
+    """Fetches image bytes over a pooled requests.Session with a size-bounded disk cache.
+
+    Fresh entries are served from disk; stale ones are revalidated with
+    If-None-Match/If-Modified-Since. If revalidation fails (e.g. an expired
+    presigned link) the cached copy is served rather than failing the render.
+    """
+
+    def __init__(self, cache_dir=None, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES, timeout=DEFAULT_TIMEOUT,
+                 pool_size=DEFAULT_POOL_SIZE, revalidate_after=DEFAULT_REVALIDATE_AFTER, session=None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_cache_bytes = max_cache_bytes
+        self.timeout = timeout
+        self.revalidate_after = revalidate_after
+        self.session = session or self._make_session(pool_size)
+        self._index_dir = os.path.join(self.cache_dir, "index")
+        self._objects_dir = os.path.join(self.cache_dir, "objects")
+        os.makedirs(self._index_dir, exist_ok=True)
+        os.makedirs(self._objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cache_bytes = None # Running estimate of blob bytes; recomputed on eviction
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stale_served = 0
+        self._digests = OrderedDict() # canonical URL -> SHA-256 of the body last returned
+
+    @staticmethod
+    def _make_session(pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def fetch(self, url):
+        """Returns the body for url. Raises requests exceptions like requests.get + raise_for_status."""
+        key = url_cache_key(url)
+        entry = self._read_entry(key)
+        body = self._read_object(entry["sha256"]) if entry else None
+        if body is None:
+            entry = None
+
+        if entry and time.time() - entry["fetched_at"] < entry.get("max_age", self.revalidate_after):
+            self._count("hits")
+            self._remember_digest(url, entry["sha256"])
+            return body
+
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            response = self.session.get(url, timeout=self.timeout, headers=headers)
+            if entry and response.status_code == 304:
+                entry["fetched_at"] = time.time()
+                self._write_entry(key, entry)
+                self._count("revalidated")
+                self._remember_digest(url, entry["sha256"])
+                return body
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            if entry:
+                print(f"Warning: revalidation failed for {canonical_url(url)} ({e}). Serving cached copy.")
+                self._count("stale_served")
+                self._remember_digest(url, entry["sha256"])
+                return body
+            raise
+
+        body = response.content
+        self._count("misses")
+        self._remember_digest(url, self._store(key, url, body, response.headers))
+        return body
+
+    def fetch_digest(self, url):
+        """SHA-256 of url's body, as fetch() would return it; a fresh cache entry answers without reading its blob."""
+        entry = self._read_entry(url_cache_key(url))
+        if entry and time.time() - entry["fetched_at"] < entry.get("max_age", self.revalidate_after):
+            try:
+                os.utime(self._object_path(entry["sha256"])) # Bumps recency like a read; fails if the blob was evicted
+            except OSError:
+                pass
+            else:
+                self._count("hits")
+                self._remember_digest(url, entry["sha256"])
+                return entry["sha256"]
+        self.fetch(url)
+        return self.content_digest(url)
+
+    def content_digest(self, url):
+        """SHA-256 of the body this process last fetched for url (presign parameters ignored), or None."""
+        with self._lock:
+            return self._digests.get(canonical_url(url))
+
+    def _remember_digest(self, url, sha256):
+        url = canonical_url(url)
+        with self._lock:
+            self._digests[url] = sha256
+            self._digests.move_to_end(url)
+            while len(self._digests) > DEFAULT_MAX_DIGESTS:
+                self._digests.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "stale_served": self.stale_served,
+            }
+
+    # --- Disk cache ---
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _entry_path(self, key):
+        return os.path.join(self._index_dir, f"{key}.json")
+
+    def _object_path(self, sha256):
+        return os.path.join(self._objects_dir, sha256[:2], sha256)
+
+    def _read_entry(self, key):
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, key, entry):
+        atomic_write(self._entry_path(key), json.dumps(entry).encode("utf-8"))
+
+    def _read_object(self, sha256):
+        path = self._object_path(sha256)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            os.utime(path) # Bump recency for LRU eviction
+            return body
+        except OSError:
+            return None
+
+    def _store(self, key, url, body, response_headers):
+        sha256 = hashlib.sha256(body).hexdigest()
+        path = self._object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, body)
+            with self._lock:
+                if self._cache_bytes is not None:
+                    self._cache_bytes += len(body)
+        entry = {
+            "url": canonical_url(url),
+            "sha256": sha256,
+            "size": len(body),
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+        max_age = MAX_AGE_PATTERN.search(response_headers.get("Cache-Control", ""))
+        if max_age:
+            entry["max_age"] = int(max_age.group(1))
+        self._write_entry(key, entry)
+        with self._lock:
+            needs_scan = self._cache_bytes is None or self._cache_bytes > self.max_cache_bytes
+        if needs_scan:
+            self._evict_if_needed()
+        return sha256
+
+    def _evict_if_needed(self):
+        """Deletes least-recently-used blobs, and their index entries, once the cache exceeds max_cache_bytes.
+
+        Frees space down to EVICT_TO_FRACTION of the limit. An entry whose blob
+        another process evicted meanwhile is treated as a miss on read.
+        """
+        blobs = []
+        total = 0
+        for root, _, files in os.walk(self._objects_dir):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total > self.max_cache_bytes:
+            target = self.max_cache_bytes * EVICT_TO_FRACTION
+            evicted = set()
+            blobs.sort()
+            for _mtime, size, path in blobs:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    evicted.add(os.path.basename(path))
+                except OSError:
+                    pass
+            self._remove_entries(evicted)
+        with self._lock:
+            self._cache_bytes = total
+
+    def _remove_entries(self, evicted):
+        """Deletes the index entries whose blob SHA-256 is in evicted."""
+        if not evicted:
+            return
+        with os.scandir(self._index_dir) as entries:
+            for dir_entry in entries:
+                if not dir_entry.name.endswith(".json"):
+                    continue
+                try:
+                    with open(dir_entry.path, "r", encoding="utf-8") as f:
+                        sha256 = json.load(f).get("sha256")
+                    if sha256 in evicted:
+                        os.remove(dir_entry.path)
+                except (OSError, ValueError):
+                    pass
+
+
+def atomic_write(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def fetch_digests(urls, max_workers=DEFAULT_DIGEST_WORKERS):
+    """{canonical url: SHA-256 of its body}, through the shared fetcher; None if any fetch fails."""
+    fetcher = get_image_fetcher()
+
+    def digest(url):
+        try:
+            return fetcher.fetch_digest(url)
+        except Exception as e:
+            print(f"Warning: Could not fetch {canonical_url(url)} to fingerprint it ({e}).")
+            return None
+
+    if len(urls) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+            digests = list(executor.map(digest, urls))
+    else:
+        digests = [digest(url) for url in urls]
+    if any(sha256 is None for sha256 in digests):
+        return None
+    return {canonical_url(url): sha256 for url, sha256 in zip(urls, digests)}
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+
+def get_image_fetcher():
+    """Returns the process-wide ImageFetcher, creating it on first use."""
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = ImageFetcher()
+        return _default_fetcher
+
+
+def fetch_image_bytes(url):
+    return get_image_fetcher().fetch(url)
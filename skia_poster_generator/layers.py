@@ -0,0 +1,42 @@
+import os
+
+# --- Layer Partitioning ---
+# Helpers for rendering the language-independent part of a template once and
+# only the per-language text on top of it.
+
+
+def is_language_dependent(element_data):
+    """True if the element (or anything nested in it) draws localized text."""
+    if not element_data:
+        return False
+    if element_data.get('type') == 'text':
+        return True
+    nested_content_data = element_data.get('nested_content')
+    if nested_content_data and nested_content_data.get('content'):
+        return is_language_dependent(nested_content_data['content'])
+    return False
+
+
+def split_static_prefix(elements, is_dynamic):
+    """Splits draw-ordered elements into (static_prefix, rest) at the first dynamic element.
+
+    The static prefix can be flattened into one shared bitmap without changing
+    the result; everything after it must be drawn on top in order.
+    """
+    for idx, element in enumerate(elements):
+        if is_dynamic(element):
+            return elements[:idx], elements[idx:]
+    return list(elements), []
+
+
+def language_output_path(output_path, lang):
+    """Per-language output path: formats a '{lang}' placeholder, else appends '_<lang>' before the extension."""
+    if '{lang}' in output_path:
+        return output_path.format(lang=lang)
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_{lang}{ext}"
+
+
+def parse_languages(langs_arg):
+    """Parses a comma-separated --langs value (e.g. 'hi-IN,en-IN,mr-IN')."""
+    return [lang.strip() for lang in langs_arg.split(',') if lang.strip()]
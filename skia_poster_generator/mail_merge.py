@@ -0,0 +1,331 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from batch_render import SAFE_NAME_PATTERN
+from display_list import CompiledTemplate, TextNode, compile_element, node_image_urls
+from generate_thumbnial_skia import compile_skia_template, decode_skia_image, render_languages_skia, save_skia_image
+from geometry import resolve_render_scale, scaled_size
+from image_encoding import DEFAULT_QUALITY, OUTPUT_FORMATS
+from layers import language_output_path, parse_languages
+from prefetch import prefetch_images
+from reduced_decode import image_decode_hints
+from static_layers import DEFAULT_STATIC_SPLIT, STATIC_SPLITS, short_tag
+from tracing import add_trace_arguments, configure_tracing_from_args, span, trace_context
+
+# --- Mail Merge ---
+# Renders one template for a stream of data records (CSV rows or JSONL objects)
+# instead of one generated template JSON per person. Record fields bind to
+# element tags, short ('userName') or full ('TemplateElementTag.userName'):
+#   text          "userName": "Ravi" sets every language, "userName.hi-IN": "रवि" one;
+#                 a JSONL value may also be {"hi-IN": "रवि", "en-IN": "Ravi"}
+#   image         "userPicture": "https://..."
+#   leader_strip  "leaderStrip": ["https://...", ...] or "https://...|https://..." in CSV
+# Empty CSV cells and JSON nulls keep the template's content. Other fields
+# (e.g. "id") are only available to the output path pattern.
+#
+# The template is compiled, its fonts loaded and its unbound images decoded once
+# per batch; each record only recompiles the elements it binds. Bound tags are
+# always dynamic, so the static background cache is shared by the whole batch.
+#
+# A line that cannot be read (malformed JSON or CSV) or that is not an object
+# fails as its own record; the readers yield the error in its place.
+
+ID_FIELD = 'id'
+LIST_SEPARATOR = '|'
+RECORD_FORMATS = ('csv', 'jsonl')
+
+
+def iter_csv_records(stream):
+    """Yields each CSV row as a dict of header -> cell, or the csv.Error for a malformed row."""
+    reader = csv.DictReader(stream)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            row = e
+        yield row
+
+
+def iter_jsonl_records(stream):
+    """Yields each non-empty JSONL line as parsed, or the ValueError for a malformed line."""
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+
+
+def checked_record(record):
+    """record if it is a dict; raises the error a reader yielded in its place, or TypeError for other values."""
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise TypeError(f"Record must be an object, not {type(record).__name__}")
+    return record
+
+
+def record_format_from_path(path):
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def _is_unset(value):
+    return value is None or value == ''
+
+
+def _bound_content(element_data, values):
+    """New content for an element from its {language or None: value} bindings, or None if its type cannot be bound."""
+    el_type = element_data.get('type')
+    content = element_data.get('content')
+    content = content if isinstance(content, dict) else {}
+    value = values.get(None)
+    if el_type == 'text':
+        if isinstance(value, dict):
+            per_language = {lang: text for lang, text in value.items() if not _is_unset(text)}
+            value = None
+        else:
+            per_language = {}
+        per_language.update((lang, text) for lang, text in values.items() if lang is not None)
+        bound = {'fallback': str(value)} if value is not None else dict(content)
+        for lang, text in per_language.items():
+            bound[lang] = {'text': str(text)}
+        return bound
+    if el_type == 'image' and value is not None:
+        return dict(content, url=str(value))
+    if el_type == 'leader_strip' and value is not None:
+        urls = value if isinstance(value, list) else [url.strip() for url in str(value).split(LIST_SEPARATOR)]
+        leaders = content.get('leaders') or []
+        prototype = leaders[0] if leaders else {'type': 'image', 'box': {}, 'style': {}}
+        return dict(content, leaders=[dict(prototype, content=dict(prototype.get('content') or {}, url=url)) for url in urls if url])
+    return None
+
+
+def bind_element(element_data, bindings):
+    """Copy of element_data with its (and its nested content's) bound content, or None if nothing binds."""
+    bound = None
+    tag = element_data.get('tag')
+    if tag and short_tag(tag) in bindings:
+        content = _bound_content(element_data, bindings[short_tag(tag)])
+        if content is not None:
+            bound = dict(element_data, content=content)
+    nested_content_data = element_data.get('nested_content')
+    if nested_content_data and nested_content_data.get('content'):
+        nested = bind_element(nested_content_data['content'], bindings)
+        if nested is not None:
+            bound = dict(bound or element_data, nested_content=dict(nested_content_data, content=nested))
+    return bound
+
+
+def _share_fonts(node, bound_node):
+    # Font handles depend on the family and box size, not on the text, so bound text keeps the batch's
+    while node is not None and bound_node is not None:
+        if isinstance(node, TextNode) and isinstance(bound_node, TextNode):
+            bound_node.fonts = node.fonts
+        node, bound_node = node.nested, bound_node.nested
+
+
+def template_tags(template):
+    """Short tags of every compiled node, including nested content."""
+    tags = set()
+    for node in template.nodes:
+        while node is not None:
+            if node.tag:
+                tags.add(short_tag(node.tag))
+            node = node.nested
+    return tags
+
+
+class MailMerge:
+    """One compiled template rendered for many records.
+
+    template is a template dict or a CompiledTemplate from compile_skia_template.
+    Holds the per-batch state: the display list, the decoded images of elements
+    no record binds and the tags bound so far.
+    """
+
+    def __init__(self, template, languages, font_asset_path="assets/fonts", max_prefetch_workers=8, scale=None, target_width=None, static_split=DEFAULT_STATIC_SPLIT):
+        self.template = template if isinstance(template, CompiledTemplate) else compile_skia_template(template, font_asset_path)
+        self.languages = languages
+        self.max_prefetch_workers = max_prefetch_workers
+        self.render_scale = resolve_render_scale(self.template.width, scale, target_width)
+        self.static_split = static_split
+        self.tags = template_tags(self.template)
+        self.bound_tags = set()
+        self.shared_assets = {} # url -> decoded image (or Exception) for unbound elements and the base image
+        self._unmatched_fields = set()
+
+    def bindings(self, record):
+        """{short tag: {language or None: value}} for the fields of record that bind to a template tag."""
+        bindings = {}
+        for field, value in record.items():
+            if _is_unset(value) or field == ID_FIELD:
+                continue
+            tag, lang = short_tag(field), None
+            if tag not in self.tags and '.' in field:
+                tag, lang = field.rsplit('.', 1)
+                tag = short_tag(tag)
+            if tag not in self.tags:
+                if field not in self._unmatched_fields:
+                    self._unmatched_fields.add(field)
+                    print(f"Warning: Record field '{field}' does not match any element tag; ignoring it.")
+                continue
+            bindings.setdefault(tag, {})[lang] = value
+        return bindings
+
+    def bind(self, record):
+        """A CompiledTemplate with record's values bound; unbound nodes are shared with the batch template."""
+        bindings = self.bindings(record)
+        self.bound_tags.update(bindings)
+        template = self.template
+        nodes = []
+        for node in template.nodes:
+            bound = bind_element(node.element, bindings)
+            if bound is None:
+                nodes.append(node)
+                continue
+            bound_node = compile_element(bound, template.width, template.height, template.font_asset_path)
+            _share_fonts(node, bound_node)
+            nodes.append(bound_node)
+        return CompiledTemplate(template.width, template.height, template.base_image_url, template.language_settings,
+                                template.font_asset_path, nodes, frozenset(self.bound_tags))
+
+    def render(self, record):
+        """Yields (language, skia.Image) for one record."""
+        template = self.bind(record)
+        nodes, cull_report = template.visible_nodes(self.render_scale)
+        base_image_url = None if cull_report['base_image_occluded'] else template.base_image_url
+        # Images of elements no record changed are decoded once for the whole batch
+        batch_node_ids = {id(node) for node in self.template.nodes}
+        shared_urls = node_image_urls([node for node in nodes if id(node) in batch_node_ids], base_image_url)
+        missing = [url for url in shared_urls if url not in self.shared_assets]
+        if missing:
+            hints = image_decode_hints(nodes, base_image_url, *scaled_size(template.width, template.height, self.render_scale), self.render_scale)
+            self.shared_assets.update(prefetch_images(missing, decode_skia_image, self.max_prefetch_workers, hints))
+        yield from render_languages_skia(template, self.languages, max_prefetch_workers=self.max_prefetch_workers,
+                                         scale=self.render_scale, static_split=self.static_split, assets=self.shared_assets)
+
+    def render_records(self, records):
+        """Yields (index, record, {language: skia.Image} or the Exception rendering raised), 1-based, in input order."""
+        for index, record in enumerate(records, start=1):
+            try:
+                record = checked_record(record)
+                with trace_context(record=record_id(record, index)), span('record'):
+                    rendered = dict(self.render(record))
+                yield index, record, rendered
+            except Exception as e:
+                yield index, record, e
+
+
+def record_id(record, index):
+    value = record.get(ID_FIELD)
+    return index if _is_unset(value) else value
+
+
+def merge_output_path(output_pattern, record, index, lang, multiple_languages):
+    """Output path for one record and language.
+
+    The pattern is formatted with {id}, {index}, {lang} and the record's fields
+    (made filename-safe); with several languages and no {lang}, '_<lang>' is appended.
+    """
+    fields = {field: SAFE_NAME_PATTERN.sub('_', str(value)) for field, value in record.items() if isinstance(field, str)}
+    fields.update(id=SAFE_NAME_PATTERN.sub('_', str(record_id(record, index))), index=index, lang=lang)
+    output_path = output_pattern.format_map(fields)
+    if multiple_languages and '{lang}' not in output_pattern:
+        output_path = language_output_path(output_path, lang)
+    return output_path
+
+
+def write_merge(merge, records, output_pattern, output_format=None, quality=DEFAULT_QUALITY):
+    """Renders and saves each record as it is read. Yields one manifest entry per record.
+
+    Entries are {"id", "index", "ok", "outputs" | "error", "elapsed_ms"}; a failed record does not stop the batch.
+    """
+    for index, record in enumerate(records, start=1):
+        started = time.perf_counter()
+        entry = {'id': index, 'index': index}
+        try:
+            record = checked_record(record)
+            entry['id'] = record_id(record, index)
+            outputs = {}
+            with trace_context(record=entry['id']), span('record'):
+                for lang, image_snapshot in merge.render(record):
+                    output_path = merge_output_path(output_pattern, record, index, lang, len(merge.languages) > 1)
+                    output_dir = os.path.dirname(output_path)
+                    if output_dir:
+                        os.makedirs(output_dir, exist_ok=True)
+                    saved_path = save_skia_image(image_snapshot, output_path, output_format, quality)
+                    if not saved_path:
+                        raise RuntimeError(f"Failed to save image for {lang} to {output_path}")
+                    outputs[lang] = saved_path
+            entry.update(ok=True, outputs=outputs)
+        except Exception as e:
+            entry.update(ok=False, error=f"{type(e).__name__}: {e}")
+        entry['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        yield entry
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render one poster template for every record of a CSV/JSONL data file.")
+    parser.add_argument('--json', required=True, help='Path to the JSON template')
+    parser.add_argument('--records', required=True, help="CSV or JSONL file of records, or '-' for stdin")
+    parser.add_argument('--records-format', choices=RECORD_FORMATS, default=None, help='Record format (default: from the --records extension; jsonl for stdin)')
+    lang_group = parser.add_mutually_exclusive_group(required=True)
+    lang_group.add_argument('--lang', help='Language key to use for text rendering (e.g., en-IN, hi-IN)')
+    lang_group.add_argument('--langs', help='Comma-separated languages to render for every record')
+    parser.add_argument('--output', default='merged/{id}.png', help="Output path pattern with {id}, {index}, {lang} or any record field (default: merged/{id}.png)")
+    parser.add_argument('--manifest', default='-', help="Path for the JSONL success/failure manifest, or '-' for stdout")
+    parser.add_argument('--fonts', default='./assets/fonts', help='Path to font assets directory (default: ./assets/fonts)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None, help="Output format (default: from --output extension)")
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY, help=f'JPEG/WebP quality (default: {DEFAULT_QUALITY})')
+    size_group = parser.add_mutually_exclusive_group()
+    size_group.add_argument('--scale', type=float, default=None, help='Render at this fraction of the template size (e.g., 0.25 for thumbnails)')
+    size_group.add_argument('--target-width', type=int, default=None, help='Render directly at this output width in pixels')
+    parser.add_argument('--static-split', choices=STATIC_SPLITS, default=DEFAULT_STATIC_SPLIT, help="Which elements count as the cached static background (see generate_thumbnial_skia.py)")
+    parser.add_argument('--verbose', action='store_true', help='Forward renderer logs to stderr')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure_tracing_from_args(args)
+    languages = parse_languages(args.langs) if args.langs else [args.lang]
+    if not languages:
+        parser.error("--langs must list at least one language")
+
+    with open(args.json, 'r', encoding='utf-8') as f:
+        json_data = json.load(f)
+    # Mirror the generator CLI: the first requested language is the default if the template has none
+    lang_settings = dict(json_data.get('language_settings') or {})
+    lang_settings.setdefault('default_language', {'code': languages[0]})
+    json_data['language_settings'] = lang_settings
+
+    manifest = sys.stdout if args.manifest == '-' else open(args.manifest, 'w', encoding='utf-8')
+    # Renderer prints would interleave with the manifest; keep them off stdout
+    sys.stdout = sys.stderr if args.verbose else open(os.devnull, 'w')
+
+    records_format = args.records_format or ('jsonl' if args.records == '-' else record_format_from_path(args.records))
+    records_stream = sys.stdin if args.records == '-' else open(args.records, 'r', encoding='utf-8', newline='')
+    records = iter_csv_records(records_stream) if records_format == 'csv' else iter_jsonl_records(records_stream)
+
+    merge = MailMerge(json_data, languages, args.fonts, scale=args.scale, target_width=args.target_width, static_split=args.static_split)
+    succeeded = failed = 0
+    started = time.perf_counter()
+    try:
+        for entry in write_merge(merge, records, args.output, args.format, args.quality):
+            manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            manifest.flush()
+            if entry['ok']:
+                succeeded += 1
+            else:
+                failed += 1
+    finally:
+        if args.manifest != '-':
+            manifest.close()
+        if records_stream is not sys.stdin:
+            records_stream.close()
+
+    print(f"Mail merge finished: {succeeded} succeeded, {failed} failed in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from display_list import TextNode
+from font_cache import LRUCache
+from image_fetch import atomic_write, canonical_url, fetch_digests
+from tracing import span
+
+# --- Output Cache ---
+# Finished posters stored under a fingerprint of everything that decides their
+# pixels, so a bulk rerun only renders the posters that changed. A fingerprint
+# covers:
+#   the template (image URLs canonicalized, so re-signed links do not count as changes)
+#   the language, the canvas size and the base image URL
+#   the content of every font file the text elements load
+#   the content of every image drawn (fetched through the shared image cache)
+#   output options (format, quality, scale/target width)
+#   the renderer: backend, RENDERER_VERSION and the skia/Pillow versions
+# Outputs whose images cannot be fetched are not cached, so a transient failure
+# is rendered again next time. Entries live on disk (shared by every worker on
+# the machine) and the least recently used are evicted beyond max_cache_bytes,
+# down to EVICT_TO_FRACTION of it, so a full cache is rescanned once per batch
+# of evictions rather than on every store.
+
+RENDERER_VERSION = 3 # Bump whenever a renderer change alters the pixels of existing templates
+DEFAULT_MAX_OUTPUT_BYTES = 2 * 1024 * 1024 * 1024
+EVICT_TO_FRACTION = 0.9 # Eviction frees space down to this fraction of max_cache_bytes
+DEFAULT_MAX_FILE_DIGESTS = 1024
+IMAGE_URL_KEYS = ('url', 'base_image_url')
+
+# (path, mtime_ns, size) -> SHA-256 of a font file
+FILE_DIGESTS = LRUCache(DEFAULT_MAX_FILE_DIGESTS)
+
+
+def default_output_cache_dir():
+    return os.environ.get(
+        'POSTER_OUTPUT_CACHE_DIR',
+        os.path.join(os.path.expanduser('~'), '.cache', 'poster_generator', 'outputs'),
+    )
+
+
+def canonical_template(value):
+    """The template with image URLs canonicalized, so presigned links to the same images compare equal."""
+    if isinstance(value, dict):
+        return {key: canonical_url(item) if key in IMAGE_URL_KEYS and isinstance(item, str) and item else canonical_template(item)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [canonical_template(item) for item in value]
+    return value
+
+
+def _digest(value):
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def template_digest(template):
+    """SHA-256 of a CompiledTemplate's elements and language settings (current_language aside)."""
+    language_settings = {key: value for key, value in template.language_settings.items() if key != 'current_language'}
+    return _digest(canonical_template({
+        'language_settings': language_settings,
+        'elements': [node.element for node in template.nodes],
+    }))
+
+
+def file_digest(path):
+    """SHA-256 of a file's content (remembered until it changes), or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    def load():
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    return FILE_DIGESTS.get((os.path.abspath(path), st.st_mtime_ns, st.st_size), load)
+
+
+def _text_nodes(nodes):
+    for node in nodes:
+        while node is not None:
+            if isinstance(node, TextNode):
+                yield node
+            node = node.nested
+
+
+def font_files(template, backend, lang):
+    """Paths of the font files the backend loads for the template's text in lang."""
+    paths = set()
+    for node in _text_nodes(template.nodes):
+        if backend == 'pil':
+            paths.add(node.font_path) # Pillow uses the element's font family
+            continue
+        # Skia uses the language's font family, preferring an italic file for italic text
+        family = template.language_font_family(lang)
+        path = os.path.join(template.font_asset_path, f"{family}{'-Italic' if node.italic else ''}.ttf")
+        if not os.path.exists(path):
+            path = os.path.join(template.font_asset_path, f"{family}.ttf")
+        paths.add(path)
+    return sorted(paths)
+
+
+def drawn_image_urls(template, backend, base_image_url=None):
+    """Unique image URLs the backend can draw for the template (base image first)."""
+    urls = [base_image_url or template.base_image_url]
+    for node in template.nodes:
+        if backend == 'pil' and node.kind == 'leader_strip': # Not drawn by the Pillow renderer
+            continue
+        urls.extend(node.image_urls)
+    return [url for url in dict.fromkeys(urls) if url]
+
+
+def library_versions(backend):
+    import PIL
+    versions = {'pillow': PIL.__version__}
+    if backend == 'skia': # The Pillow renderer never imports skia
+        import skia
+        versions['skia'] = skia.__version__
+    return versions
+
+
+def output_fingerprints(template, languages, backend, options, base_image_url=None):
+    """{lang: fingerprint} for a CompiledTemplate's outputs, or {lang: None} when an image cannot be fetched.
+
+    options holds whatever else shapes the output bytes (format, quality, scale, target_width).
+    """
+    base_image_url = base_image_url or template.base_image_url
+    images = fetch_digests(drawn_image_urls(template, backend, base_image_url))
+    if images is None:
+        return {lang: None for lang in languages}
+    shared = {
+        'renderer': RENDERER_VERSION,
+        'backend': backend,
+        'libraries': library_versions(backend),
+        'template': template_digest(template),
+        'size': [template.width, template.height],
+        'base_image_url': canonical_url(base_image_url) if base_image_url else None,
+        'images': images,
+        'options': options,
+    }
+    return {
+        lang: _digest(dict(shared, language=lang, fonts={os.path.basename(path): file_digest(path) for path in font_files(template, backend, lang)}))
+        for lang in languages
+    }
+
+
+class OutputCache:
+    """Size-bounded disk cache of encoded posters keyed by output fingerprint.
+
+    Like the image cache, index entries ({fingerprint}.json: format and size)
+    point at blobs under objects/, and blobs are evicted least recently used first.
+    """
+
+    def __init__(self, cache_dir=None, max_cache_bytes=DEFAULT_MAX_OUTPUT_BYTES):
+        self.cache_dir = cache_dir or default_output_cache_dir()
+        self.max_cache_bytes = max_cache_bytes
+        self._index_dir = os.path.join(self.cache_dir, 'index')
+        self._objects_dir = os.path.join(self.cache_dir, 'objects')
+        os.makedirs(self._index_dir, exist_ok=True)
+        os.makedirs(self._objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cache_bytes = None # Running estimate of blob bytes; recomputed on eviction
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, fingerprint):
+        """(encoded_bytes, format) stored under fingerprint, or None."""
+        entry = self._read_entry(fingerprint)
+        path = self._object_path(fingerprint)
+        body = None
+        if entry:
+            try:
+                with open(path, 'rb') as f:
+                    body = f.read()
+                os.utime(path) # Bump recency for LRU eviction
+            except OSError:
+                body = None
+        self._count('hits' if body is not None else 'misses')
+        return (body, entry['format']) if body is not None else None
+
+    def put(self, fingerprint, encoded_bytes, output_format):
+        path = self._object_path(fingerprint)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, encoded_bytes)
+        entry = {'format': output_format, 'size': len(encoded_bytes), 'stored_at': time.time()}
+        atomic_write(self._entry_path(fingerprint), json.dumps(entry).encode('utf-8'))
+        with self._lock:
+            self.stores += 1
+            if self._cache_bytes is not None:
+                self._cache_bytes += len(encoded_bytes)
+            needs_scan = self._cache_bytes is None or self._cache_bytes > self.max_cache_bytes
+        if needs_scan:
+            self._evict_if_needed()
+
+    def outputs(self, template, languages, backend, options, render, encode, base_image_url=None):
+        """Yields (lang, encoded_bytes, format, cached) for each language, rendering only the cache misses.
+
+        render(languages) yields (lang, image) for the languages to draw and
+        encode(image) returns (encoded_bytes, format). Cached outputs come first.
+        """
+        with span('output_fingerprint', languages=len(languages)):
+            fingerprints = output_fingerprints(template, languages, backend, options, base_image_url)
+        missing = []
+        for lang in languages:
+            cached = self.get(fingerprints[lang]) if fingerprints[lang] else None
+            if cached is None:
+                missing.append(lang)
+                continue
+            print(f"Output for {lang} is unchanged; reusing the cached image.")
+            yield lang, cached[0], cached[1], True
+        if not missing:
+            return
+        for lang, image in render(missing):
+            encoded_bytes, output_format = encode(image)
+            if encoded_bytes is None:
+                raise RuntimeError(f"Failed to encode image for {lang}")
+            if fingerprints[lang]:
+                self.put(fingerprints[lang], encoded_bytes, output_format)
+            yield lang, encoded_bytes, output_format, False
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            }
+
+    # --- Disk cache ---
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _entry_path(self, fingerprint):
+        return os.path.join(self._index_dir, f"{fingerprint}.json")
+
+    def _object_path(self, fingerprint):
+        return os.path.join(self._objects_dir, fingerprint[:2], fingerprint)
+
+    def _read_entry(self, fingerprint):
+        try:
+            with open(self._entry_path(fingerprint), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _evict_if_needed(self):
+        """Deletes least-recently-used outputs (blob and index entry) once the cache exceeds max_cache_bytes.
+
+        Frees space down to EVICT_TO_FRACTION of the limit.
+        """
+        blobs = []
+        total = 0
+        for root, _, files in os.walk(self._objects_dir):
+            for name in files:
+                if name.startswith('.tmp-'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((st.st_mtime, st.st_size, name, path))
+                total += st.st_size
+        if total > self.max_cache_bytes:
+            target = self.max_cache_bytes * EVICT_TO_FRACTION
+            blobs.sort()
+            for _mtime, size, fingerprint, path in blobs:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+                try:
+                    os.remove(self._entry_path(fingerprint))
+                except OSError:
+                    pass
+        with self._lock:
+            self._cache_bytes = total
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_output_cache():
+    """Returns the process-wide OutputCache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = OutputCache()
+        return _default_cache
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from image_fetch import fetch_image_bytes
+from tracing import span, url_span
+
+# --- Image Prefetch ---
+# Collects every image URL a template references and downloads/decodes them on
+# a bounded thread pool before rasterization, so a poster pays for its slowest
+# image instead of the sum of all of them. Renderers then read from the
+# resulting asset map: url -> decoded image, or the Exception that fetching or
+# decoding raised (re-raised at draw time so error reporting stays per element).
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class _NotDecoded:
+    """Asset value for an image that was fetched but not decoded because every fitted size it needs is cached."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'NOT_DECODED'
+
+
+NOT_DECODED = _NotDecoded()
+
+
+def iter_element_image_urls(element_data):
+    """Yields image URLs drawn by an element, including nested content and leaders."""
+    if not element_data:
+        return
+    el_type = element_data.get('type')
+    content = element_data.get('content') or {}
+    if el_type == 'image':
+        if content.get('url'):
+            yield content['url']
+    elif el_type == 'leader_strip':
+        for leader in content.get('leaders', []) or []:
+            url = (leader.get('content') or {}).get('url')
+            if url:
+                yield url
+    nested_content_data = element_data.get('nested_content')
+    if nested_content_data and nested_content_data.get('content'):
+        yield from iter_element_image_urls(nested_content_data['content'])
+
+
+def collect_image_urls(json_data, base_image_url=None, elements=None, include_base_image=True):
+    """Returns the unique image URLs of a template in first-use order.
+
+    elements overrides json_data's content_json (e.g. with the culled draw list).
+    """
+    urls = []
+    base_image_url = base_image_url or json_data.get('base_image_url')
+    if base_image_url and include_base_image:
+        urls.append(base_image_url)
+    if elements is None:
+        elements = json_data.get('content_json', []) or []
+    for element in elements:
+        urls.extend(iter_element_image_urls(element))
+    return list(dict.fromkeys(urls))
+
+
+def _fetch_and_decode(url, decode, hint=None, skip_decode=None):
+    try:
+        with url_span('fetch', url) as fetch_span:
+            data = fetch_image_bytes(url)
+            fetch_span.set(bytes=len(data))
+        if hint is not None and skip_decode is not None and skip_decode(url, hint):
+            return NOT_DECODED
+        with url_span('decode', url):
+            return decode(data) if hint is None else decode(data, hint)
+    except Exception as e:
+        return e
+
+
+def prefetch_images(urls, decode, max_workers=DEFAULT_MAX_WORKERS, hints=None, skip_decode=None):
+    """Fetches and decodes urls concurrently. Returns {url: image, NOT_DECODED or Exception}.
+
+    hints maps urls to reduced_decode.DecodeHint; decode is then called as decode(data, hint).
+    skip_decode(url, hint), called once the bytes are fetched, returns True for
+    images that need not be decoded (their fitted sizes are all cached).
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+    hints = hints or {}
+    with span('prefetch', images=len(urls)):
+        if len(urls) == 1 or max_workers <= 1:
+            return {url: _fetch_and_decode(url, decode, hints.get(url), skip_decode) for url in urls}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+            results = executor.map(lambda url: _fetch_and_decode(url, decode, hints.get(url), skip_decode), urls)
+            return dict(zip(urls, results))
+
+
+def resolve_image(assets, url, decode):
+    """Returns the decoded image for url from assets, fetching on demand if it was not prefetched.
+
+    Re-raises the fetch/decode error recorded during prefetch. Images prefetched
+    as NOT_DECODED are decoded now (their fitted sizes were evicted meanwhile).
+    """
+    if assets is not None and url in assets and assets[url] is not NOT_DECODED:
+        value = assets[url]
+    else:
+        value = _fetch_and_decode(url, decode)
+    if isinstance(value, Exception):
+        raise value
+    return value
@@ -0,0 +1,94 @@
+import math
+
+from display_list import ImageNode, LeaderStripNode
+
+# --- Reduced-Resolution Decode ---
+# Uploaded photos are often 4000x3000 but are drawn into boxes a few hundred
+# (leader strips: a few dozen) pixels wide. Before prefetching, each image URL
+# gets a DecodeHint listing every box it is drawn into, in output pixels. The
+# decoders use it to decode at a reduced size:
+#   Pillow  JPEG draft mode (DCT scaling), then an integer Image.reduce()
+#   Skia    the codec's scaled decode, then an integer reduction with scalePixels
+# Both stop at REDUCING_GAP times the largest drawn size, so the final
+# high-quality resize (LANCZOS in Pillow, drawImageRect in Skia) still has
+# enough source pixels, but decode memory and time follow the drawn size
+# instead of the uploaded one. Images without a hint decode at full size.
+
+REDUCING_GAP = 2.0 # Source pixels kept per drawn pixel, as in Pillow's Image.thumbnail
+MIN_REDUCTION = 2 # Smaller integer reductions are not worth a second pass
+
+
+def drawn_scale(src_width, src_height, box_width, box_height, fit):
+    """Output pixels per source pixel when a src_width x src_height image is fitted into the box.
+
+    Covers both renderers: where they differ (Skia draws fitWidth/fitHeight/
+    scaleDown like contain) this returns the larger scale. BoxFit.none and
+    unknown fits draw 1:1.
+    """
+    width_scale, height_scale = box_width / src_width, box_height / src_height
+    if fit in ('BoxFit.fill', 'BoxFit.cover'):
+        return max(width_scale, height_scale)
+    if fit == 'BoxFit.contain':
+        return min(width_scale, height_scale)
+    if fit == 'BoxFit.fitWidth':
+        return width_scale
+    if fit == 'BoxFit.fitHeight':
+        return height_scale
+    if fit == 'BoxFit.scaleDown':
+        return min(1.0, width_scale, height_scale)
+    return 1.0
+
+
+def output_box(box_width, box_height):
+    """A drawn box in output pixels, as recorded in hints and fitted image keys."""
+    return max(1.0, float(box_width)), max(1.0, float(box_height))
+
+
+class DecodeHint:
+    """The boxes (output width, output height, fit) one image URL is drawn into."""
+    __slots__ = ('boxes',)
+
+    def __init__(self):
+        self.boxes = []
+
+    def add(self, box_width, box_height, fit):
+        self.boxes.append((*output_box(box_width, box_height), fit))
+
+    def decode_size(self, src_width, src_height):
+        """The smallest (width, height) to decode a src_width x src_height image to, or None for full size."""
+        if src_width <= 0 or src_height <= 0 or not self.boxes:
+            return None
+        scale = max(drawn_scale(src_width, src_height, *box) for box in self.boxes) * REDUCING_GAP
+        if scale >= 1.0:
+            return None
+        return max(1, math.ceil(src_width * scale)), max(1, math.ceil(src_height * scale))
+
+
+def reduction_factor(width, height, decode_size):
+    """The integer factor an image of width x height can still be reduced by while staying at least decode_size."""
+    if decode_size is None:
+        return 1
+    factor = min(width // decode_size[0], height // decode_size[1])
+    return factor if factor >= MIN_REDUCTION else 1
+
+
+def _add_node_boxes(hints, node, render_scale):
+    if isinstance(node, ImageNode) and node.url:
+        hints.setdefault(node.url, DecodeHint()).add(node.width * render_scale, node.height * render_scale, node.fit)
+    elif isinstance(node, LeaderStripNode):
+        leader_size = node.height * render_scale # Leaders are stretched into height x height circles
+        for url in node.leader_urls:
+            if url:
+                hints.setdefault(url, DecodeHint()).add(leader_size, leader_size, 'BoxFit.fill')
+    if node.nested is not None:
+        _add_node_boxes(hints, node.nested, render_scale)
+
+
+def image_decode_hints(nodes, base_image_url, output_width, output_height, render_scale=1.0):
+    """{url: DecodeHint} for the images of nodes drawn at render_scale, and the base image covering the output_width x output_height canvas."""
+    hints = {}
+    if base_image_url:
+        hints.setdefault(base_image_url, DecodeHint()).add(output_width, output_height, 'BoxFit.cover')
+    for node in nodes:
+        _add_node_boxes(hints, node, render_scale)
+    return hints
@@ -0,0 +1,423 @@
+import argparse
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlsplit
+
+from batch_render import init_worker_process
+from image_fetch import canonical_url, get_image_fetcher
+from output_cache import canonical_template
+from prefetch import collect_image_urls
+from tracing import add_trace_arguments, configure_tracing_from_args, span, trace_context
+
+# --- Render Service ---
+# Local HTTP render service for previews. The same poster is often requested
+# many times at once (a viral campaign post), so concurrent requests for the
+# same canonical (template, lang, size, format) share one in-flight render
+# (single-flight). Nothing is cached once the render completes.
+#
+#   POST /render            body: one render_worker job (single language, no "output")
+#   GET  /render?template_path=poster.json&lang=hi-IN&target_width=540&format=webp
+#   GET  /stats             service counters as JSON
+#   GET  /healthz
+# A render answers with the encoded image (X-Coalesced: 1 when it joined another
+# request's render). Requests choose a lane with "priority" in the job or query:
+#   interactive (default)   dispatched first; a joining interactive request promotes a queued bulk render
+#   bulk                    only dispatched while no interactive render is queued
+# Each lane queues at most --max-<lane>-queue renders and drops renders that
+# waited longer than --<lane>-timeout seconds. Requests beyond either bound are
+# shed with 503 and Retry-After instead of piling up behind a saturated pool.
+#
+# Rendering (compile, draw, encode) runs on a process pool with warm caches,
+# one render per process at a time. Image fetches are started on an I/O thread
+# pool as soon as a render is queued, so downloads overlap the queue wait and
+# the render process reads them from the shared image cache.
+#
+# A render process that dies (e.g. OOM-killed on a huge poster) breaks the whole
+# pool. The pool reports it with BrokenProcessPool, on the renders that were
+# running or on the next submit; the service then replaces the pool and retries
+# the renders that were running on it, once. /healthz answers 503 while no
+# usable pool can be made.
+
+LANES = ('interactive', 'bulk')
+DEFAULT_MAX_QUEUED = {'interactive': 32, 'bulk': 256}
+DEFAULT_MAX_WAIT = {'interactive': 10.0, 'bulk': 120.0} # Seconds a render may wait for a worker
+DEFAULT_IO_WORKERS = 16
+MAX_RENDER_ATTEMPTS = 2 # A render that was running when its pool broke is retried once on a new pool
+MAX_BODY_BYTES = 8 * 1024 * 1024
+HEADER_TIMEOUT = 10.0
+RETRY_AFTER_SECONDS = 1
+CONTENT_TYPES = {'png': 'image/png', 'png8': 'image/png', 'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+STATUS_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+                  500: 'Internal Server Error', 503: 'Service Unavailable'}
+QUERY_NUMBERS = {'scale': float, 'target_width': int, 'canvas_width': int, 'canvas_height': int, 'quality': int}
+KEY_FIELDS = ('lang', 'fonts', 'canvas_width', 'canvas_height', 'scale', 'target_width', 'format', 'quality')
+
+
+class Overloaded(Exception):
+    """A render was shed because its lane is full or it waited too long."""
+
+
+class BadRequest(Exception):
+    pass
+
+
+class PayloadTooLarge(BadRequest):
+    pass
+
+
+def render_key(job, default_font_dir):
+    """The canonical identity of a render: template, language, size and format."""
+    if 'template' in job:
+        canonical = json.dumps(canonical_template(job['template']), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        template_key = ('template', hashlib.sha256(canonical.encode('utf-8')).hexdigest())
+    else:
+        path = os.path.abspath(job['template_path'])
+        template_key = ('path', path, os.stat(path).st_mtime_ns)
+    job_key = tuple(job.get(field) for field in KEY_FIELDS)
+    base_image_url = job.get('base_image_url')
+    return template_key, job_key, canonical_url(base_image_url) if base_image_url else None, default_font_dir
+
+
+def validate_job(job):
+    """Checks a job and normalizes it to one language ('lang'). Raises BadRequest."""
+    if not isinstance(job, dict):
+        raise BadRequest("A render job must be a JSON object")
+    if 'template' not in job and 'template_path' not in job:
+        raise BadRequest("A render job needs 'template' or 'template_path'")
+    if job.get('output'):
+        raise BadRequest("The render service returns the image; 'output' is not supported")
+    langs = job.get('langs') or []
+    if len(langs) > 1:
+        raise BadRequest("The render service renders one language per request")
+    job = dict(job)
+    if langs:
+        job['lang'] = langs[0]
+    job.pop('langs', None)
+    if job.get('priority', 'interactive') not in LANES:
+        raise BadRequest(f"Unknown priority '{job['priority']}', expected one of {', '.join(LANES)}")
+    return job
+
+
+def job_from_query(query):
+    """A render job from GET /render query parameters."""
+    params = {name: values[-1] for name, values in parse_qs(query).items()}
+    try:
+        for name, convert in QUERY_NUMBERS.items():
+            if name in params:
+                params[name] = convert(params[name])
+    except ValueError as e:
+        raise BadRequest(f"Invalid query parameter: {e}")
+    return params
+
+
+def render_service_job(job, font_dir):
+    """Runs in a pool process. Returns (encoded_bytes, chosen_format, elapsed_ms) for the job's one language."""
+    from render_worker import encode_job_images, render_job_languages
+    started = time.perf_counter()
+    with trace_context(job=job.get('id'), template=job.get('template_path')), span('job'):
+        _languages, rendered = render_job_languages(job, font_dir)
+        for _lang, encoded_bytes, chosen_format in encode_job_images(job, rendered):
+            return encoded_bytes, chosen_format, round((time.perf_counter() - started) * 1000, 1)
+    raise RuntimeError("The job rendered no image")
+
+
+def _read_template(job):
+    if 'template' in job:
+        return job['template']
+    with open(job['template_path'], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class Flight:
+    """One in-flight render shared by every request with the same key."""
+    __slots__ = ('key', 'job', 'lane', 'future', 'prefetch', 'queued_at', 'started')
+
+    def __init__(self, key, job, lane, future, queued_at):
+        self.key = key
+        self.job = job
+        self.lane = lane
+        self.future = future
+        self.prefetch = None
+        self.queued_at = queued_at
+        self.started = False
+
+
+class RenderService:
+    def __init__(self, executor_factory, io_executor, font_dir, workers, max_queued=None, max_wait=None):
+        self.executor_factory = executor_factory # () -> a new render process pool
+        self.executor = executor_factory()
+        self.pool_error = None # Why the last pool replacement failed; cleared by the next successful one
+        self.io_executor = io_executor
+        self.font_dir = font_dir
+        self.workers = workers
+        self.max_queued = dict(DEFAULT_MAX_QUEUED, **(max_queued or {}))
+        self.max_wait = dict(DEFAULT_MAX_WAIT, **(max_wait or {}))
+        self._flights = {} # render key -> Flight
+        self._heap = [] # (lane rank, sequence, Flight); a promoted flight has a second entry
+        self._sequence = itertools.count()
+        self._queued = dict.fromkeys(LANES, 0)
+        self._ready = asyncio.Condition()
+        self.running = 0
+        self.counters = {'requests': 0, 'coalesced': 0, 'promoted': 0, 'rendered': 0, 'failed': 0, 'retried': 0, 'pool_restarts': 0}
+        self.shed = dict.fromkeys(LANES, 0)
+
+    def start(self):
+        """Starts one dispatcher per worker process, so the pool never queues work itself."""
+        return [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    def pool_usable(self):
+        """False while the last attempt to replace a broken pool failed."""
+        return self.pool_error is None
+
+    def _submit(self, fn, *args):
+        """(executor, concurrent future) of fn submitted to the render pool; a pool found broken is replaced first."""
+        executor = self.executor
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool: # A process died while the pool was idle
+            self._replace_executor(executor)
+        if not self.pool_usable():
+            raise BrokenProcessPool(f"No render process pool: {self.pool_error}")
+        executor = self.executor
+        return executor, executor.submit(fn, *args)
+
+    def _replace_executor(self, broken):
+        """Swaps a broken process pool for a new one (unless another dispatcher already did)."""
+        if self.executor is not broken:
+            return
+        self.counters['pool_restarts'] += 1
+        print("A render process died; replacing the render process pool.", file=sys.stderr)
+        broken.shutdown(wait=False, cancel_futures=True)
+        try:
+            self.executor = self.executor_factory()
+            self.pool_error = None
+        except Exception as e:
+            self.pool_error = f"{type(e).__name__}: {e}"
+            print(f"Could not create a render process pool: {self.pool_error}", file=sys.stderr)
+
+    async def _run_render(self, flight):
+        """Renders a flight on the process pool, on a new pool if the current one breaks under it."""
+        for attempt in range(1, MAX_RENDER_ATTEMPTS + 1):
+            executor, future = self._submit(render_service_job, flight.job, self.font_dir)
+            try:
+                return await asyncio.wrap_future(future)
+            except BrokenProcessPool:
+                self._replace_executor(executor)
+                if attempt == MAX_RENDER_ATTEMPTS:
+                    raise
+                self.counters['retried'] += 1
+                print(f"Retrying job {flight.job.get('id')} after its render process died.", file=sys.stderr)
+
+    def stats(self):
+        return {**self.counters, 'shed': dict(self.shed), 'queued': dict(self._queued), 'running': self.running,
+                'in_flight': len(self._flights), 'workers': self.workers}
+
+    async def render(self, job):
+        """(encoded_bytes, format, elapsed_ms, coalesced) for a validated job. Raises Overloaded when shed."""
+        lane = job.get('priority', 'interactive')
+        self.counters['requests'] += 1
+        key = render_key(job, self.font_dir)
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.counters['coalesced'] += 1
+            if LANES.index(lane) < LANES.index(flight.lane) and not flight.started:
+                await self._promote(flight, lane)
+            return (*await asyncio.shield(flight.future), True)
+
+        if self._queued[lane] >= self.max_queued[lane]:
+            self.shed[lane] += 1
+            raise Overloaded(f"The {lane} queue is full ({self.max_queued[lane]} renders)")
+        loop = asyncio.get_running_loop()
+        flight = Flight(key, job, lane, loop.create_future(), loop.time())
+        flight.prefetch = asyncio.create_task(self._prefetch(job))
+        self._flights[key] = flight
+        self._queued[lane] += 1
+        async with self._ready:
+            heapq.heappush(self._heap, (LANES.index(lane), next(self._sequence), flight))
+            self._ready.notify()
+        return (*await asyncio.shield(flight.future), False)
+
+    async def _promote(self, flight, lane):
+        self.counters['promoted'] += 1
+        self._queued[flight.lane] -= 1
+        self._queued[lane] += 1
+        flight.lane = lane
+        async with self._ready:
+            heapq.heappush(self._heap, (LANES.index(lane), next(self._sequence), flight))
+            self._ready.notify()
+
+    async def _prefetch(self, job):
+        """Fetches the job's images into the shared image cache on the I/O pool; failures are left for the render to report."""
+        loop = asyncio.get_running_loop()
+        try:
+            with span('prefetch', lane=job.get('priority', 'interactive')):
+                template = await loop.run_in_executor(self.io_executor, _read_template, job)
+                urls = collect_image_urls(template, job.get('base_image_url'))
+                fetcher = get_image_fetcher()
+                await asyncio.gather(*(loop.run_in_executor(self.io_executor, fetcher.fetch, url) for url in urls), return_exceptions=True)
+        except Exception as e:
+            print(f"Prefetch failed for job {job.get('id')}: {e}", file=sys.stderr)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self._ready:
+                await self._ready.wait_for(lambda: self._heap)
+                _rank, _sequence, flight = heapq.heappop(self._heap)
+            if flight.started: # The second heap entry of a promoted flight
+                continue
+            flight.started = True
+            self._queued[flight.lane] -= 1
+            try:
+                if loop.time() - flight.queued_at > self.max_wait[flight.lane]:
+                    self.shed[flight.lane] += 1
+                    raise Overloaded(f"Waited more than {self.max_wait[flight.lane]:g}s in the {flight.lane} queue")
+                await flight.prefetch
+                self.running += 1
+                try:
+                    result = await self._run_render(flight)
+                finally:
+                    self.running -= 1
+                self.counters['rendered'] += 1
+                flight.future.set_result(result)
+            except Exception as e:
+                if not isinstance(e, Overloaded):
+                    self.counters['failed'] += 1
+                flight.future.set_exception(e)
+            finally:
+                self._flights.pop(flight.key, None)
+
+
+# --- HTTP ---
+
+def json_response(status, payload, headers=None):
+    return status, {'Content-Type': 'application/json', **(headers or {})}, json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+
+async def handle_request(service, method, target, body):
+    """(status, headers, body) for one HTTP request."""
+    url = urlsplit(target)
+    if url.path == '/healthz':
+        if not service.pool_usable():
+            return 503, {'Content-Type': 'text/plain'}, f"render pool unusable: {service.pool_error}".encode('utf-8')
+        return 200, {'Content-Type': 'text/plain'}, b'ok'
+    if url.path == '/stats':
+        return json_response(200, service.stats())
+    if url.path != '/render':
+        return json_response(404, {'error': f"Unknown path {url.path}"})
+    if method not in ('GET', 'POST'):
+        return json_response(405, {'error': f"{method} is not supported"})
+
+    try:
+        job = job_from_query(url.query) if method == 'GET' else json.loads(body or b'null')
+        if method == 'POST' and url.query and isinstance(job, dict):
+            job.update(job_from_query(url.query)) # e.g. ?priority=bulk
+        job = validate_job(job)
+    except (BadRequest, ValueError) as e:
+        return json_response(400, {'error': str(e)})
+
+    try:
+        encoded_bytes, chosen_format, elapsed_ms, coalesced = await service.render(job)
+    except Overloaded as e:
+        return json_response(503, {'error': str(e)}, {'Retry-After': str(RETRY_AFTER_SECONDS)})
+    except FileNotFoundError as e:
+        return json_response(404, {'error': str(e)})
+    except Exception as e:
+        print(f"Error rendering job {job.get('id')}: {e}", file=sys.stderr)
+        return json_response(500, {'error': f"{type(e).__name__}: {e}"})
+    return 200, {'Content-Type': CONTENT_TYPES.get(chosen_format, 'application/octet-stream'),
+                 'X-Render-Ms': str(elapsed_ms), 'X-Coalesced': '1' if coalesced else '0'}, encoded_bytes
+
+
+async def read_request(reader):
+    """(method, target, body) of one HTTP/1.1 request. Raises BadRequest."""
+    request_line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise BadRequest("Malformed request line")
+    method, target, _version = parts
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY_BYTES:
+        raise PayloadTooLarge(f"Request body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return method, target, body
+
+
+async def handle_connection(service, reader, writer):
+    """Serves one request per connection (Connection: close)."""
+    try:
+        try:
+            method, target, body = await read_request(reader)
+            status, headers, payload = await handle_request(service, method, target, body)
+        except (BadRequest, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            status, headers, payload = json_response(413 if isinstance(e, PayloadTooLarge) else 400, {'error': str(e) or type(e).__name__})
+        head = [f"HTTP/1.1 {status} {STATUS_REASONS.get(status, '')}", f"Content-Length: {len(payload)}", "Connection: close"]
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + payload)
+        await writer.drain()
+    except ConnectionError:
+        pass # The client went away; a shared render still completes for the others
+    finally:
+        writer.close()
+
+
+async def serve(host, port, font_dir, workers, max_queued, max_wait, io_workers=DEFAULT_IO_WORKERS, quiet=True, trace=None):
+    # Spawned (not forked) render processes: this process already runs the event loop and I/O threads
+    executor_factory = lambda: ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                                   initializer=init_worker_process, initargs=(font_dir, quiet, trace))
+    io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='render-service-io')
+    service = RenderService(executor_factory, io_executor, font_dir, workers, max_queued, max_wait)
+    dispatchers = service.start()
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(service, reader, writer), host, port)
+    print(f"Render service listening on http://{host}:{server.sockets[0].getsockname()[1]} with {workers} render processes", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for dispatcher in dispatchers:
+            dispatcher.cancel()
+        service.executor.shutdown(wait=False, cancel_futures=True)
+        io_executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local HTTP render service that coalesces identical concurrent render requests.")
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on (default: 8080; 0 picks a free port)')
+    parser.add_argument('--fonts', default='./assets/fonts', help='Default font assets directory for jobs (default: ./assets/fonts)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of render processes (default: CPU count)')
+    parser.add_argument('--io-workers', type=int, default=DEFAULT_IO_WORKERS, help=f'Threads fetching images (default: {DEFAULT_IO_WORKERS})')
+    for lane in LANES:
+        parser.add_argument(f'--max-{lane}-queue', type=int, default=DEFAULT_MAX_QUEUED[lane],
+                            help=f'{lane.capitalize()} renders queued before shedding (default: {DEFAULT_MAX_QUEUED[lane]})')
+        parser.add_argument(f'--{lane}-timeout', type=float, default=DEFAULT_MAX_WAIT[lane],
+                            help=f'Seconds a {lane} render may wait for a render process (default: {DEFAULT_MAX_WAIT[lane]:g})')
+    parser.add_argument('--verbose', action='store_true', help='Forward renderer logs to stderr')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure_tracing_from_args(args)
+    trace = (args.trace, args.trace_output, args.trace_format) if args.trace != 'off' else None
+
+    max_queued = {lane: getattr(args, f'max_{lane}_queue') for lane in LANES}
+    max_wait = {lane: getattr(args, f'{lane}_timeout') for lane in LANES}
+    try:
+        asyncio.run(serve(args.host, args.port, args.fonts, args.workers or os.cpu_count() or 1, max_queued, max_wait,
+                          args.io_workers, not args.verbose, trace))
+    except KeyboardInterrupt:
+        pass
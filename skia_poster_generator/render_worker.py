@@ -0,0 +1,232 @@
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+from fitted_images import FITTED_IMAGES
+from font_cache import FONT_REGISTRY, LRUCache
+from generate_thumbnial_skia import compile_skia_template, encode_skia_image, render_languages_skia, save_skia_image
+from image_encoding import DEFAULT_QUALITY, format_from_path, write_encoded
+from image_fetch import get_image_fetcher
+from layers import language_output_path
+from output_cache import get_output_cache
+from shadow_masks import SHADOW_MASKS
+from static_layers import DEFAULT_STATIC_SPLIT, STATIC_LAYERS
+from text_wrap import WORD_WRAPPER
+from tracing import add_trace_arguments, configure_tracing_from_args, span, trace_context
+
+# --- Render Worker ---
+# Long-lived worker that reads render jobs as JSON lines on stdin and writes one
+# JSON result line per job on stdout. Font and image caches stay warm between
+# jobs, so a driver (e.g. the bulk processor) can keep N workers busy without
+# paying interpreter start-up, imports and font loading per poster.
+#
+# Job:
+#   {"id": "42", "template": {...} | "template_path": "poster.json",
+#    "lang": "hi-IN" | "langs": ["hi-IN", "en-IN"],
+#    "output": "out_{lang}.png",          # optional; omit to get base64 images inline
+#    "format": "png|jpeg|webp|png8|auto", "quality": 85,   # optional; format defaults to the output extension
+#    "fonts": "./assets/fonts", "base_image_url": "...",
+#    "canvas_width": 1080, "canvas_height": 1080,   # optional overrides
+#    "scale": 0.25 | "target_width": 270,        # optional; render directly at output size
+#    "static_split": "auto|tags|none",           # optional; see static_layers
+#    "output_cache": true}                       # optional; reuse unchanged outputs, see output_cache
+# Result:
+#   {"id": "42", "ok": true, "outputs": {"hi-IN": "out_hi-IN.png"}, "elapsed_ms": 81.2}
+#   {"id": "42", "ok": true, "outputs": {...}, "cached": ["hi-IN"], "elapsed_ms": 3.4}   # with output_cache
+#   {"id": "42", "ok": true, "images": {"hi-IN": "<base64>"}, "formats": {"hi-IN": "png"}, "elapsed_ms": 80.7}
+#   {"id": "42", "ok": false, "error": "..."}
+# Control messages: {"cmd": "stats"} and {"cmd": "shutdown"}.
+#
+# Renderer logging goes to stderr; stdout carries only protocol lines.
+#
+# Templates given by template_path are compiled to a display list once and
+# reused until the file changes.
+
+DEFAULT_MAX_TEMPLATES = 64
+
+# (path, mtime, fonts, canvas size, requested languages) -> CompiledTemplate
+COMPILED_TEMPLATES = LRUCache(DEFAULT_MAX_TEMPLATES)
+
+
+def load_job_template(job):
+    if 'template' in job:
+        return job['template']
+    with open(job['template_path'], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def requested_languages(job):
+    if job.get('langs'):
+        return list(job['langs'])
+    if job.get('lang'):
+        return [job['lang']]
+    return []
+
+
+def job_languages(job, language_settings):
+    return requested_languages(job) or [language_settings.get('current_language', 'en-IN')]
+
+
+def compile_job_template(job, font_dir):
+    """Compiles the job's template, reusing the cached display list for unchanged template files."""
+    def compile_template():
+        template = load_job_template(job)
+        # Mirror the CLI: the first requested language is the default if the template has none
+        lang_settings = dict(template.get('language_settings') or {})
+        lang_settings.setdefault('default_language', {'code': job_languages(job, lang_settings)[0]})
+        template = dict(template, language_settings=lang_settings)
+        return compile_skia_template(template, font_dir, job.get('canvas_width'), job.get('canvas_height'))
+
+    if 'template' in job:
+        return compile_template()
+    path = os.path.abspath(job['template_path'])
+    key = (path, os.stat(path).st_mtime_ns, font_dir, job.get('canvas_width'), job.get('canvas_height'), tuple(requested_languages(job)))
+    return COMPILED_TEMPLATES.get(key, compile_template)
+
+
+def run_job(job, default_font_dir):
+    """Renders one job and returns its result dict (without id/timing). Trace events carry the job id and template path."""
+    with trace_context(job=job.get('id'), template=job.get('template_path')), span('job'):
+        return render_job(job, default_font_dir)
+
+
+def render_job_languages(job, default_font_dir):
+    """(languages, generator of (lang, skia.Image)) for a job."""
+    with span('compile'):
+        template = compile_job_template(job, job.get('fonts', default_font_dir))
+    languages = job_languages(job, template.language_settings)
+
+    rendered = render_languages_skia(
+        template, languages,
+        base_image_url=job.get('base_image_url'),
+        scale=job.get('scale'),
+        target_width=job.get('target_width'),
+        static_split=job.get('static_split', DEFAULT_STATIC_SPLIT),
+    )
+    return languages, rendered
+
+
+def encode_job_images(job, rendered):
+    """Yields (lang, encoded_bytes, chosen_format) for rendered images in the job's format (default png)."""
+    for lang, image_snapshot in rendered:
+        encoded_bytes, chosen_format = encode_skia_image(image_snapshot, job.get('format') or 'png', job.get('quality', DEFAULT_QUALITY))
+        if encoded_bytes is None:
+            raise RuntimeError(f"Failed to encode image for {lang}")
+        yield lang, encoded_bytes, chosen_format
+
+
+def job_output_path(output_path, lang, languages):
+    if len(languages) == 1 and '{lang}' not in output_path:
+        return output_path
+    return language_output_path(output_path, lang)
+
+
+def render_job(job, default_font_dir):
+    if job.get('output_cache'):
+        return render_cached_job(job, default_font_dir)
+    languages, rendered = render_job_languages(job, default_font_dir)
+
+    output_path = job.get('output')
+    output_format = job.get('format')
+    quality = job.get('quality', DEFAULT_QUALITY)
+    if output_path:
+        outputs = {}
+        for lang, image_snapshot in rendered:
+            lang_output_path = job_output_path(output_path, lang, languages)
+            saved_path = save_skia_image(image_snapshot, lang_output_path, output_format, quality)
+            if not saved_path:
+                raise RuntimeError(f"Failed to save image for {lang} to {lang_output_path}")
+            outputs[lang] = saved_path
+        return {'outputs': outputs}
+
+    images = {}
+    formats = {}
+    for lang, encoded_bytes, chosen_format in encode_job_images(job, rendered):
+        images[lang] = base64.b64encode(encoded_bytes).decode('ascii')
+        formats[lang] = chosen_format
+    return {'images': images, 'formats': formats}
+
+
+def render_cached_job(job, default_font_dir):
+    """render_job through the output cache: languages whose output is unchanged are not rendered."""
+    with span('compile'):
+        template = compile_job_template(job, job.get('fonts', default_font_dir))
+    languages = job_languages(job, template.language_settings)
+    output_path = job.get('output')
+    output_format = job.get('format') or (format_from_path(output_path) if output_path else 'png')
+    quality = job.get('quality', DEFAULT_QUALITY)
+    options = {'format': output_format, 'quality': quality, 'scale': job.get('scale'), 'target_width': job.get('target_width')}
+
+    def render(missing):
+        return render_languages_skia(template, missing, base_image_url=job.get('base_image_url'), scale=job.get('scale'),
+                                     target_width=job.get('target_width'), static_split=job.get('static_split', DEFAULT_STATIC_SPLIT))
+
+    def encode(image_snapshot):
+        return encode_skia_image(image_snapshot, output_format, quality)
+
+    outputs, images, formats, cached = {}, {}, {}, []
+    for lang, encoded_bytes, chosen_format, hit in get_output_cache().outputs(template, languages, 'skia', options, render, encode, job.get('base_image_url')):
+        if hit:
+            cached.append(lang)
+        if output_path:
+            outputs[lang] = write_encoded(job_output_path(output_path, lang, languages), encoded_bytes, chosen_format)
+        else:
+            images[lang] = base64.b64encode(encoded_bytes).decode('ascii')
+            formats[lang] = chosen_format
+    result = {'outputs': outputs} if output_path else {'images': images, 'formats': formats}
+    result['cached'] = cached
+    return result
+
+
+def worker_stats():
+    return {'fonts': FONT_REGISTRY.stats(), 'images': get_image_fetcher().stats(), 'templates': COMPILED_TEMPLATES.stats(), 'backgrounds': STATIC_LAYERS.stats(), 'fitted': FITTED_IMAGES.stats(), 'word_widths': WORD_WRAPPER.stats(), 'shadows': SHADOW_MASKS.stats(), 'outputs': get_output_cache().stats()}
+
+
+def serve(input_stream, output_stream, default_font_dir, output_cache=False):
+    """Processes jobs from input_stream until EOF or a shutdown command.
+
+    output_cache is the default for jobs that do not set "output_cache".
+    """
+    def respond(message):
+        output_stream.write(json.dumps(message, ensure_ascii=False) + "\n")
+        output_stream.flush()
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.get('id')
+            cmd = job.get('cmd')
+            if cmd == 'shutdown':
+                respond({'id': job_id, 'ok': True})
+                break
+            if cmd == 'stats':
+                respond({'id': job_id, 'ok': True, 'stats': worker_stats()})
+                continue
+            if output_cache:
+                job.setdefault('output_cache', True)
+            started = time.perf_counter()
+            result = run_job(job, default_font_dir)
+            respond({'id': job_id, 'ok': True, **result, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)})
+        except Exception as e:
+            print(f"Error processing job {job_id}: {e}", file=sys.stderr)
+            respond({'id': job_id, 'ok': False, 'error': f"{type(e).__name__}: {e}"})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Persistent Skia render worker speaking JSON lines over stdin/stdout.")
+    parser.add_argument('--fonts', default='./assets/fonts', help='Default font assets directory for jobs (default: ./assets/fonts)')
+    parser.add_argument('--output-cache', action='store_true', help='Reuse unchanged outputs from the output cache for jobs that do not set "output_cache" (directory: $POSTER_OUTPUT_CACHE_DIR)')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure_tracing_from_args(args)
+
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr # Keep renderer prints off the protocol stream
+    serve(sys.stdin, protocol_out, args.fonts, args.output_cache)
@@ -0,0 +1,145 @@
+import math
+
+import skia
+from PIL import Image
+
+from font_cache import SizedLRUCache
+
+# --- Shadow Masks ---
+# Blurred box shadows for the Skia renderer, kept as pre-blurred alpha masks.
+# Templates repeat the same card and avatar shapes with the same box_shadow
+# across elements and posters; each (shape, size, blur sigma, canvas scale)
+# is blurred once and later shadows tint the cached mask with their colour.
+# Masks are drawn 1:1 in device pixels, the only way Skia draws alpha masks
+# quickly, so they are rendered at the canvas scale and for the shadow origin's
+# position within a device pixel. The scale is quantized to 1/SCALE_STEPS and
+# the origin is snapped to 1/SUBPIXEL_STEPS of a device pixel, so elements
+# placed in percent still share masks; the shadow moves by at most 1/128 px.
+# Shadows on rotated or skewed canvases are not cached; callers fall back to a
+# blur mask filter.
+#
+# A shadow is cast by the filled shape: outlines do not widen it, as with the
+# direct blur the renderer used before.
+#
+# Every shadow the cache accepts is drawn from a mask, built on its first use:
+# a mask blurred at reduced resolution (below) differs slightly from Skia's
+# direct blur, so drawing directly until a key repeats would make a poster's
+# pixels depend on what the process rendered before.
+#
+# Blurs wider than LOW_RES_SIGMA device pixels are computed at reduced
+# resolution and upsampled (bilinear) to device size; a wide blur has no detail
+# the smaller raster loses, and the blur cost falls with the square of the factor.
+
+DEFAULT_MAX_MASK_BYTES = 64 * 1024 * 1024
+LOW_RES_SIGMA = 8.0 # Largest blur sigma (device pixels) computed at full resolution
+BLUR_EXTENT = 3.0 # Mask padding around the shape, in blur sigmas
+SCALE_STEPS = 65536 # Canvas scale quantization steps per unit
+SUBPIXEL_STEPS = 64 # Shadow origin positions per device pixel
+SHAPES = ('rect', 'oval')
+
+
+class ShadowMask:
+    """A blurred A8 mask; (left, top) is its offset in device pixels from the snapped shadow origin."""
+    __slots__ = ('image', 'left', 'top')
+
+    def __init__(self, image, left, top):
+        self.image = image
+        self.left = left
+        self.top = top
+
+
+def _quantize(value, steps):
+    return round(value * steps) / steps
+
+
+def _draw_shape(canvas, shape, width, height, sigma):
+    paint = skia.Paint(AntiAlias=True)
+    paint.setMaskFilter(skia.MaskFilter.MakeBlur(skia.kNormal_BlurStyle, sigma, True)) # Sigma follows the canvas scale
+    rect = skia.Rect.MakeWH(width, height)
+    if shape == 'oval':
+        canvas.drawOval(rect, paint)
+    else:
+        canvas.drawRect(rect, paint)
+
+
+class ShadowMaskCache(SizedLRUCache):
+    """Byte-bounded LRU of ShadowMasks with hit/miss counters; see the module header."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_MASK_BYTES):
+        super().__init__(max_bytes, lambda mask: mask.image.width() * mask.image.height())
+        self.low_res = 0 # Masks blurred at reduced resolution
+
+    def mask(self, shape, width, height, sigma, scale_x, scale_y, phase_x=0.0, phase_y=0.0):
+        """The ShadowMask for a shape of width x height (template pixels) drawn at the given canvas scale and origin phase.
+
+        Scale and phase are quantized (see the module header); the mask is drawn at the quantized values.
+        """
+        key = (shape, width, height, sigma, _quantize(scale_x, SCALE_STEPS), _quantize(scale_y, SCALE_STEPS),
+               _quantize(phase_x, SUBPIXEL_STEPS), _quantize(phase_y, SUBPIXEL_STEPS))
+        mask = self.lookup(key)
+        if mask is not None:
+            return mask
+        mask = self._render(*key)
+        self.put(key, mask)
+        return mask
+
+    def _render(self, shape, width, height, sigma, scale_x, scale_y, phase_x, phase_y):
+        device_sigma = sigma * math.sqrt(scale_x * scale_y) # Skia maps a CTM-relative sigma by the mean scale
+        pad = math.ceil(BLUR_EXTENT * device_sigma) + 1
+        mask_width = math.ceil(width * scale_x + phase_x) + 2 * pad
+        mask_height = math.ceil(height * scale_y + phase_y) + 2 * pad
+        reduction = max(1.0, device_sigma / LOW_RES_SIGMA)
+        raster_width, raster_height = math.ceil(mask_width / reduction), math.ceil(mask_height / reduction)
+
+        surface = skia.Surface.MakeRaster(skia.ImageInfo.MakeA8(raster_width, raster_height))
+        canvas = surface.getCanvas()
+        canvas.scale(1 / reduction, 1 / reduction)
+        canvas.translate(pad + phase_x, pad + phase_y)
+        canvas.scale(scale_x, scale_y)
+        _draw_shape(canvas, shape, width, height, sigma)
+        image = surface.makeImageSnapshot()
+
+        if reduction > 1.0:
+            with self._lock:
+                self.low_res += 1
+            small = Image.frombytes('L', (raster_width, raster_height), image.tobytes())
+            # The box keeps the raster's pixel grid aligned with the device grid despite the rounded-up raster size
+            upsampled = small.resize((mask_width, mask_height), Image.BILINEAR, box=(0, 0, mask_width / reduction, mask_height / reduction))
+            image = skia.Image.frombytes(upsampled.tobytes(), (mask_width, mask_height), skia.kAlpha_8_ColorType, skia.kPremul_AlphaType)
+        return ShadowMask(image, -pad, -pad)
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self.low_res = 0
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(low_res=self.low_res)
+        return stats
+
+
+def draw_cached_shadow(canvas, shape, x, y, width, height, sigma, color, cache=None):
+    """Draws a blurred filled-shape shadow (top-left at local x, y) in color from the mask cache.
+
+    Returns False without drawing when the canvas is rotated, skewed or flipped.
+    """
+    matrix = canvas.getTotalMatrix()
+    if not matrix.isScaleTranslate() or matrix.getScaleX() <= 0 or matrix.getScaleY() <= 0:
+        return False
+    origin = matrix.mapXY(x, y)
+    # The origin snaps to the subpixel grid the mask key is quantized to
+    origin_x, origin_y = _quantize(origin.x(), SUBPIXEL_STEPS), _quantize(origin.y(), SUBPIXEL_STEPS)
+    device_x, device_y = math.floor(origin_x), math.floor(origin_y)
+    mask = (cache if cache is not None else SHADOW_MASKS).mask(shape, width, height, sigma, matrix.getScaleX(), matrix.getScaleY(),
+                                                                 origin_x - device_x, origin_y - device_y)
+    canvas.save()
+    canvas.resetMatrix() # The clip stays in device space
+    canvas.drawImage(mask.image, device_x + mask.left, device_y + mask.top, skia.Paint(Color=color)) # An A8 image is tinted by the paint colour
+    canvas.restore()
+    return True
+
+
+# Shared by every render in this process.
+SHADOW_MASKS = ShadowMaskCache()
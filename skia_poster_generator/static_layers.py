@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+from font_cache import SizedLRUCache
+from image_fetch import canonical_url
+from layers import split_static_prefix
+
+# --- Static Background Cache ---
+# Personalized posters are one template rendered over and over with a different
+# photo and name. The base image plus the leading elements that are the same
+# for every personalization are flattened once and cached as a bitmap keyed by
+# a fingerprint of exactly what was drawn; each render then only fetches and
+# draws the dynamic elements on a copy of it. The fingerprint covers the content
+# of the static images (their SHA-256 from the image cache, see
+# fetch_digests), so a photo replaced behind the same URL is drawn anew once
+# its cache entry is revalidated. Backgrounds whose images cannot be fetched
+# are not cached. Backgrounds are full-size bitmaps, so the cache is bounded by
+# their pixel bytes (POSTER_STATIC_CACHE_BYTES, default 256 MiB) as well as by
+# count.
+#
+# Split modes:
+#   'auto' - elements tagged as personal (DYNAMIC_TAGS) and text are dynamic
+#   'tags' - only tagged elements are dynamic; static text is cached per language
+#   'none' - no static background caching
+
+STATIC_SPLITS = ('auto', 'tags', 'none')
+DEFAULT_STATIC_SPLIT = 'auto'
+DEFAULT_MAX_STATIC_LAYERS = 16
+DEFAULT_MAX_STATIC_BYTES = 256 * 1024 * 1024
+
+# TemplateElementTag values filled in per user
+DYNAMIC_TAGS = frozenset({
+    'userPicture', 'userName', 'userDesignation', 'userParty', 'userAddress',
+    'facebookHandle', 'instaHandle', 'twitterHandle',
+})
+
+
+def default_max_static_bytes():
+    return int(os.environ.get('POSTER_STATIC_CACHE_BYTES', DEFAULT_MAX_STATIC_BYTES))
+
+
+def background_nbytes(background):
+    """Pixel bytes of a cached background, a skia.Image or an RGBA Pillow image."""
+    width, height = (background.width(), background.height()) if callable(background.width) else background.size
+    return width * height * 4
+
+
+# Shared by every render in this process; values are backend bitmaps and must not be mutated
+STATIC_LAYERS = SizedLRUCache(default_max_static_bytes(), background_nbytes, DEFAULT_MAX_STATIC_LAYERS)
+
+
+def short_tag(tag):
+    return tag.rsplit('.', 1)[-1] # 'TemplateElementTag.userName' -> 'userName'
+
+
+def _node_tags(node):
+    while node is not None:
+        if node.tag:
+            yield short_tag(node.tag)
+        node = node.nested
+
+
+def is_dynamic_node(node, static_split=DEFAULT_STATIC_SPLIT, dynamic_tags=DYNAMIC_TAGS):
+    if static_split == 'none':
+        return True
+    if any(tag in dynamic_tags for tag in _node_tags(node)):
+        return True
+    return static_split == 'auto' and node.language_dependent
+
+
+def split_static_layers(nodes, static_split=DEFAULT_STATIC_SPLIT, dynamic_tags=DYNAMIC_TAGS):
+    """Splits draw-ordered nodes into (static prefix, dynamic rest) for a split mode."""
+    if static_split not in STATIC_SPLITS:
+        raise ValueError(f"Unknown static split '{static_split}', expected one of {', '.join(STATIC_SPLITS)}")
+    return split_static_prefix(nodes, lambda node: is_dynamic_node(node, static_split, dynamic_tags))
+
+
+def _without_presign(value):
+    if isinstance(value, dict):
+        return {k: canonical_url(v) if k == 'url' and isinstance(v, str) else _without_presign(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_without_presign(v) for v in value]
+    return value
+
+
+def static_layer_key(backend, template, static_nodes, base_image_url, render_scale, language, default_language_code, image_digests):
+    """Fingerprint of everything the static background depends on.
+
+    image_digests is {canonical url: SHA-256} for the static images (see
+    image_fetch.fetch_digests). Image URLs are compared without presign
+    parameters, like the image cache. The language only counts when a static
+    element draws text.
+    """
+    fingerprint = {
+        'backend': backend,
+        'size': [template.width, template.height],
+        'scale': render_scale,
+        'base_image': canonical_url(base_image_url) if base_image_url else None,
+        'elements': _without_presign([node.element for node in static_nodes]),
+        'images': image_digests,
+    }
+    if any(node.language_dependent for node in static_nodes):
+        fingerprint.update(language=language, default_language=default_language_code,
+                           fonts=template.font_asset_path, language_fonts=template.language_font_families)
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def assets_complete(assets, urls):
+    """True if every url was fetched and decoded, so a background drawn from them may be cached."""
+    return all(assets.get(url) is not None and not isinstance(assets.get(url), Exception) for url in urls)
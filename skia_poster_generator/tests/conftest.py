@@ -0,0 +1,44 @@
+import functools
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The generator modules are flat scripts: import them as the CLIs do
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+sys.path.insert(0, os.path.dirname(PACKAGE_DIR)) # generate_thumbnail.py (Pillow renderer)
+
+# Keep the shared image and output caches out of the user's home directory
+_CACHE_ROOT = tempfile.mkdtemp(prefix='poster_generator_tests-')
+os.environ.setdefault('POSTER_IMAGE_CACHE_DIR', os.path.join(_CACHE_ROOT, 'images'))
+os.environ.setdefault('POSTER_OUTPUT_CACHE_DIR', os.path.join(_CACHE_ROOT, 'outputs'))
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_directory(directory, handler=_QuietHandler):
+    """Serves directory on a local port for the duration of the block; yields the base URL."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(handler, directory=str(directory)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def fixture_server(tmp_path):
+    """(directory, base URL) of a local HTTP server for test images."""
+    with serve_directory(tmp_path) as url:
+        yield tmp_path, url
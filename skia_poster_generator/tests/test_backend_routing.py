@@ -0,0 +1,46 @@
+import json
+import os
+
+from PIL import Image
+
+from backend_routing import BACKENDS, DEFAULT_COST_MODELS, choose_backend, profile_template
+from display_list import compile_template
+
+# Benchmark profiles and decode + draw medians (benchmark.py cases drawable by
+# both backends) from the run DEFAULT_COST_MODELS were fitted on
+ROUTING_CASES = os.path.join(os.path.dirname(__file__), 'data', 'routing_cases.json')
+
+
+def _routing_cases():
+    with open(ROUTING_CASES, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_default_models_route_warm_renders_to_the_faster_backend():
+    for case, data in _routing_cases()['cases'].items():
+        measured = data['measured_ms']
+        backend, reason = choose_backend(data['profile'], DEFAULT_COST_MODELS, dict.fromkeys(BACKENDS, True))
+        assert backend == min(measured, key=measured.get), f"{case}: {reason}, measured {measured}"
+
+
+def test_default_models_route_one_shot_renders_to_the_faster_backend():
+    routing_cases = _routing_cases()
+    chosen = set()
+    for case, data in routing_cases['cases'].items():
+        measured = {backend: ms + routing_cases['startup_ms'][backend] for backend, ms in data['measured_ms'].items()}
+        backend, reason = choose_backend(data['profile'], DEFAULT_COST_MODELS, dict.fromkeys(BACKENDS, False))
+        assert backend == min(measured, key=measured.get), f"{case}: {reason}, measured {measured}"
+        chosen.add(backend)
+    assert chosen == set(BACKENDS) # The profile, not only the import times, decides
+
+
+def test_profile_counts_decoded_megapixels(fixture_server):
+    directory, url = fixture_server
+    Image.new('RGB', (2000, 1000), 'white').save(directory / 'base.jpg')
+    template = compile_template({"original_width": 1000, "original_height": 500, "base_image_url": url + 'base.jpg', "content_json": [],
+                                 "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}}})
+    assert profile_template(template, 'en-IN', 1.0)['decoded_mp'] == 2.0 # Drawn at half size: no reduction below 2x
+    assert profile_template(template, 'en-IN', 0.25)['decoded_mp'] == 0.125
+    missing = compile_template({"original_width": 1000, "original_height": 500, "base_image_url": url + 'missing.jpg', "content_json": [],
+                                "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}}})
+    assert profile_template(missing, 'en-IN', 1.0)['decoded_mp'] == 0
@@ -0,0 +1,59 @@
+import pytest
+from PIL import Image, ImageChops
+
+from banded_render import PNGStreamWriter, band_ranges, check_banded_format
+import generate_thumbnial_skia
+
+TEMPLATE = {
+    "original_width": 200, "original_height": 300, "base_image_url": None,
+    "content_json": [{"type": "shape", "box": {"x_px": 20, "y_px": 30, "width_px": 160, "height_px": 200, "rotation": 15},
+                      "content": {"shapeType": "ShapeType.circle", "fillColor": "#ff336699"},
+                      "style": {"opacity": 1, "box_shadow": {"color": "#00000080", "offsetX": 4, "offsetY": 8, "blurRadius": 10, "spreadRadius": 0}},
+                      "z_index": 0, "tag": "TemplateElementTag.defaulty"}],
+    "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}},
+}
+
+
+def test_band_ranges_cover_every_row_once():
+    assert band_ranges(10, 4) == [(0, 4), (4, 8), (8, 10)]
+    assert band_ranges(8, 4) == [(0, 4), (4, 8)]
+    assert band_ranges(3, 0) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_streamed_png_decodes_to_the_bands(tmp_path):
+    image = Image.radial_gradient('L').resize((70, 150)).convert('RGBA')
+    image.putalpha(Image.linear_gradient('L').resize((70, 150)))
+    path = str(tmp_path / 'out.png')
+    writer = PNGStreamWriter(path, 70, 150)
+    for top, bottom in band_ranges(150, 97): # Bands span several filter runs and end mid-run
+        writer.write_band(image.crop((0, top, 70, bottom)))
+    assert writer.close() == path
+    with Image.open(path) as written:
+        assert written.mode == 'RGBA'
+        assert written.tobytes() == image.tobytes()
+
+
+def test_short_png_is_not_left_behind(tmp_path):
+    path = tmp_path / 'out.png'
+    writer = PNGStreamWriter(str(path), 10, 10)
+    writer.write_band(Image.new('RGBA', (10, 4)))
+    with pytest.raises(ValueError):
+        writer.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_banded_render_matches_the_whole_poster(tmp_path):
+    whole_path = generate_thumbnial_skia.create_image_from_json_skia(TEMPLATE, str(tmp_path / 'whole.png'), static_split='none')
+    banded_path = generate_thumbnial_skia.create_image_from_json_skia(TEMPLATE, str(tmp_path / 'banded.png'), band_height=64)
+    with Image.open(whole_path) as whole, Image.open(banded_path) as banded:
+        assert banded.size == whole.size
+        assert ImageChops.difference(banded.convert('RGBA'), whole.convert('RGBA')).getbbox() is None
+
+
+@pytest.mark.parametrize('output_format', ['jpeg', 'webp', 'png8', 'auto'])
+def test_banded_render_rejects_formats_it_cannot_stream(tmp_path, output_format):
+    with pytest.raises(ValueError, match='PNG only'):
+        check_banded_format(output_format)
+    with pytest.raises(ValueError, match='PNG only'):
+        generate_thumbnial_skia.create_image_from_json_skia(TEMPLATE, str(tmp_path / 'out.png'), output_format=output_format, band_height=64)
+    assert list(tmp_path.iterdir()) == []
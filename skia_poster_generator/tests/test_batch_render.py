@@ -0,0 +1,30 @@
+import json
+import os
+
+import batch_render
+
+TEMPLATE = {
+    "original_width": 200, "original_height": 200, "base_image_url": None,
+    "content_json": [{"type": "shape", "box": {"x_px": 20, "y_px": 20, "width_px": 160, "height_px": 160, "rotation": 0},
+                      "content": {"shapeType": "ShapeType.rectangle", "fillColor": "#ff336699"},
+                      "style": {"opacity": 1}, "z_index": 0, "tag": "TemplateElementTag.defaulty"}],
+    "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}},
+}
+RENDER_BATCH_JOB = batch_render.render_batch_job
+
+
+def _crashing_batch_job(job_id, *args):
+    if job_id == 'crash':
+        os._exit(1) # Dies like a render process killed by a native crash
+    return RENDER_BATCH_JOB(job_id, *args)
+
+
+def test_dead_render_process_fails_its_jobs_and_the_batch_continues(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_render, 'render_batch_job', _crashing_batch_job) # Pool processes are forked with it
+    line = json.dumps({'template': TEMPLATE, 'lang': 'en-IN'})
+    jobs = [(job_id, ('line', line)) for job_id in ('before', 'crash', 'after', 'last')]
+    entries = list(batch_render.run_batch(jobs, str(tmp_path), './assets/fonts', workers=1, max_in_flight=1))
+    assert [entry['id'] for entry in entries] == ['before', 'crash', 'after', 'last']
+    assert [entry['ok'] for entry in entries] == [True, False, True, True]
+    assert entries[1]['error'].startswith('BrokenProcessPool')
+    assert os.path.exists(entries[3]['outputs']['en-IN'])
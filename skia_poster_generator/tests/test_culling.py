@@ -0,0 +1,54 @@
+from PIL import Image
+
+from culling import cull_elements
+import generate_thumbnail
+import generate_thumbnial_skia
+
+SIZE = 400
+
+
+def _image_element(url, fit='BoxFit.cover'):
+    return {"type": "image", "box": {"x_px": 0, "y_px": 0, "width_px": SIZE, "height_px": SIZE, "rotation": 0},
+            "content": {"url": url}, "style": {"opacity": 1, "imageFit": fit}, "z_index": 0, "tag": "TemplateElementTag.defaulty"}
+
+
+def _template(url, elements):
+    return {"original_width": SIZE, "original_height": SIZE, "base_image_url": url + 'base.jpg', "content_json": elements,
+            "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}}}
+
+
+def _write_base_image(directory):
+    Image.radial_gradient('L').resize((SIZE, SIZE)).convert('RGB').save(directory / 'base.jpg', quality=95)
+
+
+def test_unavailable_cover_does_not_occlude():
+    elements = [_image_element('http://example.invalid/a.png'), _image_element('http://example.invalid/cover.jpg')]
+    kept, report = cull_elements(elements, SIZE, SIZE)
+    assert kept == elements[1:]
+    assert report['base_image_occluded']
+    assert report['cover_urls'] == ['http://example.invalid/cover.jpg']
+
+    kept, report = cull_elements(elements, SIZE, SIZE, unavailable_urls={'http://example.invalid/cover.jpg'})
+    assert kept == elements
+    assert not report['base_image_occluded']
+    assert report['cover_urls'] == []
+
+
+def _render_skia(json_data):
+    return [generate_thumbnial_skia.skia_image_to_pil(image)
+            for _lang, image in generate_thumbnial_skia.render_languages_skia(json_data, ['en-IN'], static_split='none')][0]
+
+
+def _render_pil(json_data):
+    return [image for _lang, image in generate_thumbnail.render_languages(json_data, ['en-IN'], static_split='none')][0]
+
+
+def test_failed_cover_image_keeps_base_image(fixture_server):
+    directory, url = fixture_server
+    _write_base_image(directory)
+    with_missing_cover = _template(url, [_image_element(url + 'missing.jpg')]) # 404
+    base_only = _template(url, [])
+    for render in (_render_skia, _render_pil):
+        image = render(with_missing_cover)
+        assert image.getchannel('A').getextrema() == (255, 255)
+        assert image.tobytes() == render(base_only).tobytes()
@@ -0,0 +1,65 @@
+from display_list import ImageNode, Node, ShapeNode, TextNode, compile_template, parse_hex_color
+import generate_thumbnail
+import generate_thumbnial_skia
+
+
+def _element(el_type, box, content, style=None, z_index=0, nested=None):
+    return {"type": el_type, "box": box, "content": content, "style": style or {"opacity": 1}, "z_index": z_index,
+            "tag": "TemplateElementTag.defaulty", "nested_content": {"content": nested, "contentFit": "BoxFit.cover"} if nested else None}
+
+
+TEMPLATE = {
+    "original_width": 200, "original_height": 100, "base_image_url": None,
+    "content_json": [
+        _element('shape', {"x_px": 20, "y_px": 10, "width_px": 100, "height_px": 80, "rotation": 0},
+                 {"shapeType": "ShapeType.oval", "fillColor": "#FFE08A", "strokeColor": "#00F", "strokeWidth": 2}, z_index=2,
+                 nested=_element('text', {"x_percent": 10, "y_percent": 25, "width_percent": 80, "height_percent": 50, "rotation": 0},
+                                 {"en-IN": {"text": "Hi"}, "fallback": "Hello"}, {"color": "#202020", "opacity": 0.5, "font_size": 5})),
+        _element('image', {"x_percent": 50, "y_percent": 0, "width_percent": 50, "height_percent": 100, "rotation": 0},
+                 {"url": "http://example.invalid/photo.jpg"}, z_index=1),
+        _element('sticker', {"x_px": 0, "y_px": 0, "width_px": 10, "height_px": 10, "rotation": 0}, {}),
+    ],
+    "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}},
+}
+
+
+def test_colours():
+    assert parse_hex_color('#03F') == (0, 51, 255, 255)
+    assert parse_hex_color('#11223344') == (17, 34, 51, 68)
+    assert parse_hex_color('#xyz123') is None
+    assert parse_hex_color(None) is None
+
+
+def test_nodes_are_typed_and_nested_content_is_a_child_node():
+    template = compile_template(TEMPLATE, 'fonts')
+    shape, image, sticker = template.nodes
+    assert (type(shape), type(image), type(sticker)) == (ShapeNode, ImageNode, Node)
+    assert shape.is_oval and shape.fill == (255, 224, 138, 255) and shape.stroke == (0, 0, 255, 255)
+    assert (image.x, image.y, image.width, image.height) == (100, 0, 100, 100)
+    assert image.image_urls == ("http://example.invalid/photo.jpg",)
+
+    text = shape.nested
+    assert type(text) is TextNode
+    assert (text.x, text.y, text.width, text.height) == (10, 20, 80, 40) # Relative to the shape's box
+    assert shape.language_dependent and not image.language_dependent
+    assert text.font_path == 'fonts/English.ttf'
+    assert text.faded_color == (32, 32, 32, 127)
+    assert text.text_for('en-IN', 'en-IN') == 'Hi'
+    assert text.text_for('hi-IN', 'mr-IN') == 'Hello'
+
+
+def test_draw_order():
+    assert [node.kind for node in compile_template(TEMPLATE).nodes] == ['shape', 'image', 'sticker']
+    assert [node.kind for node in compile_template(TEMPLATE, sort_by_z=True).nodes] == ['sticker', 'image', 'shape']
+
+
+def test_compiled_template_renders_like_the_dict():
+    compiled = generate_thumbnial_skia.compile_skia_template(TEMPLATE)
+    for _ in range(2): # Reusable
+        [(_lang, image)] = generate_thumbnial_skia.render_languages_skia(compiled, ['en-IN'], static_split='none')
+        [(_lang, expected)] = generate_thumbnial_skia.render_languages_skia(TEMPLATE, ['en-IN'], static_split='none')
+        assert image.tobytes() == expected.tobytes()
+    compiled = generate_thumbnail.compile_pil_template(TEMPLATE)
+    [(_lang, image)] = generate_thumbnail.render_languages(compiled, ['en-IN'], static_split='none')
+    [(_lang, expected)] = generate_thumbnail.render_languages(TEMPLATE, ['en-IN'], static_split='none')
+    assert image.tobytes() == expected.tobytes()
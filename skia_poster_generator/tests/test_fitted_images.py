@@ -0,0 +1,50 @@
+import shutil
+
+import pytest
+from PIL import Image
+
+from fitted_images import FITTED_IMAGES
+import generate_thumbnail
+import generate_thumbnial_skia
+
+
+def _template(url):
+    return {"original_width": 300, "original_height": 200, "base_image_url": None,
+            "content_json": [{"type": "image", "box": {"x_px": 30, "y_px": 20, "width_px": 150, "height_px": 120, "rotation": 0},
+                              "content": {"url": url}, "style": {"opacity": 1, "imageFit": "BoxFit.cover"}, "z_index": 0,
+                              "tag": "TemplateElementTag.defaulty"}],
+            "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}}}
+
+
+def _render_skia(json_data):
+    [(_lang, image)] = generate_thumbnial_skia.render_languages_skia(json_data, ['en-IN'], static_split='none')
+    return image.tobytes()
+
+
+def _render_pil(json_data):
+    [(_lang, image)] = generate_thumbnail.render_languages(json_data, ['en-IN'], static_split='none')
+    return image.tobytes()
+
+
+@pytest.mark.parametrize('module, render, decode', [
+    (generate_thumbnial_skia, _render_skia, 'decode_skia_image'),
+    (generate_thumbnail, _render_pil, 'decode_pil_image'),
+])
+def test_fitted_image_is_reused_by_content_without_decoding(fixture_server, monkeypatch, module, render, decode):
+    directory, url = fixture_server
+    Image.radial_gradient('L').resize((640, 480)).convert('RGB').save(directory / 'photo.jpg', quality=90)
+    shutil.copy(directory / 'photo.jpg', directory / 'same_photo.jpg')
+    FITTED_IMAGES.clear()
+
+    expected = render(_template(url + 'photo.jpg'))
+    stats = FITTED_IMAGES.stats()
+    assert (stats['entries'], stats['misses']) == (1, 1)
+    assert stats['bytes'] > 0
+
+    decoded = []
+    real_decode = getattr(module, decode)
+    monkeypatch.setattr(module, decode, lambda *args: decoded.append(args) or real_decode(*args))
+    assert render(_template(url + 'same_photo.jpg')) == expected # Same bytes behind another URL
+    assert decoded == []
+    stats = FITTED_IMAGES.stats()
+    assert (stats['entries'], stats['misses'], stats['hits']) == (1, 1, 1)
@@ -0,0 +1,20 @@
+import os
+
+from font_cache import FontRegistry
+
+FONT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'fonts', 'English.ttf')
+
+
+def test_typeface_is_parsed_once_per_file():
+    registry = FontRegistry()
+    small, large = registry.get_skia_font(FONT, 12), registry.get_skia_font(FONT, 40)
+    assert small.getTypeface() is large.getTypeface()
+    assert registry.get_skia_font(FONT, 12) is small
+    assert registry.get_skia_typeface(FONT) is small.getTypeface()
+    assert registry.stats()['entries'] == 3 # One typeface, two sized fonts
+
+
+def test_pil_fonts_are_cached_per_size():
+    registry = FontRegistry()
+    assert registry.get_pil_font(FONT, 20) is registry.get_pil_font(FONT, 20.4)
+    assert registry.get_pil_font(FONT, 21) is not registry.get_pil_font(FONT, 20)
@@ -0,0 +1,43 @@
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from geometry import resolve_render_scale, scaled_size
+import generate_thumbnail
+import generate_thumbnial_skia
+
+TEMPLATE = {
+    "original_width": 400, "original_height": 300, "base_image_url": None,
+    "content_json": [{"type": "shape", "box": {"x_px": 40, "y_px": 30, "width_px": 300, "height_px": 200, "rotation": 20},
+                      "content": {"shapeType": "ShapeType.oval", "fillColor": "#ff3366ff", "strokeColor": "#202020ff", "strokeWidth": 8},
+                      "style": {"opacity": 1}, "z_index": 0, "tag": "TemplateElementTag.defaulty"}],
+    "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}},
+}
+
+
+def test_render_scale():
+    assert resolve_render_scale(1080) == 1.0
+    assert resolve_render_scale(1080, scale=0.25) == 0.25
+    assert resolve_render_scale(1080, scale=0.5, target_width=270) == 0.25 # target_width wins
+    with pytest.raises(ValueError):
+        resolve_render_scale(1080, scale=-1)
+    assert scaled_size(1080, 1920, 0.25) == (270, 480)
+    assert scaled_size(3, 3, 0.01) == (1, 1)
+
+
+def _render_skia(scale):
+    [(_lang, image)] = generate_thumbnial_skia.render_languages_skia(TEMPLATE, ['en-IN'], scale=scale, static_split='none')
+    return generate_thumbnial_skia.skia_image_to_pil(image)
+
+
+def _render_pil(scale):
+    [(_lang, image)] = generate_thumbnail.render_languages(TEMPLATE, ['en-IN'], scale=scale, static_split='none')
+    return image
+
+
+@pytest.mark.parametrize('render', [_render_skia, _render_pil])
+def test_thumbnail_matches_a_downscaled_poster(render):
+    thumbnail = render(0.25)
+    assert thumbnail.size == (100, 75)
+    downscaled = render(None).resize(thumbnail.size, Image.Resampling.LANCZOS)
+    difference = ImageStat.Stat(ImageChops.difference(thumbnail, downscaled).convert('L'))
+    assert difference.mean[0] < 4 # Only edge antialiasing differs
@@ -0,0 +1,37 @@
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from image_encoding import encode_pil_image, output_path_for_format, to_palette_image
+
+
+def _flat_graphic():
+    image = Image.new('RGBA', (64, 48), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((4, 4, 40, 30), fill=(255, 51, 102, 255))
+    draw.rectangle((20, 20, 60, 44), fill=(255, 51, 102, 128)) # Same RGB, other alpha
+    draw.ellipse((30, 2, 50, 18), fill=(46, 134, 171, 255))
+    return image
+
+
+def test_palette_image_is_exact_for_few_colours():
+    image = _flat_graphic()
+    encoded, chosen_format = encode_pil_image(image, 'png8')
+    assert chosen_format == 'png8'
+    decoded = Image.open(BytesIO(encoded))
+    assert decoded.mode == 'P'
+    assert decoded.convert('RGBA').tobytes() == image.tobytes()
+
+
+def test_palette_image_is_quantized_beyond_256_colours():
+    image = Image.linear_gradient('L').convert('RGBA').resize((64, 64))
+    image.putalpha(255)
+    image = Image.merge('RGBA', (image.getchannel('R'), image.getchannel('R').rotate(90), image.getchannel('G'), image.getchannel('A')))
+    assert image.getcolors(256) is None
+    assert to_palette_image(image).mode == 'P'
+
+
+def test_auto_picks_palette_png_for_flat_graphics_and_jpeg_extension_follows():
+    assert encode_pil_image(_flat_graphic(), 'auto')[1] == 'png8'
+    assert output_path_for_format('out/poster.png', 'jpeg') == 'out/poster.jpg'
+    assert output_path_for_format('out/poster.png', 'png8') == 'out/poster.png'
@@ -0,0 +1,111 @@
+import hashlib
+import os
+
+import pytest
+import requests
+
+from conftest import _QuietHandler, serve_directory
+from image_fetch import EVICT_TO_FRACTION, ImageFetcher, url_cache_key
+
+
+class _ETagHandler(_QuietHandler):
+    """Serves files with an ETag and answers If-None-Match with 304; fails every request while state['fail'] is set."""
+    state = None
+
+    def do_GET(self):
+        self.state['requests'].append((self.path, self.headers.get('If-None-Match')))
+        if self.state['fail']:
+            self.send_error(403) # As an expired presigned link does
+            return
+        try:
+            with open(self.translate_path(self.path), 'rb') as f:
+                body = f.read()
+        except OSError:
+            self.send_error(404)
+            return
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def etag_server(tmp_path):
+    """(directory, base URL, state) of a local server standing in for the image store."""
+    state = {'fail': False, 'requests': []}
+    handler = type('Handler', (_ETagHandler,), {'state': state})
+    directory = tmp_path / 'served'
+    directory.mkdir()
+    with serve_directory(directory, handler) as url:
+        yield directory, url, state
+
+
+def _fetcher(tmp_path, **options):
+    return ImageFetcher(cache_dir=str(tmp_path / 'cache'), **options)
+
+
+def test_presigned_links_share_one_cache_entry(tmp_path, etag_server):
+    directory, url, state = etag_server
+    (directory / 'photo.jpg').write_bytes(b'photo')
+    fetcher = _fetcher(tmp_path)
+    assert fetcher.fetch(url + 'photo.jpg?X-Amz-Signature=aaa&X-Amz-Expires=3600&v=2') == b'photo'
+    assert fetcher.fetch(url + 'photo.jpg?v=2&X-Amz-Signature=bbb&X-Amz-Date=20260101T000000Z') == b'photo'
+    assert len(state['requests']) == 1
+    assert (fetcher.misses, fetcher.hits) == (1, 1)
+    assert fetcher.fetch(url + 'photo.jpg?v=3') == b'photo' # Other query parameters still identify the object
+    assert len(state['requests']) == 2
+
+
+def test_stale_entries_are_revalidated_with_their_etag(tmp_path, etag_server):
+    directory, url, state = etag_server
+    (directory / 'photo.jpg').write_bytes(b'first')
+    fetcher = _fetcher(tmp_path, revalidate_after=0)
+    assert fetcher.fetch(url + 'photo.jpg') == b'first'
+    assert fetcher.fetch(url + 'photo.jpg') == b'first'
+    assert state['requests'][1][1] is not None # If-None-Match sent
+    assert fetcher.revalidated == 1
+
+    (directory / 'photo.jpg').write_bytes(b'second')
+    assert fetcher.fetch(url + 'photo.jpg') == b'second'
+    assert fetcher.content_digest(url + 'photo.jpg') == hashlib.sha256(b'second').hexdigest()
+
+
+def test_cached_copy_is_served_when_revalidation_fails(tmp_path, etag_server):
+    directory, url, state = etag_server
+    (directory / 'photo.jpg').write_bytes(b'photo')
+    fetcher = _fetcher(tmp_path, revalidate_after=0)
+    fetcher.fetch(url + 'photo.jpg')
+    state['fail'] = True
+    assert fetcher.fetch(url + 'photo.jpg') == b'photo'
+    assert fetcher.stale_served == 1
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch(url + 'other.jpg') # Nothing cached to fall back on
+
+
+def test_eviction_removes_least_recently_used_blobs_and_their_entries(tmp_path, etag_server):
+    directory, url, state = etag_server
+    names = ['a.jpg', 'b.jpg', 'c.jpg']
+    for name in names:
+        (directory / name).write_bytes(os.urandom(1000))
+    fetcher = _fetcher(tmp_path, max_cache_bytes=2500)
+    digests = {}
+    for age, name in zip((300, 200), names):
+        fetcher.fetch(url + name)
+        digests[name] = fetcher.content_digest(url + name)
+        os.utime(fetcher._object_path(digests[name]), (0, os.path.getmtime(fetcher._object_path(digests[name])) - age))
+    fetcher.fetch(url + 'c.jpg') # 3000 bytes: over the limit
+
+    assert not os.path.exists(fetcher._object_path(digests['a.jpg']))
+    assert fetcher._read_entry(url_cache_key(url + 'a.jpg')) is None
+    assert fetcher._read_entry(url_cache_key(url + 'b.jpg')) is not None
+    assert fetcher._cache_bytes <= 2500 * EVICT_TO_FRACTION
+    requests_before = len(state['requests'])
+    assert fetcher.fetch(url + 'b.jpg') == (directory / 'b.jpg').read_bytes()
+    assert len(state['requests']) == requests_before # Still cached
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from layers import is_language_dependent, language_output_path, parse_languages, split_static_prefix
+import generate_thumbnail
+import generate_thumbnial_skia
+
+FONTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'fonts')
+LANGUAGES = ['en-IN', 'hi-IN']
+
+
+def _shape(y, fill):
+    return {"type": "shape", "box": {"x_px": 10, "y_px": y, "width_px": 180, "height_px": 60, "rotation": 10},
+            "content": {"shapeType": "ShapeType.rectangle", "fillColor": fill}, "style": {"opacity": 1}, "z_index": 0, "tag": "TemplateElementTag.defaulty"}
+
+
+def _text(y):
+    return {"type": "text", "box": {"x_px": 10, "y_px": y, "width_px": 180, "height_px": 60, "rotation": 0, "alignment": "center"},
+            "content": {"en-IN": {"text": "Hello there"}, "hi-IN": {"text": "नमस्ते दोस्तों"}},
+            "style": {"color": "#202020", "opacity": 1, "font_size": 5, "font_family": "English", "font_weight": "FontWeight.w400"},
+            "z_index": 0, "tag": "TemplateElementTag.heading"}
+
+
+TEMPLATE = {
+    "original_width": 200, "original_height": 200, "base_image_url": None,
+    "content_json": [_shape(10, "#3366ccff"), _text(50), _shape(70, "#ff336699"), _text(130)],
+    "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}},
+}
+
+
+def test_static_prefix_stops_at_the_first_localized_element():
+    nested_text = dict(_shape(0, "#000000ff"), nested_content={"content": _text(0)})
+    assert is_language_dependent(_text(0)) and is_language_dependent(nested_text)
+    assert not is_language_dependent(_shape(0, "#000000ff"))
+    elements = TEMPLATE['content_json']
+    assert split_static_prefix(elements, is_language_dependent) == (elements[:1], elements[1:])
+    assert split_static_prefix(elements[:1], is_language_dependent) == (elements[:1], [])
+
+
+def test_language_paths():
+    assert language_output_path('out_{lang}.png', 'hi-IN') == 'out_hi-IN.png'
+    assert language_output_path('out/poster.jpg', 'hi-IN') == 'out/poster_hi-IN.jpg'
+    assert parse_languages(' hi-IN, en-IN,,mr-IN ') == ['hi-IN', 'en-IN', 'mr-IN']
+
+
+@pytest.mark.parametrize('render, to_bytes', [
+    (generate_thumbnial_skia.render_languages_skia, lambda image: generate_thumbnial_skia.skia_image_to_pil(image).tobytes()),
+    (generate_thumbnail.render_languages, lambda image: image.tobytes()),
+])
+def test_shared_layers_match_rendering_each_language_alone(render, to_bytes):
+    together = {lang: to_bytes(image) for lang, image in render(TEMPLATE, LANGUAGES, FONTS, static_split='none')}
+    assert list(together) == LANGUAGES
+    assert together['en-IN'] != together['hi-IN']
+    for lang in LANGUAGES:
+        [(_lang, alone)] = render(TEMPLATE, [lang], FONTS, static_split='none')
+        assert to_bytes(alone) == together[lang]
@@ -0,0 +1,38 @@
+import io
+import json
+
+from mail_merge import MailMerge, iter_jsonl_records, write_merge
+
+TEMPLATE = {
+    "original_width": 200, "original_height": 200, "base_image_url": None,
+    "content_json": [{"type": "text", "box": {"x_px": 10, "y_px": 80, "width_px": 180, "height_px": 40, "rotation": 0},
+                      "content": {"en-IN": {"text": "Name"}}, "style": {"opacity": 1, "color": "#000000", "font_size": 5},
+                      "z_index": 0, "tag": "TemplateElementTag.userName"}],
+    "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}},
+}
+
+
+def _text(template, lang):
+    [node] = template.nodes
+    return node.text_for(lang, 'en-IN')
+
+
+def test_record_fields_bind_to_tags_per_language():
+    merge = MailMerge(TEMPLATE, ['en-IN', 'hi-IN'])
+    record = {'id': '7', 'userName': 'Ravi', 'TemplateElementTag.userName.hi-IN': 'रवि', 'unknown': 'x'}
+    assert merge.bindings(record) == {'userName': {None: 'Ravi', 'hi-IN': 'रवि'}}
+    bound = merge.bind(record)
+    assert (_text(bound, 'en-IN'), _text(bound, 'hi-IN')) == ('Ravi', 'रवि')
+    assert _text(merge.bind({'userName': ''}), 'en-IN') == 'Name' # Empty values keep the template's content
+    assert bound.bound_tags == frozenset({'userName'})
+
+
+def test_bad_records_fail_alone_and_the_batch_continues(tmp_path):
+    lines = [json.dumps({'id': 'a', 'userName': 'Asha'}), '{"id": "broken",', '[1, 2]', json.dumps({'id': 'b', 'userName': 'Bina'})]
+    records = iter_jsonl_records(io.StringIO("\n".join(lines) + "\n"))
+    merge = MailMerge(TEMPLATE, ['en-IN'])
+    entries = list(write_merge(merge, records, str(tmp_path / '{id}.png')))
+    assert [(entry['id'], entry['index'], entry['ok']) for entry in entries] == [('a', 1, True), (2, 2, False), (3, 3, False), ('b', 4, True)]
+    assert entries[1]['error'].startswith('JSONDecodeError')
+    assert entries[2]['error'] == 'TypeError: Record must be an object, not list'
+    assert (tmp_path / 'b.png').exists()
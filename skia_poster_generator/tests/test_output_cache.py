@@ -0,0 +1,26 @@
+import os
+
+from output_cache import EVICT_TO_FRACTION, OutputCache
+
+ENTRY_BYTES = 100
+MAX_BYTES = 100 * ENTRY_BYTES
+
+
+def test_full_cache_evicts_down_to_the_low_water_mark(tmp_path):
+    cache = OutputCache(str(tmp_path), MAX_BYTES)
+    scans = []
+    evict_if_needed = cache._evict_if_needed
+    cache._evict_if_needed = lambda: scans.append(1) or evict_if_needed()
+    fingerprints = [f"{i:064x}" for i in range(111)]
+    for age, fingerprint in enumerate(fingerprints[:100]):
+        cache.put(fingerprint, os.urandom(ENTRY_BYTES), 'png')
+        mtime = 1_000_000 + age # Oldest first
+        os.utime(cache._object_path(fingerprint), (mtime, mtime))
+    assert len(scans) == 1 # Sized once, then tracked in memory
+
+    for fingerprint in fingerprints[100:]:
+        cache.put(fingerprint, os.urandom(ENTRY_BYTES), 'png')
+    assert len(scans) == 2 # The first store past the limit frees room for the next ones
+    evicted = fingerprints[:101 - int(MAX_BYTES * EVICT_TO_FRACTION) // ENTRY_BYTES] # Oldest, down to 90%
+    assert all(cache.get(fingerprint) is None and cache._read_entry(fingerprint) is None for fingerprint in evicted)
+    assert all(cache.get(fingerprint) is not None for fingerprint in fingerprints[len(evicted):])
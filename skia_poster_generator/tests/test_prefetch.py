@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from prefetch import collect_image_urls, prefetch_images, resolve_image
+
+
+def _image(url):
+    return {"type": "image", "content": {"url": url}}
+
+
+def test_collects_nested_and_leader_urls_once_in_first_use_order():
+    json_data = {"base_image_url": "base.jpg", "content_json": [
+        _image("a.png"),
+        {"type": "leader_strip", "content": {"leaders": [_image("b.png"), {"content": {}}, _image("a.png")]}},
+        {"type": "text", "content": {}, "nested_content": {"content": _image("c.png")}},
+    ]}
+    assert collect_image_urls(json_data) == ["base.jpg", "a.png", "b.png", "c.png"]
+    assert collect_image_urls(json_data, include_base_image=False, elements=[_image("c.png")]) == ["c.png"]
+
+
+def test_images_are_fetched_and_decoded_concurrently(fixture_server):
+    directory, url = fixture_server
+    names = ['one.bin', 'two.bin', 'three.bin']
+    for name in names:
+        (directory / name).write_bytes(name.encode())
+    decoding = threading.Barrier(len(names), timeout=5) # Only passes once every decode runs at the same time
+
+    def decode(data):
+        decoding.wait()
+        return data.decode()
+
+    assets = prefetch_images([url + name for name in names], decode, max_workers=len(names))
+    assert assets == {url + name: name for name in names}
+
+
+def test_failures_are_recorded_and_raised_at_draw_time(fixture_server):
+    directory, url = fixture_server
+    (directory / 'ok.bin').write_bytes(b'ok')
+    assets = prefetch_images([url + 'ok.bin', url + 'missing.bin'], bytes.decode)
+    assert resolve_image(assets, url + 'ok.bin', bytes.decode) == 'ok'
+    assert isinstance(assets[url + 'missing.bin'], Exception)
+    with pytest.raises(type(assets[url + 'missing.bin'])):
+        resolve_image(assets, url + 'missing.bin', bytes.decode)
+    assert resolve_image({}, url + 'ok.bin', bytes.decode) == 'ok' # Not prefetched: fetched on demand
@@ -0,0 +1,56 @@
+from io import BytesIO
+
+from PIL import Image
+
+from display_list import compile_template
+from reduced_decode import DecodeHint, drawn_scale, image_decode_hints, reduction_factor
+import generate_thumbnail
+import generate_thumbnial_skia
+
+
+def _jpeg(width, height):
+    buffer = BytesIO()
+    Image.radial_gradient('L').resize((width, height)).convert('RGB').save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def _hint(*boxes):
+    hint = DecodeHint()
+    for box in boxes:
+        hint.add(*box)
+    return hint
+
+
+def test_decode_size_follows_the_largest_drawn_box():
+    assert drawn_scale(4000, 2000, 400, 400, 'BoxFit.cover') == 0.2
+    assert drawn_scale(4000, 2000, 400, 400, 'BoxFit.contain') == 0.1
+    assert _hint((400, 400, 'BoxFit.contain')).decode_size(4000, 2000) == (800, 400)
+    assert _hint((400, 400, 'BoxFit.contain'), (400, 400, 'BoxFit.cover')).decode_size(4000, 2000) == (1600, 800)
+    assert _hint((3000, 3000, 'BoxFit.cover')).decode_size(4000, 2000) is None # Drawn near full size
+    assert DecodeHint().decode_size(4000, 2000) is None
+    assert reduction_factor(4000, 2000, (800, 400)) == 5
+    assert reduction_factor(4000, 2000, (3000, 1500)) == 1
+
+
+def test_hints_cover_nested_images_at_output_scale():
+    nested = {"type": "image", "box": {"x_percent": 0, "y_percent": 0, "width_percent": 50, "height_percent": 100, "rotation": 0},
+              "content": {"url": "photo.jpg"}, "style": {"imageFit": "BoxFit.fill"}}
+    template = compile_template({"original_width": 1000, "original_height": 1000, "content_json": [
+        {"type": "shape", "box": {"x_px": 0, "y_px": 0, "width_px": 400, "height_px": 200, "rotation": 0},
+         "content": {}, "nested_content": {"content": nested}},
+    ]})
+    hints = image_decode_hints(template.nodes, 'base.jpg', 250, 250, render_scale=0.25)
+    assert hints['base.jpg'].boxes == [(250.0, 250.0, 'BoxFit.cover')]
+    assert hints['photo.jpg'].boxes == [(50.0, 50.0, 'BoxFit.fill')]
+
+
+def test_oversized_jpeg_is_decoded_reduced():
+    data = _jpeg(2400, 1600)
+    hint = _hint((200, 200, 'BoxFit.contain'))
+    width, height = hint.decode_size(2400, 1600)
+    pil_image = generate_thumbnail.decode_pil_image(data, hint)
+    skia_image = generate_thumbnial_skia.decode_skia_image(data, hint)
+    for size in (pil_image.size, (skia_image.width(), skia_image.height())):
+        assert width <= size[0] < 2 * width and height <= size[1] < 2 * height
+    assert generate_thumbnail.decode_pil_image(data).size == (2400, 1600)
+    assert generate_thumbnial_skia.decode_skia_image(data).width() == 2400
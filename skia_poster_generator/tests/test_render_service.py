@@ -0,0 +1,92 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from batch_render import init_worker_process
+from render_service import RenderService, handle_request
+
+TEMPLATE = {
+    "original_width": 200, "original_height": 200, "base_image_url": None,
+    "content_json": [{"type": "shape", "box": {"x_px": 20, "y_px": 20, "width_px": 160, "height_px": 160, "rotation": 0},
+                      "content": {"shapeType": "ShapeType.rectangle", "fillColor": "#ff336699"},
+                      "style": {"opacity": 1}, "z_index": 0, "tag": "TemplateElementTag.defaulty"}],
+    "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}},
+}
+
+
+def _executor_factory():
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_worker_process, initargs=('./assets/fonts', True, None))
+
+
+def _kill_workers(service):
+    for pid in list(service.executor._processes):
+        os.kill(pid, signal.SIGKILL)
+
+
+async def _with_service(check):
+    io_executor = ThreadPoolExecutor(max_workers=2)
+    service = RenderService(_executor_factory, io_executor, './assets/fonts', 1)
+    dispatchers = service.start()
+    try:
+        await check(service)
+    finally:
+        for dispatcher in dispatchers:
+            dispatcher.cancel()
+        service.executor.shutdown(wait=False, cancel_futures=True)
+        io_executor.shutdown(wait=False)
+
+
+def _job(**options):
+    return {'template': TEMPLATE, 'lang': 'en-IN', 'format': 'png', **options}
+
+
+def test_pool_is_replaced_after_an_idle_worker_dies():
+    async def check(service):
+        await service.render(_job())
+        _kill_workers(service)
+        await asyncio.sleep(0.5) # Let the pool notice; a render submitted before it does is retried instead
+        status, _headers, body = await handle_request(service, 'GET', '/healthz', b'')
+        assert (status, body) == (200, b'ok')
+        encoded_bytes, chosen_format, _elapsed_ms, _coalesced = await service.render(_job(scale=0.5))
+        assert chosen_format == 'png' and encoded_bytes.startswith(b'\x89PNG')
+        assert service.counters['pool_restarts'] == 1
+
+    asyncio.run(_with_service(check))
+
+
+def test_render_running_when_its_worker_dies_is_retried():
+    async def check(service):
+        await service.render(_job()) # Start the worker process
+        render = asyncio.create_task(service.render(_job(scale=0.75)))
+        while not service.running:
+            await asyncio.sleep(0.001)
+        _kill_workers(service)
+        encoded_bytes, _format, _elapsed_ms, _coalesced = await render
+        assert encoded_bytes.startswith(b'\x89PNG')
+        assert service.counters['retried'] == 1 and service.counters['failed'] == 0
+
+    asyncio.run(_with_service(check))
+
+
+def test_healthz_reports_a_pool_that_cannot_be_replaced():
+    async def check(service):
+        await service.render(_job())
+
+        def failing_factory():
+            raise OSError("cannot spawn")
+        service.executor_factory = failing_factory
+        _kill_workers(service)
+        await asyncio.sleep(0.5)
+        with pytest.raises(BrokenProcessPool, match='cannot spawn'):
+            await service.render(_job(scale=0.5))
+        status, _headers, body = await handle_request(service, 'GET', '/healthz', b'')
+        assert status == 503 and b'cannot spawn' in body
+
+    asyncio.run(_with_service(check))
+
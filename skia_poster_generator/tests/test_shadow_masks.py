@@ -0,0 +1,74 @@
+import numpy as np
+import skia
+from PIL import Image
+
+import generate_thumbnial_skia
+from shadow_masks import SHADOW_MASKS, SUBPIXEL_STEPS, ShadowMaskCache, draw_cached_shadow
+
+SIZE = 400
+SCALE = 0.37 # Fractional: shadow edges fall between device pixels
+
+
+def _shadow_pixels(draw):
+    surface = skia.Surface(SIZE, SIZE)
+    canvas = surface.getCanvas()
+    canvas.clear(skia.ColorWHITE)
+    canvas.scale(SCALE, SCALE)
+    draw(canvas)
+    return np.array(surface.makeImageSnapshot().toarray(), dtype=int)
+
+
+def _cached(shape, rect, sigma, cache):
+    return lambda canvas: draw_cached_shadow(canvas, shape, rect.x(), rect.y(), rect.width(), rect.height(), sigma, skia.ColorBLACK, cache=cache)
+
+
+def _snapped(rect):
+    """rect moved to where the cache draws its shadow: the device origin snapped to the subpixel grid."""
+    snap = lambda value: round(value * SCALE * SUBPIXEL_STEPS) / SUBPIXEL_STEPS / SCALE
+    return skia.Rect.MakeXYWH(snap(rect.x()), snap(rect.y()), rect.width(), rect.height())
+
+
+def _direct(shape, rect, sigma):
+    def draw(canvas):
+        paint = skia.Paint(AntiAlias=True, Color=skia.ColorBLACK)
+        paint.setMaskFilter(skia.MaskFilter.MakeBlur(skia.kNormal_BlurStyle, sigma, True))
+        canvas.drawOval(rect, paint) if shape == 'oval' else canvas.drawRect(rect, paint)
+    return draw
+
+
+def test_mask_matches_direct_blur_at_fractional_scale():
+    for shape in ('rect', 'oval'):
+        for rect, sigma in ((skia.Rect.MakeXYWH(100, 120, 300, 200), 10), (skia.Rect.MakeXYWH(33.3, 47.9, 210.5, 90.25), 4)):
+            cached = _shadow_pixels(_cached(shape, rect, sigma, ShadowMaskCache()))
+            assert np.abs(cached - _shadow_pixels(_direct(shape, _snapped(rect), sigma))).max() <= 1, (shape, rect, sigma)
+
+
+def test_nearby_subpixel_origins_share_a_mask():
+    cache = ShadowMaskCache()
+    for x in (100.0, 100.01, 100.0 + 3 / SCALE): # Within 1/128 device px, then whole device pixels away
+        _shadow_pixels(_cached('oval', skia.Rect.MakeXYWH(x, 120, 300, 200), 10, cache))
+    assert (cache.misses, cache.hits) == (1, 2)
+
+
+def _shadow_card(fill, shape_type, blur):
+    return {"type": "shape", "box": {"x_px": 61.3, "y_px": 83.7, "width_px": 250, "height_px": 180, "rotation": 0},
+            "content": {"fillColor": fill, "shapeType": shape_type, "strokeColor": "#00000000", "strokeWidth": 0},
+            "style": {"opacity": 1, "box_shadow": {"color": "#00000080", "offsetX": 6, "offsetY": 6, "blurRadius": blur, "spreadRadius": 0}},
+            "z_index": 0, "tag": "TemplateElementTag.defaulty"}
+
+
+def test_poster_does_not_depend_on_cached_masks(fixture_server):
+    directory, url = fixture_server
+    Image.new('RGB', (1080, 1080), 'white').save(directory / 'base.jpg')
+    json_data = {"original_width": 1080, "original_height": 1080, "base_image_url": url + 'base.jpg',
+                 "content_json": [_shadow_card("#F5C518", 'ShapeType.rectangle', 12), _shadow_card("#2E86AB", 'ShapeType.circle', 60)],
+                 "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}}}
+
+    def render():
+        [(_lang, image)] = generate_thumbnial_skia.render_languages_skia(json_data, ['en-IN'], scale=SCALE, static_split='none')
+        return image.tobytes()
+
+    SHADOW_MASKS.clear()
+    cold = render()
+    assert SHADOW_MASKS.stats()['entries'] >= 2
+    assert render() == cold
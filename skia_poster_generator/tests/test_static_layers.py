@@ -0,0 +1,68 @@
+import os
+import time
+
+import skia
+from PIL import Image
+
+import generate_thumbnail
+import generate_thumbnial_skia
+from font_cache import SizedLRUCache
+from image_fetch import get_image_fetcher, url_cache_key
+from static_layers import background_nbytes
+
+SIZE = 200
+
+
+def _template(image_url):
+    return {"original_width": SIZE, "original_height": SIZE, "base_image_url": image_url,
+            "content_json": [{"type": "shape", "box": {"x_px": 20, "y_px": 20, "width_px": 60, "height_px": 60, "rotation": 0},
+                              "content": {"shapeType": "ShapeType.rectangle", "fillColor": "#ffffff"},
+                              "style": {"opacity": 1}, "z_index": 0, "tag": "TemplateElementTag.defaulty"}],
+            "language_settings": {"current_language": "en-IN", "default_language": {"code": "en-IN"}}}
+
+
+def _write_image(path, color, mtime):
+    Image.new('RGB', (SIZE, SIZE), color).save(path)
+    os.utime(path, (mtime, mtime)) # Last-Modified changes, so revalidation fetches the new body
+
+
+def _expire_cache_entry(url):
+    fetcher = get_image_fetcher()
+    key = url_cache_key(url)
+    entry = fetcher._read_entry(key)
+    entry['fetched_at'] = 0
+    fetcher._write_entry(key, entry)
+
+
+def _render_skia(json_data):
+    [(_lang, image)] = generate_thumbnial_skia.render_languages_skia(json_data, ['en-IN'])
+    return generate_thumbnial_skia.skia_image_to_pil(image)
+
+
+def _render_pil(json_data):
+    [(_lang, image)] = generate_thumbnail.render_languages(json_data, ['en-IN'])
+    return image
+
+
+def test_static_background_follows_image_content(fixture_server):
+    directory, url = fixture_server
+    now = time.time()
+    for name, render in (('skia.png', _render_skia), ('pil.png', _render_pil)):
+        json_data = _template(url + name)
+        corner_pixel = lambda: render(json_data).convert('RGB').getpixel((SIZE - 1, SIZE - 1))
+        _write_image(directory / name, 'red', now - 100)
+        assert corner_pixel() == (255, 0, 0)
+        assert corner_pixel() == (255, 0, 0) # From the cached background
+
+        _write_image(directory / name, 'blue', now) # Same URL, new photo
+        _expire_cache_entry(url + name)
+        assert corner_pixel() == (0, 0, 255)
+
+
+def test_backgrounds_are_bounded_by_pixel_bytes():
+    assert background_nbytes(Image.new('RGBA', (40, 30))) == background_nbytes(skia.Surface(40, 30).makeImageSnapshot()) == 40 * 30 * 4
+    cache = SizedLRUCache(2 * 40 * 30 * 4, background_nbytes, 16)
+    for key in 'abc':
+        cache.put(key, Image.new('RGBA', (40, 30)))
+    assert 'a' not in cache and 'c' in cache
+    assert cache.stats()['bytes'] == 2 * 40 * 30 * 4
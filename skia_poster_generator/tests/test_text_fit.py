@@ -0,0 +1,38 @@
+import os
+
+from font_cache import FontRegistry
+from text_fit import TextMeasurer
+
+FONT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'fonts', 'English.ttf')
+LINES = ["Grand Opening Sale", "Everything must go"]
+
+
+def _linear_fit(measurer, lines, max_size, max_width):
+    # The one-pixel-at-a-time loop the binary search replaced
+    size = max_size
+    while size > 1 and not measurer.fits(lines, FONT, size, max_width):
+        size -= 1
+    return size
+
+
+def test_binary_search_matches_the_linear_fit():
+    measurer = TextMeasurer(FontRegistry())
+    for max_width in (5, 60, 123, 250, 400, 2000):
+        assert measurer.fit_font_size(LINES, FONT, 90, max_width) == _linear_fit(measurer, LINES, 90, max_width)
+
+
+def test_fit_bounds():
+    measurer = TextMeasurer(FontRegistry())
+    assert measurer.fit_font_size(LINES, FONT, 40, 10_000) == 40 # Fits at the start size
+    assert measurer.fit_font_size(LINES, FONT, 40, 1) == 1 # Nothing fits: the minimum size
+    assert measurer.fit_font_size([], FONT, 40, 1) == 40
+
+
+def test_measurements_are_memoized():
+    measurer = TextMeasurer(FontRegistry())
+    width = measurer.width(LINES[0], FONT, 30)
+    assert width == measurer.font(FONT, 30).getlength(LINES[0])
+    assert measurer.width(LINES[0], FONT, 30) == width
+    assert measurer.bbox(LINES[0], FONT, 30) == measurer.font(FONT, 30).getbbox(LINES[0])
+    stats = measurer.measurements.stats()
+    assert (stats['misses'], stats['hits']) == (2, 1)
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+import skia
+
+from font_cache import FontRegistry
+from text_wrap import WordWidths, WordWrapper
+
+FONTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'fonts')
+TEXT = {
+    'English.ttf': "The quick brown fox jumps over the lazy dog.\nPack my box with five dozen liquor jugs, then  wrap   it again.",
+    'Lohit-Devanagari.ttf': "नमस्ते दोस्तों, आज हम सब मिलकर नए भारत का निर्माण करेंगे\nविकास की राह पर",
+}
+
+
+def _prefix_wrap(text, font, max_width):
+    # The prefix-measuring wrap the word tables replaced
+    lines = []
+    for paragraph in text.split('\n'):
+        current_line = ''
+        for word in paragraph.split():
+            test_line = current_line + (' ' if current_line else '') + word
+            if font.measureText(test_line) <= max_width:
+                current_line = test_line
+            else:
+                if current_line:
+                    lines.append(current_line)
+                current_line = word
+        if current_line:
+            lines.append(current_line)
+    return lines
+
+
+@pytest.mark.parametrize('font_file', sorted(TEXT))
+@pytest.mark.parametrize('max_width', [1, 80, 150, 333, 10_000])
+def test_wrap_matches_prefix_measuring(font_file, max_width):
+    font = FontRegistry().get_skia_font(os.path.join(FONTS, font_file), 24)
+    lines = WordWrapper().wrap(TEXT[font_file], font, max_width)
+    assert [line.text for line in lines] == _prefix_wrap(TEXT[font_file], font, max_width)
+    for line in lines:
+        assert line.width == pytest.approx(font.measureText(line.text), abs=1e-3)
+
+
+def test_word_widths_are_shared_per_font():
+    registry = FontRegistry()
+    wrapper = WordWrapper()
+    font = registry.get_skia_font(os.path.join(FONTS, 'English.ttf'), 24)
+    wrapper.wrap("one two three", font, 100)
+    wrapper.wrap("three two one", registry.get_skia_font(os.path.join(FONTS, 'English.ttf'), 24), 50)
+    assert (wrapper.stats()['misses'], wrapper.stats()['hits']) == (1, 1)
+    assert set(wrapper.word_widths(font).widths) == {'one', 'two', 'three'}
+    wrapper.wrap("one", registry.get_skia_font(os.path.join(FONTS, 'English.ttf'), 30), 100)
+    assert wrapper.stats()['misses'] == 2
+
+
+def test_full_word_table_still_measures():
+    font = skia.Font(None, 20)
+    widths = WordWidths(font, max_words=1)
+    assert widths.width('alpha') == font.measureText('alpha')
+    assert widths.width('beta') == font.measureText('beta')
+    assert list(widths.widths) == ['alpha']
@@ -0,0 +1,73 @@
+from font_cache import FONT_REGISTRY, LRUCache
+
+# --- Pillow Text Fitting ---
+# Measurements are memoized per (text, font, size) so the auto-fit search and
+# the later layout/centering pass share them, across elements and posters.
+
+DEFAULT_MAX_MEASUREMENTS = 8192
+
+
+class TextMeasurer:
+    """Memoizing width/bbox measurer for Pillow fonts resolved through the font registry.
+
+    A font_path of None stands for ImageFont.load_default().
+    """
+
+    def __init__(self, font_registry=FONT_REGISTRY, max_entries=DEFAULT_MAX_MEASUREMENTS):
+        self.font_registry = font_registry
+        self.measurements = LRUCache(max_entries)
+        self._default_font = None
+
+    def font(self, font_path, size):
+        if font_path is None:
+            if self._default_font is None:
+                from PIL import ImageFont
+                self._default_font = ImageFont.load_default()
+            return self._default_font
+        return self.font_registry.get_pil_font(font_path, size)
+
+    def width(self, text, font_path, size):
+        """Advance width of text, as ImageDraw.textlength reports it."""
+        return self.measurements.get(
+            ("w", text, font_path, size),
+            lambda: self.font(font_path, size).getlength(text),
+        )
+
+    def bbox(self, text, font_path, size):
+        """(x1, y1, x2, y2) of text relative to the anchor, as font.getbbox reports it."""
+        return self.measurements.get(
+            ("bbox", text, font_path, size),
+            lambda: self.font(font_path, size).getbbox(text),
+        )
+
+    def widths(self, lines, font_path, size):
+        return [self.width(line, font_path, size) for line in lines]
+
+    def fits(self, lines, font_path, size, max_width):
+        return all(w <= max_width for w in self.widths(lines, font_path, size))
+
+    def fit_font_size(self, lines, font_path, max_size, max_width, min_size=1):
+        """Largest integer size in [min_size, max_size] at which every line fits max_width.
+
+        Uses a binary search, so a long headline costs O(log max_size) measurement
+        passes. Falls back to min_size when nothing fits, matching the old
+        one-pixel-at-a-time loop which stopped at 1px.
+        """
+        max_size = max(min_size, int(max_size))
+        if not lines or self.fits(lines, font_path, max_size, max_width):
+            return max_size
+
+        lo, hi = min_size, max_size - 1 # Invariant: max_size does not fit
+        best = min_size
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if self.fits(lines, font_path, mid, max_width):
+                best = mid
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return best
+
+
+# Shared by every render in this process.
+TEXT_MEASURER = TextMeasurer()
@@ -0,0 +1,87 @@
+from font_cache import LRUCache
+
+# --- Skia Word Wrap ---
+# Greedy line breaking for the Skia text path. Each distinct word (and the
+# space) is measured once per (typeface, size) and line widths are accumulated
+# from those advances, so wrapping a paragraph is linear in its words instead
+# of re-measuring every growing line prefix. Skia's measureText sums glyph
+# advances without kerning, so the accumulated widths equal measuring the
+# joined line. Word widths are kept per font across elements, languages and
+# posters; the resulting line boxes carry their width for alignment.
+
+DEFAULT_MAX_WIDTH_TABLES = 256
+DEFAULT_MAX_WORDS_PER_TABLE = 16384
+
+
+class LineBox:
+    """One wrapped line: its text and advance width in the wrapping font."""
+    __slots__ = ('text', 'width')
+
+    def __init__(self, text, width):
+        self.text = text
+        self.width = width
+
+
+class WordWidths:
+    """Memoized advance widths of words for one skia.Font (typeface and size)."""
+
+    def __init__(self, font, max_words=DEFAULT_MAX_WORDS_PER_TABLE):
+        self.font = font
+        self.max_words = max_words
+        self.widths = {}
+        self.space = font.measureText(' ')
+
+    def width(self, word):
+        width = self.widths.get(word)
+        if width is None:
+            width = self.font.measureText(word)
+            if len(self.widths) < self.max_words: # A full table keeps serving hits, new words are measured directly
+                self.widths[word] = width
+        return width
+
+
+class WordWrapper:
+    """Wraps text into LineBoxes, sharing word widths per (typeface, size, subpixel)."""
+
+    def __init__(self, max_tables=DEFAULT_MAX_WIDTH_TABLES):
+        self.tables = LRUCache(max_tables)
+
+    def word_widths(self, font):
+        key = (font.getTypeface().uniqueID(), font.getSize(), font.isSubpixel())
+        return self.tables.get(key, lambda: WordWidths(font))
+
+    def wrap_paragraph(self, text, font, max_width):
+        """Greedy-wraps one paragraph at spaces; a word wider than max_width gets a line of its own."""
+        widths = self.word_widths(font)
+        space = widths.space
+        lines = []
+        line_words, line_width = [], 0.0
+        for word in text.split():
+            word_width = widths.width(word)
+            if line_words and line_width + space + word_width <= max_width:
+                line_words.append(word)
+                line_width += space + word_width
+            else:
+                if line_words:
+                    lines.append(LineBox(' '.join(line_words), line_width))
+                line_words, line_width = [word], word_width
+        if line_words:
+            lines.append(LineBox(' '.join(line_words), line_width))
+        return lines
+
+    def wrap(self, text, font, max_width):
+        """LineBoxes for text wrapped to max_width, paragraph by paragraph ('\\n' separated)."""
+        lines = []
+        for paragraph in text.split('\n'):
+            lines.extend(self.wrap_paragraph(paragraph, font, max_width))
+        return lines
+
+    def clear(self):
+        self.tables.clear()
+
+    def stats(self):
+        return self.tables.stats()
+
+
+# Shared by every render in this process.
+WORD_WRAPPER = WordWrapper()
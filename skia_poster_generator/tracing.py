@@ -0,0 +1,248 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+from image_fetch import canonical_url
+
+# --- Tracing ---
+# Structured timing spans for both renderers, replacing per-element print
+# logging. A span records one phase of work and the element it belongs to:
+#   fetch, decode          per image URL (presign parameters stripped)
+#   font_load              per font file and size actually parsed (cache misses)
+#   layout                 text wrapping, fitting and measurement
+#   raster                 drawing one element (nested content nests inside)
+#   composite              blending layers and copying shared backgrounds
+#   encode                 encoding the output image
+#   cull, prefetch, static_background, draw   per render / language
+# Levels: 'off' (default; spans are a shared no-op object), 'render' (per-render
+# phases), 'element' (plus per-element and per-image spans) and 'debug' (plus
+# instant events with layout details). Events are written as JSON lines or as
+# a Chrome trace (load in chrome://tracing or Perfetto) as soon as they end.
+#
+# Configure with configure_tracing(), the --trace/--trace-output CLI options or
+# the POSTER_TRACE / POSTER_TRACE_OUTPUT / POSTER_TRACE_FORMAT environment
+# variables. '{pid}' in the output path is replaced by the process id.
+
+TRACE_LEVELS = ('off', 'render', 'element', 'debug')
+OFF, RENDER, ELEMENT, DEBUG = range(len(TRACE_LEVELS))
+TRACE_FORMATS = ('jsonl', 'chrome')
+
+_level = OFF
+_sink = None
+_context = threading.local()
+
+
+class _NullSpan:
+    """Returned while a span's level is disabled; does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ('phase', 'args', 'wall_ns', 'started_ns')
+
+    def __init__(self, phase, args):
+        self.phase = phase
+        self.args = args
+
+    def __enter__(self):
+        self.wall_ns = time.time_ns()
+        self.started_ns = time.perf_counter_ns()
+        return self
+
+    def set(self, **args):
+        """Adds arguments known only once the work is done (e.g. a cache hit)."""
+        self.args.update(args)
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_us = (time.perf_counter_ns() - self.started_ns) / 1000
+        if exc_type is not None:
+            self.args['error'] = f"{exc_type.__name__}: {exc}"
+        _emit(self.phase, 'X', self.wall_ns // 1000, self.args, round(duration_us, 1))
+        return False
+
+
+def _short_tag(tag):
+    return tag.rsplit('.', 1)[-1] if tag else None
+
+
+def _emit(phase, event_type, timestamp_us, args, duration_us=None):
+    sink = _sink
+    if sink is None:
+        return
+    context = getattr(_context, 'args', None)
+    if context:
+        args = {**context, **args}
+    label = args.get('tag') or args.get('type')
+    event = {'name': f"{phase} {label}" if label else phase, 'cat': phase, 'ph': event_type, 'ts': timestamp_us,
+             'pid': os.getpid(), 'tid': threading.get_native_id(), 'args': args}
+    if duration_us is not None:
+        event['dur'] = duration_us
+    else:
+        event['s'] = 't' # Instant events are thread scoped
+    sink.write(event)
+
+
+def trace_enabled(level=RENDER):
+    return _level >= level
+
+
+def span(phase, level=RENDER, **args):
+    """Context manager timing one phase; a no-op unless level is enabled."""
+    if _level < level:
+        return NULL_SPAN
+    return Span(phase, args)
+
+
+def element_span(phase, node, level=ELEMENT, **args):
+    """A span attributed to a display-list node's tag and type."""
+    if _level < level:
+        return NULL_SPAN
+    return Span(phase, dict(args, tag=_short_tag(node.tag), type=node.kind))
+
+
+def url_span(phase, url, level=ELEMENT):
+    """A span for work on one image URL; the URL is recorded without presign parameters."""
+    if _level < level:
+        return NULL_SPAN
+    return Span(phase, {'url': canonical_url(url)})
+
+
+def trace_event(name, level=DEBUG, **args):
+    """Records an instant event (e.g. layout details) when level is enabled."""
+    if _level >= level:
+        _emit(name, 'i', time.time_ns() // 1000, args)
+
+
+class trace_context:
+    """Adds args (e.g. a job id or template path) to every event recorded on this thread inside the block."""
+
+    def __init__(self, **args):
+        self.args = args
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(_context, 'args', None)
+        _context.args = {**(self.previous or {}), **self.args}
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _context.args = self.previous
+        return False
+
+
+class _JsonLinesSink:
+    def __init__(self, stream, owns_stream):
+        self.stream = stream
+        self.owns_stream = owns_stream
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def write(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            self.stream.write(line)
+
+    def close(self):
+        with self.lock:
+            self.stream.flush()
+            if self.owns_stream:
+                self.stream.close()
+
+
+class _ChromeTraceSink(_JsonLinesSink):
+    """Chrome's JSON array trace format, streamed; a trace cut short by a crash still loads."""
+
+    def __init__(self, stream, owns_stream):
+        super().__init__(stream, owns_stream)
+        self.stream.write("[\n")
+        self.first = True
+
+    def write(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self.lock:
+            self.stream.write(line if self.first else ",\n" + line)
+            self.first = False
+
+    def close(self):
+        with self.lock:
+            self.stream.write("\n]\n")
+        super().close()
+
+
+def trace_format_from_path(path):
+    return 'chrome' if path and path.lower().endswith('.json') else 'jsonl'
+
+
+def configure_tracing(level='off', output=None, trace_format=None):
+    """Sets the trace level and where events go (a path, or stderr when None).
+
+    trace_format defaults to 'chrome' for *.json paths and 'jsonl' otherwise.
+    Any previous output is closed.
+    """
+    global _level, _sink
+    if level not in TRACE_LEVELS:
+        raise ValueError(f"Unknown trace level '{level}', expected one of {', '.join(TRACE_LEVELS)}")
+    close_tracing()
+    _level = TRACE_LEVELS.index(level)
+    if _level == OFF:
+        return
+    trace_format = trace_format or trace_format_from_path(output)
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f"Unknown trace format '{trace_format}', expected one of {', '.join(TRACE_FORMATS)}")
+    if output:
+        output = output.replace('{pid}', str(os.getpid()))
+        stream, owns_stream = open(output, 'w', encoding='utf-8'), True
+    else:
+        stream, owns_stream = sys.stderr, False
+    sink_type = _ChromeTraceSink if trace_format == 'chrome' else _JsonLinesSink
+    _sink = sink_type(stream, owns_stream)
+
+
+def process_trace_output(output):
+    """A per-process trace path for pool workers: '{pid}' is kept for configure_tracing, otherwise '_{pid}' is appended to the stem."""
+    if not output or '{pid}' in output:
+        return output
+    stem, extension = os.path.splitext(output)
+    return f"{stem}_{{pid}}{extension}"
+
+
+def close_tracing():
+    """Flushes and closes the trace output; tracing is off afterwards."""
+    global _level, _sink
+    sink, _sink, _level = _sink, None, OFF
+    if sink is not None and sink.pid == os.getpid(): # A forked child drops its parent's output untouched
+        sink.close()
+
+
+def add_trace_arguments(parser):
+    parser.add_argument('--trace', choices=TRACE_LEVELS, default=os.environ.get('POSTER_TRACE', 'off'),
+                        help="Timing trace detail: off, render (per-render phases), element (per element/image/font) or debug")
+    parser.add_argument('--trace-output', default=os.environ.get('POSTER_TRACE_OUTPUT'),
+                        help="Trace file ('{pid}' is replaced by the process id); default: JSON lines on stderr")
+    parser.add_argument('--trace-format', choices=TRACE_FORMATS, default=os.environ.get('POSTER_TRACE_FORMAT'),
+                        help="Trace file format (default: chrome for .json, jsonl otherwise)")
+
+
+def configure_tracing_from_args(args):
+    configure_tracing(args.trace, args.trace_output, args.trace_format)
+
+
+atexit.register(close_tracing)
+
+if os.environ.get('POSTER_TRACE', 'off') != 'off':
+    configure_tracing(os.environ['POSTER_TRACE'], os.environ.get('POSTER_TRACE_OUTPUT'), os.environ.get('POSTER_TRACE_FORMAT'))